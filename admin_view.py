@@ -13,6 +13,7 @@ from .backup_utils import (
     backup_database,
     read_last_backup_meta,
 )
+from .backup_incremental import es_manifiesto
 
 from .db import (
     obtener_configuracion_profesional,
@@ -30,7 +31,21 @@ from .db import (
     guardar_configuracion_gmail,
     obtener_configuracion_cie11,
     guardar_configuracion_cie11,
+    PERFIL_UMBRAL_MS_DEFAULT,
+    activar_perfilado_consultas,
+    perfilado_consultas_activo,
+    resumen_perfilado_consultas,
+    reiniciar_perfilado_consultas,
+    estadisticas_pool,
+    SYNCHRONOUS_VALIDOS,
+    ajustes_almacenamiento,
+    guardar_ajustes_almacenamiento,
+    estado_almacenamiento,
+    mantenimiento_almacenamiento,
+    comprimir_html_sesiones,
+    estadisticas_compresion_html,
 )
+from .compresion_utils import zstd_disponible
 
 BANCOS_CO = [
     "Bancolombia",
@@ -117,6 +132,21 @@ def build_timezone_options() -> list[ft.dropdown.Option]:
     return opciones
 
 
+# Preferencias de Diagnóstico (page.client_storage)
+K_PERFIL_ACTIVO = "diagnostico.perfil.enabled"
+K_PERFIL_UMBRAL_MS = "diagnostico.perfil.umbral_ms"
+
+
+def aplicar_preferencias_diagnostico(page: ft.Page) -> None:
+    """Al iniciar la app, reactiva el perfilado si se dejó encendido en Diagnóstico."""
+    try:
+        if page.client_storage.get(K_PERFIL_ACTIVO):
+            umbral = page.client_storage.get(K_PERFIL_UMBRAL_MS)
+            activar_perfilado_consultas(True, umbral_ms=float(umbral) if umbral else None)
+    except Exception as ex:
+        print("⚠️ No se pudieron aplicar las preferencias de diagnóstico:", ex)
+
+
 def build_admin_view(page: ft.Page) -> ft.Control:
     """Vista de administración / configuración."""
 
@@ -128,7 +158,7 @@ def build_admin_view(page: ft.Page) -> ft.Control:
     cfg_gmail = obtener_configuracion_gmail()
     cfg_cie11 = obtener_configuracion_cie11()
 
-    seccion_activa = {"value": "profesional"}  # "profesional" | "servicios" | "configuracion" | "backups"
+    seccion_activa = {"value": "profesional"}  # "profesional" | "servicios" | "configuracion" | "backups" | "basedatos" | "diagnostico"
 
     # -------- Formateo de teléfono mientras se escribe --------
 
@@ -1250,6 +1280,7 @@ def build_admin_view(page: ft.Page) -> ft.Control:
     K_BACKUP_NATIVE = "backup.native.enabled"
     K_BACKUP_INTERVAL = "backup.native.interval"
     K_BACKUP_KEEP_LAST = "backup.keep_last"
+    K_BACKUP_INCREMENTAL = "backup.native.incremental"
 
     backup_status_native = ft.Container(
         padding=ft.padding.symmetric(10, 6),
@@ -1339,7 +1370,8 @@ def build_admin_view(page: ft.Page) -> ft.Control:
         if m:
             ymd, hms = m.group(1), m.group(2)
             dt = datetime.strptime(ymd + hms, "%Y%m%d%H%M%S")
-            return dt.strftime("Backup %Y-%m-%d %H:%M:%S")
+            label = dt.strftime("Backup %Y-%m-%d %H:%M:%S")
+            return f"{label} (incremental)" if es_manifiesto(filename) else label
         return filename
 
     def _load_backup_dropdown():
@@ -1451,6 +1483,14 @@ def build_admin_view(page: ft.Page) -> ft.Control:
     if saved_native is not None:
         switch_backup_native.value = bool(saved_native)
 
+    switch_backup_incremental = ft.Switch(
+        label="Backup incremental (solo guarda lo que cambió desde el anterior)",
+        value=bool(page.client_storage.get(K_BACKUP_INCREMENTAL) or False),
+    )
+    switch_backup_incremental.on_change = lambda e: page.client_storage.set(
+        K_BACKUP_INCREMENTAL, bool(switch_backup_incremental.value)
+    )
+
     saved_interval = page.client_storage.get(K_BACKUP_INTERVAL)
     if saved_interval:
         dd_backup_native_interval.value = str(saved_interval)
@@ -1470,6 +1510,8 @@ def build_admin_view(page: ft.Page) -> ft.Control:
 
     lbl_last_backup = ft.Text("Último backup: —", size=12, color=ft.Colors.GREY_700)
     btn_backup_now = ft.ElevatedButton("Hacer backup ahora", icon=ft.Icons.SAVE)
+    pb_backup = ft.ProgressBar(width=320, value=0, visible=False)
+    txt_backup_progreso = ft.Text("", size=12, color=ft.Colors.GREY_700, visible=False)
 
     native_block = ft.Column(
         [
@@ -1481,7 +1523,10 @@ def build_admin_view(page: ft.Page) -> ft.Control:
                 content=ft.Column(
                     [
                         dd_backup_native_interval,
+                        switch_backup_incremental,
                         ft.Row([btn_backup_now], spacing=10),
+                        pb_backup,
+                        txt_backup_progreso,
                         lbl_last_backup,
                     ],
                     spacing=10,
@@ -1510,6 +1555,33 @@ def build_admin_view(page: ft.Page) -> ft.Control:
         on_click=lambda _: pick_backup_dir.get_directory_path(dialog_title="Selecciona carpeta destino de backups"),
     )
 
+    _FASES_BACKUP = {
+        "copiando": "Copiando base de datos",
+        "verificando": "Verificando integridad",
+        "comprimiendo": "Comprimiendo",
+        "guardando": "Guardando lo que cambió",
+    }
+    _ultimo_progreso = {"t": 0.0}
+
+    def _mostrar_progreso_backup(visible: bool, fase: str = "", hecho: int = 0, total: int = 0):
+        pb_backup.visible = visible
+        txt_backup_progreso.visible = visible
+        pb_backup.value = (hecho / total) if total else None
+        txt_backup_progreso.value = f"{_FASES_BACKUP.get(fase, fase)}… {int(100 * hecho / total)}%" if total else ""
+        page.update()
+
+    def _progreso_backup(fase: str, hecho: int, total: int):
+        # Se llama desde el hilo del backup: limitar repintados y pasar a la UI con run_task
+        ahora = time.monotonic()
+        if hecho < total and ahora - _ultimo_progreso["t"] < 0.15:
+            return
+        _ultimo_progreso["t"] = ahora
+
+        async def _pintar():
+            _mostrar_progreso_backup(True, fase, hecho, total)
+
+        page.run_task(_pintar)
+
     def _on_backup_now(e):
         bdir = (txt_backup_dir.value or "").strip()
         if not bdir:
@@ -1517,14 +1589,35 @@ def build_admin_view(page: ft.Page) -> ft.Control:
             page.update()
             return
 
-        try:
-            created = backup_database(bdir, zip_backup=True, method="native_manual")
-            txt_restore_status.value = f"✅ Backup creado: {os.path.basename(created)}"
-            _auto_purge_if_needed()
-            _refresh_last_backup_label()
-        except Exception as ex:
-            txt_restore_status.value = f"❌ Error creando backup: {ex}"
-        page.update()
+        btn_backup_now.disabled = True
+        _mostrar_progreso_backup(True, "copiando", 0, 1)
+
+        def tarea():
+            try:
+                created = backup_database(
+                    bdir,
+                    zip_backup=True,
+                    method="native_manual",
+                    progreso=_progreso_backup,
+                    incremental=bool(switch_backup_incremental.value),
+                )
+                msg = f"✅ Backup creado: {os.path.basename(created)}"
+                ok = True
+            except Exception as ex:
+                msg = f"❌ Error creando backup: {ex}"
+                ok = False
+
+            async def _fin():
+                btn_backup_now.disabled = False
+                txt_restore_status.value = msg
+                if ok:
+                    _auto_purge_if_needed()
+                    _refresh_last_backup_label()
+                _mostrar_progreso_backup(False)
+
+            page.run_task(_fin)
+
+        page.run_thread(tarea)
 
     btn_backup_now.on_click = _on_backup_now
 
@@ -1572,13 +1665,23 @@ def build_admin_view(page: ft.Page) -> ft.Control:
 
                 if (now - _last_run_ts["ts"]) >= interval:
                     try:
-                        created = backup_database(bdir, zip_backup=True, method="native_auto")
+                        # En un hilo: la copia va por tramos y no debe frenar la UI
+                        created = await asyncio.to_thread(
+                            backup_database,
+                            bdir,
+                            True,
+                            "native_auto",
+                            _progreso_backup,
+                            bool(switch_backup_incremental.value),
+                        )
+                        _mostrar_progreso_backup(False)
                         _last_run_ts["ts"] = now
                         _auto_purge_if_needed()
                         _refresh_last_backup_label()
                         txt_restore_status.value = f"✅ Backup automático: {os.path.basename(created)}"
                         page.update()
                     except Exception as ex:
+                        _mostrar_progreso_backup(False)
                         txt_restore_status.value = f"❌ Error backup automático: {ex}"
                         page.update()
 
@@ -1639,6 +1742,368 @@ def build_admin_view(page: ft.Page) -> ft.Control:
         scroll=ft.ScrollMode.AUTO,
     )
 
+    # =====================================================================
+    #                 BASE DE DATOS (WAL / PRAGMAs / mantenimiento)
+    # =====================================================================
+
+    _aj_bd = ajustes_almacenamiento()
+
+    sw_bd_wal = ft.Switch(label="Modo WAL (lecturas sin bloqueo mientras se guarda)", value=_aj_bd["wal"])
+    dd_bd_sync = ft.Dropdown(
+        label="Sincronización a disco",
+        width=220,
+        value=_aj_bd["synchronous"],
+        options=[ft.dropdown.Option(v) for v in SYNCHRONOUS_VALIDOS],
+    )
+    txt_bd_cache = ft.TextField(
+        label="Caché por conexión (MB)",
+        value=str(_aj_bd["cache_mb"]),
+        width=200,
+        keyboard_type=ft.KeyboardType.NUMBER,
+    )
+    txt_bd_mmap = ft.TextField(
+        label="Memoria mapeada (MB, 0 = no)",
+        value=str(_aj_bd["mmap_mb"]),
+        width=220,
+        keyboard_type=ft.KeyboardType.NUMBER,
+    )
+    sw_bd_temp = ft.Switch(label="Tablas temporales en memoria", value=_aj_bd["temp_store_memoria"])
+    sw_bd_vacuum = ft.Switch(label="Devolver espacio libre al disco (vacuum incremental)", value=_aj_bd["vacuum_incremental"])
+    dd_bd_optimizar = ft.Dropdown(
+        label="Optimizar automáticamente",
+        width=240,
+        value=str(_aj_bd["optimizar_cada_horas"]),
+        options=[
+            ft.dropdown.Option("0", "Nunca"),
+            ft.dropdown.Option("6", "Cada 6 horas"),
+            ft.dropdown.Option("12", "Cada 12 horas"),
+            ft.dropdown.Option("24", "Diario"),
+            ft.dropdown.Option("168", "Semanal"),
+        ],
+    )
+    dd_bd_compresion = ft.Dropdown(
+        label="Compresión de notas (editor enriquecido)",
+        width=300,
+        value=_aj_bd["compresion_html"],
+        options=[
+            ft.dropdown.Option("no", "Sin comprimir"),
+            ft.dropdown.Option("zlib", "zlib"),
+        ]
+        + ([ft.dropdown.Option("zstd", "zstd (más rápida)")] if zstd_disponible() else []),
+    )
+    btn_bd_comprimir = ft.OutlinedButton("Comprimir notas existentes", icon=ft.Icons.COMPRESS)
+    txt_bd_estado = ft.Text("", size=12, color=ft.Colors.GREY_700, selectable=True)
+    txt_bd_msg = ft.Text("", size=12)
+    btn_bd_optimizar = ft.OutlinedButton("Optimizar ahora", icon=ft.Icons.AUTO_FIX_HIGH)
+
+    def _mb(n: int) -> str:
+        return f"{n / (1024 * 1024):.1f} MB"
+
+    def _refrescar_estado_bd(_=None):
+        try:
+            est = estado_almacenamiento()
+            comp = estadisticas_compresion_html()
+        except Exception as ex:
+            txt_bd_estado.value = f"⚠️ No se pudo leer el estado: {ex}"
+            page.update()
+            return
+        aviso_vacuum = ""
+        if sw_bd_vacuum.value and est["auto_vacuum"] != "INCREMENTAL":
+            aviso_vacuum = " (\"Optimizar ahora\" compacta la BD una vez para activar el vacuum incremental)"
+        txt_bd_estado.value = (
+            f"Journal: {est['journal_mode'].upper()} · synchronous {est['synchronous']} · "
+            f"auto_vacuum {est['auto_vacuum']}{aviso_vacuum}\n"
+            f"Archivo: {_mb(est['tamano_bd_bytes'])} (WAL {_mb(est['tamano_wal_bytes'])}) · "
+            f"{est['freelist_count']} páginas libres de {est['page_count']}\n"
+            f"Notas con HTML: {comp['comprimidas']} comprimidas, {comp['sin_comprimir']} sin comprimir · "
+            f"{_mb(comp['bytes_guardados'])} en disco para {_mb(comp['chars_html'])} de HTML\n"
+            f"Último mantenimiento: {est['ultimo_mantenimiento'] or 'nunca'}"
+        )
+        page.update()
+
+    def _guardar_ajustes_bd(_=None):
+        try:
+            cache_mb = int((txt_bd_cache.value or "").strip())
+            mmap_mb = int((txt_bd_mmap.value or "").strip())
+        except ValueError:
+            txt_bd_msg.value = "⚠️ Caché y memoria mapeada deben ser números enteros."
+            txt_bd_msg.color = ft.Colors.ORANGE_700
+            page.update()
+            return
+
+        aj = guardar_ajustes_almacenamiento(
+            {
+                "wal": bool(sw_bd_wal.value),
+                "synchronous": dd_bd_sync.value,
+                "cache_mb": cache_mb,
+                "mmap_mb": mmap_mb,
+                "temp_store_memoria": bool(sw_bd_temp.value),
+                "vacuum_incremental": bool(sw_bd_vacuum.value),
+                "optimizar_cada_horas": int(dd_bd_optimizar.value or 0),
+                "compresion_html": dd_bd_compresion.value,
+            }
+        )
+        # Mostrar los valores tal como quedaron (recortados a los límites)
+        txt_bd_cache.value = str(aj["cache_mb"])
+        txt_bd_mmap.value = str(aj["mmap_mb"])
+        txt_bd_msg.value = "✅ Ajustes guardados. Se aplican a las conexiones nuevas."
+        txt_bd_msg.color = ft.Colors.GREEN_700
+        _refrescar_estado_bd()
+
+    def _on_optimizar_bd(_=None):
+        btn_bd_optimizar.disabled = True
+        txt_bd_msg.value = "Optimizando la base de datos..."
+        txt_bd_msg.color = ft.Colors.BLUE_700
+        page.update()
+
+        def tarea():
+            try:
+                res = mantenimiento_almacenamiento(compactar=True)
+                detalle = f"✅ Listo en {res['duracion_ms'] / 1000:.1f} s"
+                if res["vacuum"] == "completo":
+                    detalle += " (compactación completa)"
+                elif res["paginas_liberadas"]:
+                    detalle += f" ({res['paginas_liberadas']} páginas liberadas)"
+                color = ft.Colors.GREEN_700
+            except Exception as ex:
+                detalle = f"❌ No se pudo optimizar: {ex}"
+                color = ft.Colors.RED_700
+
+            async def _fin():
+                btn_bd_optimizar.disabled = False
+                txt_bd_msg.value = detalle
+                txt_bd_msg.color = color
+                _refrescar_estado_bd()
+
+            page.run_task(_fin)
+
+        page.run_thread(tarea)
+
+    btn_bd_optimizar.on_click = _on_optimizar_bd
+
+    def _on_comprimir_notas(_=None):
+        btn_bd_comprimir.disabled = True
+        txt_bd_msg.value = "Comprimiendo notas..."
+        txt_bd_msg.color = ft.Colors.BLUE_700
+        page.update()
+
+        def tarea():
+            try:
+                res = comprimir_html_sesiones()
+                detalle = (
+                    f"✅ {res['comprimidas']} de {res['revisadas']} notas comprimidas · "
+                    f"ahorro {_mb(res['ahorro_bytes'])} ({_mb(res['bytes_antes'])} → {_mb(res['bytes_despues'])}). "
+                    "Optimiza para devolver el espacio al disco."
+                )
+                color = ft.Colors.GREEN_700
+            except Exception as ex:
+                detalle = f"❌ No se pudieron comprimir las notas: {ex}"
+                color = ft.Colors.RED_700
+
+            async def _fin():
+                btn_bd_comprimir.disabled = False
+                txt_bd_msg.value = detalle
+                txt_bd_msg.color = color
+                _refrescar_estado_bd()
+
+            page.run_task(_fin)
+
+        page.run_thread(tarea)
+
+    btn_bd_comprimir.on_click = _on_comprimir_notas
+
+    seccion_basedatos = ft.Column(
+        [
+            ft.Text("Base de datos", size=18, weight="bold"),
+            ft.Text(
+                "Ajustes de almacenamiento de SQLite. Los valores por defecto sirven para la mayoría "
+                "de los casos; FULL es más seguro ante apagones pero más lento al guardar.",
+                size=12,
+                color=ft.Colors.GREY_700,
+            ),
+            ft.Divider(),
+            sw_bd_wal,
+            ft.Row([dd_bd_sync, txt_bd_cache, txt_bd_mmap], spacing=12, wrap=True),
+            sw_bd_temp,
+            sw_bd_vacuum,
+            dd_bd_optimizar,
+            dd_bd_compresion,
+            ft.Row(
+                [
+                    ft.ElevatedButton("Guardar ajustes", icon=ft.Icons.SAVE, on_click=_guardar_ajustes_bd),
+                    btn_bd_optimizar,
+                    btn_bd_comprimir,
+                    ft.OutlinedButton("Actualizar", icon=ft.Icons.REFRESH, on_click=_refrescar_estado_bd),
+                ],
+                spacing=12,
+                wrap=True,
+            ),
+            txt_bd_msg,
+            ft.Divider(),
+            ft.Text("Estado", weight="bold"),
+            txt_bd_estado,
+        ],
+        spacing=12,
+        scroll=ft.ScrollMode.AUTO,
+    )
+
+    # =====================================================================
+    #                 DIAGNÓSTICO (perfilado de consultas)
+    # =====================================================================
+
+    sw_perfil = ft.Switch(label="Perfilar consultas a la base de datos", value=perfilado_consultas_activo())
+    txt_perfil_umbral = ft.TextField(
+        label="Umbral consulta lenta (ms)",
+        value=f"{resumen_perfilado_consultas(0)['umbral_ms']:g}",
+        width=200,
+        keyboard_type=ft.KeyboardType.NUMBER,
+    )
+    txt_diag_pool = ft.Text("", size=12, color=ft.Colors.GREY_700)
+    txt_diag_log = ft.Text("", size=12, color=ft.Colors.GREY_700, selectable=True)
+
+    def _tabla_diag(*titulos: str) -> ft.DataTable:
+        return ft.DataTable(
+            columns=[ft.DataColumn(ft.Text(t)) for t in titulos],
+            rows=[],
+            column_spacing=16,
+            data_row_min_height=32,
+        )
+
+    tabla_diag_funciones = _tabla_diag("Función", "Llamadas", "Media ms", "Máx ms", "Total ms")
+    tabla_diag_escaneos = _tabla_diag("Función", "Tablas recorridas", "Llamadas", "Media ms", "Consulta")
+    tabla_diag_lentas = _tabla_diag("Hora", "Función", "ms", "Filas", "Consulta")
+
+    def _celda_sql(sql: str) -> ft.DataCell:
+        corto = sql if len(sql) <= 70 else sql[:70] + "…"
+        return ft.DataCell(ft.Text(corto, size=12, tooltip=sql))
+
+    def _refrescar_diagnostico(_=None):
+        pool = estadisticas_pool()
+        txt_diag_pool.value = (
+            f"Pool: {pool['en_uso']} en uso / {pool['abiertas']} abiertas (máx {pool['max_conexiones']}) · "
+            f"{pool['checkouts']} préstamos, {pool['reutilizadas']} reutilizadas, "
+            f"{pool['esperas']} esperas, {pool['desbordes']} desbordes, "
+            f"{pool['reclamadas']} sin cerrar"
+        )
+
+        res = resumen_perfilado_consultas(limite=25)
+        txt_diag_log.value = f"Log de consultas lentas: {res['log']}"
+
+        tabla_diag_funciones.rows = [
+            ft.DataRow(
+                cells=[
+                    ft.DataCell(ft.Text(f["funcion"], size=12)),
+                    ft.DataCell(ft.Text(str(f["llamadas"]), size=12)),
+                    ft.DataCell(ft.Text(f"{f['media_ms']:.1f}", size=12)),
+                    ft.DataCell(ft.Text(f"{f['max_ms']:.1f}", size=12)),
+                    ft.DataCell(ft.Text(f"{f['total_ms']:.0f}", size=12)),
+                ]
+            )
+            for f in res["funciones"]
+        ]
+        tabla_diag_escaneos.rows = [
+            ft.DataRow(
+                cells=[
+                    ft.DataCell(ft.Text(s["funcion"], size=12)),
+                    ft.DataCell(ft.Text(", ".join(s["escaneos"]), size=12, color=ft.Colors.RED_400)),
+                    ft.DataCell(ft.Text(str(s["llamadas"]), size=12)),
+                    ft.DataCell(ft.Text(f"{s['media_ms']:.1f}", size=12)),
+                    _celda_sql(s["sql"]),
+                ]
+            )
+            for s in res["escaneos"]
+        ]
+        tabla_diag_lentas.rows = [
+            ft.DataRow(
+                cells=[
+                    ft.DataCell(ft.Text(l["fecha"][11:], size=12)),
+                    ft.DataCell(ft.Text(l["funcion"], size=12)),
+                    ft.DataCell(ft.Text(f"{l['ms']:.1f}", size=12)),
+                    ft.DataCell(ft.Text(str(l["filas"]), size=12)),
+                    _celda_sql(l["sql"]),
+                ]
+            )
+            for l in res["lentas"]
+        ]
+        page.update()
+
+    def _aplicar_perfilado(_=None):
+        try:
+            umbral = float((txt_perfil_umbral.value or "").replace(",", ".") or PERFIL_UMBRAL_MS_DEFAULT)
+            txt_perfil_umbral.error_text = None
+        except ValueError:
+            txt_perfil_umbral.error_text = "Número inválido"
+            page.update()
+            return
+        activar_perfilado_consultas(bool(sw_perfil.value), umbral_ms=umbral)
+        page.client_storage.set(K_PERFIL_ACTIVO, bool(sw_perfil.value))
+        page.client_storage.set(K_PERFIL_UMBRAL_MS, umbral)
+        _refrescar_diagnostico()
+
+    def _reiniciar_diagnostico(_=None):
+        reiniciar_perfilado_consultas()
+        _refrescar_diagnostico()
+
+    sw_perfil.on_change = _aplicar_perfilado
+    txt_perfil_umbral.on_submit = _aplicar_perfilado
+    txt_perfil_umbral.on_blur = _aplicar_perfilado
+
+    def _bloque_diag(titulo: str, ayuda: str, tabla: ft.DataTable) -> ft.Control:
+        return ft.Column(
+            [
+                ft.Text(titulo, weight="bold"),
+                ft.Text(ayuda, size=12, color=ft.Colors.GREY_700),
+                ft.Row([tabla], scroll=ft.ScrollMode.AUTO),
+            ],
+            spacing=6,
+        )
+
+    seccion_diagnostico = ft.Column(
+        [
+            ft.Text("Diagnóstico", size=18, weight="bold"),
+            ft.Text(
+                "Mide el tiempo de las consultas a la base de datos para encontrar las lentas. "
+                "Déjalo apagado en el uso normal: agrega una pequeña sobrecarga.",
+                size=12,
+                color=ft.Colors.GREY_700,
+            ),
+            ft.Divider(),
+            ft.Row(
+                [
+                    sw_perfil,
+                    txt_perfil_umbral,
+                    ft.OutlinedButton("Actualizar", icon=ft.Icons.REFRESH, on_click=_refrescar_diagnostico),
+                    ft.OutlinedButton("Reiniciar contadores", icon=ft.Icons.RESTART_ALT, on_click=_reiniciar_diagnostico),
+                ],
+                spacing=12,
+                wrap=True,
+                vertical_alignment=ft.CrossAxisAlignment.CENTER,
+            ),
+            txt_diag_pool,
+            txt_diag_log,
+            ft.Divider(),
+            _bloque_diag(
+                "Funciones más costosas",
+                "Tiempo total con la conexión tomada, por función.",
+                tabla_diag_funciones,
+            ),
+            ft.Divider(),
+            _bloque_diag(
+                "Consultas que recorren tablas completas",
+                "Su plan no usa índices (p. ej. filtros con date(...) sobre la columna).",
+                tabla_diag_escaneos,
+            ),
+            ft.Divider(),
+            _bloque_diag(
+                "Últimas consultas lentas",
+                "Consultas que superaron el umbral (más reciente primero).",
+                tabla_diag_lentas,
+            ),
+        ],
+        spacing=12,
+        scroll=ft.ScrollMode.AUTO,
+    )
+
     # =====================================================================
     #                 CONTENEDOR DE SECCIONES + MENÚ IZQ
     # =====================================================================
@@ -1673,6 +2138,20 @@ def build_admin_view(page: ft.Page) -> ft.Control:
         on_click=lambda e: cambiar_seccion("backups"),
     )
 
+    tile_basedatos = ft.ListTile(
+        leading=ft.Icon(ft.Icons.STORAGE),
+        title=ft.Text("Base de datos"),
+        selected=False,
+        on_click=lambda e: cambiar_seccion("basedatos"),
+    )
+
+    tile_diagnostico = ft.ListTile(
+        leading=ft.Icon(ft.Icons.SPEED),
+        title=ft.Text("Diagnóstico"),
+        selected=False,
+        on_click=lambda e: cambiar_seccion("diagnostico"),
+    )
+
     def cambiar_seccion(nueva: str):
         seccion_activa["value"] = nueva
 
@@ -1688,6 +2167,13 @@ def build_admin_view(page: ft.Page) -> ft.Control:
             _refresh_backup_visibility()
             if (txt_backup_dir.value or "").strip():
                 _load_backup_dropdown()
+        elif nueva == "basedatos":
+            contenido_derecha.content = ft.Container(expand=True, content=seccion_basedatos)
+            txt_bd_msg.value = ""
+            _refrescar_estado_bd()
+        elif nueva == "diagnostico":
+            contenido_derecha.content = ft.Container(expand=True, content=seccion_diagnostico)
+            _refrescar_diagnostico()
 
         # limpiar mensajes al salir de su sección
         if nueva != "profesional":
@@ -1699,6 +2185,8 @@ def build_admin_view(page: ft.Page) -> ft.Control:
         tile_servicios.selected = nueva == "servicios"
         tile_configuracion.selected = nueva == "configuracion"
         tile_backups.selected = nueva == "backups"
+        tile_basedatos.selected = nueva == "basedatos"
+        tile_diagnostico.selected = nueva == "diagnostico"
 
         if contenido_derecha.page is not None:
             contenido_derecha.update()
@@ -1707,6 +2195,8 @@ def build_admin_view(page: ft.Page) -> ft.Control:
             tile_servicios.update()
             tile_configuracion.update()
             tile_backups.update()
+            tile_basedatos.update()
+            tile_diagnostico.update()
 
         page.update()
 
@@ -1731,6 +2221,8 @@ def build_admin_view(page: ft.Page) -> ft.Control:
                 tile_servicios,
                 tile_configuracion,  # ✅ Nuevo (antes de Backups)
                 tile_backups,
+                tile_basedatos,
+                tile_diagnostico,
             ],
             spacing=5,
         ),
@@ -0,0 +1,237 @@
+# agenda_intervalos.py
+"""
+Índice de intervalos en memoria para detectar solapes de citas y bloqueos.
+
+La agenda se carga por ventanas semanales (lunes 00:00 -> lunes siguiente 00:00)
+usando las columnas canónicas inicio_min/fin_min. Cada ventana guarda un árbol
+de intervalos (ordenado por inicio y aumentado con el fin máximo de cada
+subárbol), así que listar las k filas que se cruzan con [inicio, fin) cuesta
+O(log n + k) sin ir a la BD.
+
+Las ventanas se descartan solas cuando cambia db.version_agenda() (crear /
+actualizar / eliminar citas y bloqueos) o cuando cambia db.DB_PATH.
+"""
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from . import db
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Semanas que se mantienen en memoria (LRU)
+MAX_VENTANAS_DEFAULT = 12
+
+
+class ArbolIntervalos:
+    """
+    Árbol de intervalos estático sobre [inicio, fin) en minutos.
+
+    Los intervalos se ordenan por inicio; encima se arma un árbol de segmentos
+    con el fin máximo de cada nodo. Para una consulta [a, b) solo interesan los
+    intervalos con inicio < b (un prefijo, vía bisect) y de esos se baja
+    únicamente por los subárboles cuyo fin máximo sea > a.
+    """
+
+    __slots__ = ("_inicios", "_fines", "_ids", "_datos", "_n", "_tam", "_max_fin")
+
+    def __init__(self, items: Iterable[Tuple[int, int, int, Any]]):
+        # items: (inicio_min, fin_min, id, dato)
+        ordenados = sorted(items, key=lambda it: (it[0], it[1]))
+        self._inicios = [it[0] for it in ordenados]
+        self._fines = [it[1] for it in ordenados]
+        self._ids = [it[2] for it in ordenados]
+        self._datos = [it[3] for it in ordenados]
+        self._n = len(ordenados)
+
+        tam = 1
+        while tam < max(self._n, 1):
+            tam *= 2
+        self._tam = tam
+
+        # Hojas en [tam, 2*tam); nodo i tiene hijos 2i y 2i+1
+        max_fin: List[Optional[int]] = [None] * (2 * tam)
+        for i, fin in enumerate(self._fines):
+            max_fin[tam + i] = fin
+        for i in range(tam - 1, 0, -1):
+            izq, der = max_fin[2 * i], max_fin[2 * i + 1]
+            if izq is None:
+                max_fin[i] = der
+            elif der is None:
+                max_fin[i] = izq
+            else:
+                max_fin[i] = izq if izq >= der else der
+        self._max_fin = max_fin
+
+    def __len__(self) -> int:
+        return self._n
+
+    def _buscar(self, inicio: int, fin: int, excluir_id: Optional[int]) -> List[int]:
+        """Posiciones de los intervalos que se cruzan con [inicio, fin)."""
+        hasta = bisect_left(self._inicios, fin)  # solo inicios < fin
+        if hasta == 0:
+            return []
+
+        encontrados: List[int] = []
+        max_fin = self._max_fin
+        tam = self._tam
+        # (nodo, primera hoja, última hoja exclusiva)
+        pila = [(1, 0, tam)]
+        while pila:
+            nodo, lo, hi = pila.pop()
+            if lo >= hasta:
+                continue
+            mf = max_fin[nodo]
+            if mf is None or mf <= inicio:
+                continue
+            if nodo >= tam:
+                if self._ids[lo] != excluir_id:
+                    encontrados.append(lo)
+                continue
+            medio = (lo + hi) // 2
+            # Derecha primero en la pila para recorrer en orden de inicio
+            pila.append((2 * nodo + 1, medio, hi))
+            pila.append((2 * nodo, lo, medio))
+
+        return encontrados
+
+    def solapes(self, inicio: int, fin: int, excluir_id: Optional[int] = None) -> List[Any]:
+        return [self._datos[i] for i in self._buscar(inicio, fin, excluir_id)]
+
+
+class _VentanaSemana:
+    __slots__ = ("citas", "bloqueos")
+
+    def __init__(self, citas: ArbolIntervalos, bloqueos: ArbolIntervalos):
+        self.citas = citas
+        self.bloqueos = bloqueos
+
+
+def _arbol_desde_filas(filas: Iterable[Any]) -> ArbolIntervalos:
+    items = []
+    for fila in filas:
+        d = dict(fila)
+        ini, fin = d.get("inicio_min"), d.get("fin_min")
+        # Igual que en SQL: sin inicio/fin válidos la fila nunca solapa
+        if ini is None or fin is None:
+            continue
+        items.append((int(ini), int(fin), d.get("id"), d))
+    return ArbolIntervalos(items)
+
+
+def _lunes_de_minuto(minuto: int) -> date:
+    d = (_EPOCH + timedelta(minutes=minuto)).date()
+    return d - timedelta(days=d.weekday())
+
+
+class IndiceAgenda:
+    """
+    Caché de ventanas semanales con un ArbolIntervalos para citas y otro para
+    bloqueos. Es seguro usarlo desde varios hilos.
+    """
+
+    def __init__(self, max_ventanas: int = MAX_VENTANAS_DEFAULT):
+        self._max_ventanas = max(1, int(max_ventanas))
+        self._ventanas: "OrderedDict[date, _VentanaSemana]" = OrderedDict()
+        self._clave: Optional[Tuple[str, int]] = None
+        self._lock = threading.Lock()
+
+    def _clave_actual(self) -> Tuple[str, int]:
+        return (str(db.DB_PATH), db.version_agenda())
+
+    def _cargar_ventana(self, lunes: date) -> _VentanaSemana:
+        ini = datetime(lunes.year, lunes.month, lunes.day)
+        fin = ini + timedelta(days=7)
+        ini_str = ini.strftime("%Y-%m-%d %H:%M")
+        fin_str = fin.strftime("%Y-%m-%d %H:%M")
+        return _VentanaSemana(
+            _arbol_desde_filas(db.listar_citas_rango(ini_str, fin_str)),
+            _arbol_desde_filas(db.listar_bloqueos_rango(ini_str, fin_str)),
+        )
+
+    def _ventana(self, lunes: date) -> _VentanaSemana:
+        # La clave se lee ANTES de consultar: si alguien escribe mientras
+        # cargamos, la ventana queda con la versión vieja y se recarga luego.
+        clave = self._clave_actual()
+        with self._lock:
+            if clave != self._clave:
+                self._ventanas.clear()
+                self._clave = clave
+            ventana = self._ventanas.get(lunes)
+            if ventana is not None:
+                self._ventanas.move_to_end(lunes)
+                return ventana
+
+        ventana = self._cargar_ventana(lunes)
+
+        with self._lock:
+            if self._clave == clave:
+                self._ventanas[lunes] = ventana
+                while len(self._ventanas) > self._max_ventanas:
+                    self._ventanas.popitem(last=False)
+        return ventana
+
+    def _ventanas_rango(self, inicio: int, fin: int) -> List[_VentanaSemana]:
+        lunes = _lunes_de_minuto(inicio)
+        ultimo = _lunes_de_minuto(fin - 1)
+        ventanas = []
+        while lunes <= ultimo:
+            ventanas.append(self._ventana(lunes))
+            lunes += timedelta(days=7)
+        return ventanas
+
+    @staticmethod
+    def _rango_minutos(fecha_inicio: Any, fecha_fin: Any) -> Optional[Tuple[int, int]]:
+        ini = db._minutos_epoch(fecha_inicio)
+        fin = db._minutos_epoch(fecha_fin)
+        if ini is None or fin is None or fin <= ini:
+            return None
+        return (ini, fin)
+
+    def conflictos(
+        self,
+        fecha_inicio: Any,
+        fecha_fin: Any,
+        cita_id_excluir: Optional[int] = None,
+        bloqueo_id_excluir: Optional[int] = None,
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Devuelve {"citas": [...], "bloqueos": [...]} con todas las filas que se
+        solapan con [fecha_inicio, fecha_fin), ordenadas por inicio.
+        """
+        res: Dict[str, List[Dict[str, Any]]] = {"citas": [], "bloqueos": []}
+        rango = self._rango_minutos(fecha_inicio, fecha_fin)
+        if rango is None:
+            return res
+
+        vistos_c: set = set()
+        vistos_b: set = set()
+        # Una cita que cruza el domingo a medianoche aparece en ambas ventanas
+        for v in self._ventanas_rango(*rango):
+            for c in v.citas.solapes(rango[0], rango[1], cita_id_excluir):
+                if c.get("id") not in vistos_c:
+                    vistos_c.add(c.get("id"))
+                    res["citas"].append(c)
+            for b in v.bloqueos.solapes(rango[0], rango[1], bloqueo_id_excluir):
+                if b.get("id") not in vistos_b:
+                    vistos_b.add(b.get("id"))
+                    res["bloqueos"].append(b)
+        return res
+
+
+_INDICE = IndiceAgenda()
+
+
+# ------------ API -------------
+
+def conflictos_en_rango(
+    fecha_inicio: Any,
+    fecha_fin: Any,
+    cita_id_excluir: Optional[int] = None,
+    bloqueo_id_excluir: Optional[int] = None,
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Todas las citas y bloqueos que se solapan con [fecha_inicio, fecha_fin)."""
+    return _INDICE.conflictos(fecha_inicio, fecha_fin, cita_id_excluir, bloqueo_id_excluir)
@@ -0,0 +1,186 @@
+# agenda_slots.py
+"""
+Reparto de citas/bloqueos en la grilla (día, slot) de la agenda.
+
+Cada fila se convierte UNA vez a minutos enteros (inicio_min/fin_min si vienen
+de la BD, o parseando fecha_hora como respaldo) y se calculan directamente los
+slots que toca, sin recorrer la semana minuto a minuto. El costo es
+proporcional a las celdas ocupadas, no a citas × slots.
+
+La ocupación se guarda en un arreglo plano (días × slots); si NumPy está
+instalado se puede obtener como matriz con GrillaSlots.como_matriz().
+contar_por_dia() usa la misma conversión para el conteo por día del mini
+calendario.
+"""
+from array import array
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .db import _minutos_epoch
+
+try:  # opcional
+    import numpy as np  # type: ignore
+except Exception:  # pragma: no cover
+    np = None
+
+
+MIN_DIA = 24 * 60
+_EPOCH = date(1970, 1, 1)
+
+
+def dia_de_minuto(minuto: int) -> date:
+    """Fecha (naive) a la que pertenece un minuto epoch."""
+    return _EPOCH + timedelta(days=minuto // MIN_DIA)
+
+
+def minuto_de_dia(d: date) -> int:
+    """Minuto epoch de las 00:00 de la fecha."""
+    return (d - _EPOCH).days * MIN_DIA
+
+
+def minutos_de_fila(
+    fila: Dict[str, Any],
+    campos_inicio: Sequence[str] = ("fecha_hora",),
+    campo_fin: str = "fecha_hora_fin",
+    duracion_default: int = 60,
+) -> Optional[Tuple[int, int]]:
+    """
+    Devuelve (inicio, fin) en minutos epoch para una cita/bloqueo.
+
+    Usa las columnas canónicas inicio_min/fin_min cuando existen y solo
+    parsea texto como respaldo. Si no hay fin, usa inicio + duracion_default.
+    """
+    ini = fila.get("inicio_min")
+    if ini is None:
+        for campo in campos_inicio:
+            ini = _minutos_epoch(fila.get(campo))
+            if ini is not None:
+                break
+    if ini is None:
+        return None
+    ini = int(ini)
+
+    fin = fila.get("fin_min")
+    if fin is None:
+        fin = _minutos_epoch(fila.get(campo_fin))
+    fin = int(fin) if fin is not None else ini + int(duracion_default)
+    return (ini, fin)
+
+
+class GrillaSlots:
+    """
+    Grilla de `dias` consecutivos × slots de `intervalo` minutos entre
+    minuto_inicio y minuto_fin (ambos incluidos como etiqueta de slot).
+
+    - celdas[(fecha, minuto_slot)] -> filas que tocan ese slot
+    - ocupacion: arreglo plano con el número de filas por celda
+    """
+
+    def __init__(self, dias: Sequence[date], minuto_inicio: int, minuto_fin: int, intervalo: int):
+        if intervalo <= 0:
+            raise ValueError("El intervalo debe ser mayor que 0.")
+        self.dias = list(dias)
+        self.minuto_inicio = int(minuto_inicio)
+        self.intervalo = int(intervalo)
+        self.minutos = list(range(self.minuto_inicio, int(minuto_fin) + 1, self.intervalo))
+        self.n_slots = len(self.minutos)
+        self.celdas: Dict[Tuple[date, int], List[Dict[str, Any]]] = {}
+        self.ocupacion = array("i", [0]) * (len(self.dias) * self.n_slots)
+        self._dia0 = minuto_de_dia(self.dias[0]) if self.dias else 0
+
+    def agregar(self, fila: Dict[str, Any], inicio: int, fin: int) -> None:
+        """Ubica la fila [inicio, fin) en todos los slots con los que se cruza."""
+        if fin <= inicio or not self.dias or self.n_slots == 0:
+            return
+        n_dias = len(self.dias)
+        k_ini = max((inicio - self._dia0) // MIN_DIA, 0)
+        k_fin = min((fin - 1 - self._dia0) // MIN_DIA, n_dias - 1)
+        iv = self.intervalo
+        base = self.minuto_inicio
+        ultimo = self.n_slots - 1
+
+        for k in range(k_ini, k_fin + 1):
+            off = self._dia0 + k * MIN_DIA
+            a = max(inicio - off, 0)
+            b = min(fin - off, MIN_DIA)
+            if b <= base:
+                continue
+            i0 = (a - base) // iv if a > base else 0
+            i1 = min(-((base - b) // iv) - 1, ultimo)  # ceil((b - base) / iv) - 1
+            if i0 > i1:
+                continue
+            d = self.dias[k]
+            fila_base = k * self.n_slots
+            for i in range(i0, i1 + 1):
+                self.celdas.setdefault((d, base + i * iv), []).append(fila)
+                self.ocupacion[fila_base + i] += 1
+
+    def filas(self, d: date, minuto_slot: int) -> List[Dict[str, Any]]:
+        return self.celdas.get((d, minuto_slot), [])
+
+    def ocupados(self, d: date, minuto_slot: int) -> int:
+        try:
+            k = self.dias.index(d)
+        except ValueError:
+            return 0
+        i = (minuto_slot - self.minuto_inicio) // self.intervalo
+        if i < 0 or i >= self.n_slots:
+            return 0
+        return self.ocupacion[k * self.n_slots + i]
+
+    def como_matriz(self):
+        """Ocupación como matriz días × slots (ndarray si hay NumPy, si no listas)."""
+        if np is not None:
+            return np.frombuffer(self.ocupacion, dtype=np.int32).reshape(len(self.dias), self.n_slots)
+        n = self.n_slots
+        return [list(self.ocupacion[k * n:(k + 1) * n]) for k in range(len(self.dias))]
+
+
+def agrupar_en_slots(
+    filas: Iterable[Dict[str, Any]],
+    dias: Sequence[date],
+    minuto_inicio: int,
+    minuto_fin: int,
+    intervalo: int,
+    campos_inicio: Sequence[str] = ("fecha_hora",),
+    campo_fin: str = "fecha_hora_fin",
+    duracion_default: int = 60,
+) -> GrillaSlots:
+    """Arma la grilla de la semana en una sola pasada sobre las filas."""
+    grilla = GrillaSlots(dias, minuto_inicio, minuto_fin, intervalo)
+    for fila in filas:
+        rango = minutos_de_fila(fila, campos_inicio, campo_fin, duracion_default)
+        if rango is None:
+            continue
+        grilla.agregar(fila, rango[0], rango[1])
+    return grilla
+
+
+def contar_por_dia(
+    filas: Iterable[Dict[str, Any]],
+    campos_inicio: Sequence[str] = ("fecha_hora",),
+    campo_fin: str = "fecha_hora_fin",
+    duracion_default: int = 60,
+) -> Dict[date, int]:
+    """Número de filas que tocan cada día (útil para el mini calendario o tablas por mes)."""
+    conteo: Dict[date, int] = {}
+    for fila in filas:
+        rango = minutos_de_fila(fila, campos_inicio, campo_fin, duracion_default)
+        if rango is None:
+            continue
+        ini, fin = rango
+        dia = ini // MIN_DIA
+        ultimo = max(fin - 1, ini) // MIN_DIA
+        while dia <= ultimo:
+            d = _EPOCH + timedelta(days=dia)
+            conteo[d] = conteo.get(d, 0) + 1
+            dia += 1
+    return conteo
+
+
+def fecha_hora_de_fila(fila: Dict[str, Any], campos_inicio: Sequence[str] = ("fecha_hora",)) -> Optional[datetime]:
+    """Inicio de la fila como datetime, sin strptime cuando hay inicio_min."""
+    rango = minutos_de_fila(fila, campos_inicio)
+    if rango is None:
+        return None
+    return datetime(1970, 1, 1) + timedelta(minutes=rango[0])
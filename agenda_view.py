@@ -28,20 +28,18 @@ from .google_calendar import (
 
 from .db import (
     obtener_horarios_atencion,
-    listar_pacientes,
     listar_servicios,
     listar_citas_con_paciente_rango,
+    listar_citas_rango,
     crear_cita,
     actualizar_cita,
     eliminar_cita,
     existe_cita_en_fecha,
-    existe_cita_en_rango,
     crear_bloqueo,
     listar_bloqueos_rango,
     actualizar_bloqueo,
     eliminar_bloqueo,
     existe_bloqueo_en_fecha,
-    existe_bloqueo_en_rango,
     obtener_configuracion_profesional,
     consumir_cita_paquete_arriendo,
     devolver_cita_paquete_arriendo,
@@ -53,7 +51,12 @@ from .db import (
     obtener_sesion_id_por_cita,  
     cita_tiene_sesion,
     get_connection,
+    version_agenda,
 )
+from .agenda_intervalos import conflictos_en_rango
+from .agenda_slots import agrupar_en_slots, contar_por_dia
+from .busqueda_pacientes import buscar_pacientes
+from .buscador_diferido import BuscadorDiferido
 
 
 # ---------------------------------------------------------
@@ -115,6 +118,18 @@ def is_google_calendar_enabled() -> bool:
         return False
 
 
+def _horarios_conflicto(filas: list, campo_inicio: str) -> str:
+    """'HH:MM–HH:MM' de las filas en conflicto (máx. 3) para los mensajes de error."""
+    partes = []
+    for fila in filas[:3]:
+        ini = str(fila.get(campo_inicio) or "")[11:16]
+        fin = str(fila.get("fecha_hora_fin") or "")[11:16]
+        partes.append(f"{ini}–{fin}" if fin else ini)
+    if len(filas) > 3:
+        partes.append("…")
+    return ", ".join(partes)
+
+
 def build_agenda_view(page: ft.Page) -> ft.Control:
     """
     Vista de Agenda:
@@ -694,33 +709,12 @@ def build_agenda_view(page: ft.Page) -> ft.Control:
     # ----------------- BÚSQUEDA DE PACIENTES (local) -------------------
 
     def buscar_pacientes_local(texto: str):
-        texto = (texto or "").strip().lower()
+        texto = (texto or "").strip()
         if not texto:
             return []
+        return buscar_pacientes(texto)
 
-        filas = listar_pacientes()
-        resultados = []
-        for row in filas:
-            p = dict(row)
-            doc = str(p.get("documento") or "")
-            nombre = (p.get("nombre_completo") or "")
-            tel = str(p.get("telefono") or "")
-            email = (p.get("email") or "")
-
-            if (
-                texto in doc.lower()
-                or texto in nombre.lower()
-                or texto in tel.lower()
-                or texto in email.lower()
-            ):
-                resultados.append(p)
-
-        return resultados
-
-    def actualizar_resultados_pacientes(e=None):
-        q = txt_buscar_paciente.value
-        resultados = buscar_pacientes_local(q)
-
+    def mostrar_resultados_pacientes(q: str, resultados: list[dict]):
         resultados_pacientes.controls.clear()
         if not resultados:
             if q.strip():
@@ -743,6 +737,12 @@ def build_agenda_view(page: ft.Page) -> ft.Control:
         if resultados_pacientes.page is not None:
             resultados_pacientes.update()
 
+    # Debounce: busca cuando el usuario deja de escribir, fuera del hilo de la UI
+    buscador_pacientes = BuscadorDiferido(buscar_pacientes_local, mostrar_resultados_pacientes)
+
+    def actualizar_resultados_pacientes(e=None):
+        buscador_pacientes.solicitar(txt_buscar_paciente.value)
+
     txt_buscar_paciente.on_change = actualizar_resultados_pacientes
 
     def seleccionar_paciente(pac: dict):
@@ -761,6 +761,7 @@ def build_agenda_view(page: ft.Page) -> ft.Control:
         ]
         ficha_paciente.visible = True
 
+        buscador_pacientes.cancelar()
         resultados_pacientes.controls.clear()
         txt_buscar_paciente.value = ""
 
@@ -996,13 +997,14 @@ def build_agenda_view(page: ft.Page) -> ft.Control:
             "precio": precio_final,
         }
 
-        # Validar solape con otras citas
+        # Validar solape con otras citas y con bloqueos (una sola consulta al índice)
         cita_id_actual = cita_editando_id["value"]
+        conflictos = conflictos_en_rango(ini_str, fin_str, cita_id_actual, None)
 
-        # Validar solape con otras citas
-        if existe_cita_en_rango(ini_str, fin_str, cita_id_actual):
+        if conflictos["citas"]:
             mensaje_error.value = (
-                "Ya existe una cita que se solapa con este horario. "
+                "Ya existe una cita que se solapa con este horario "
+                f"({_horarios_conflicto(conflictos['citas'], 'fecha_hora')}). "
                 "Por favor selecciona otro rango."
             )
             mensaje_error.visible = True
@@ -1010,10 +1012,10 @@ def build_agenda_view(page: ft.Page) -> ft.Control:
                 mensaje_error.update()
             return
 
-        # Validar solape con bloqueos
-        if existe_bloqueo_en_rango(ini_str, fin_str, None):
+        if conflictos["bloqueos"]:
             mensaje_error.value = (
-                "Este horario está bloqueado en la agenda. "
+                "Este horario está bloqueado en la agenda "
+                f"({_horarios_conflicto(conflictos['bloqueos'], 'fecha_hora_inicio')}). "
                 "Elimina o mueve el bloqueo antes de agendar un paciente."
             )
             mensaje_error.visible = True
@@ -1618,10 +1620,14 @@ def build_agenda_view(page: ft.Page) -> ft.Control:
             ini_str = dt_ini.strftime("%Y-%m-%d %H:%M")
             fin_str = dt_fin.strftime("%Y-%m-%d %H:%M")
 
-            # Validación: no debe haber citas en el rango
-            if existe_cita_en_rango(ini_str, fin_str, None):
+            # Validación: ni citas ni otro bloqueo solapado en el rango
+            excluir_id = bloqueo_editando_id["value"]
+            conflictos = conflictos_en_rango(ini_str, fin_str, None, excluir_id)
+
+            if conflictos["citas"]:
                 mensaje_error_bloqueo.value = (
-                    "Ya existe una cita en este horario. "
+                    "Ya existe una cita en este horario "
+                    f"({_horarios_conflicto(conflictos['citas'], 'fecha_hora')}). "
                     "No se puede crear un bloqueo aquí."
                 )
                 mensaje_error_bloqueo.visible = True
@@ -1629,10 +1635,11 @@ def build_agenda_view(page: ft.Page) -> ft.Control:
                     mensaje_error_bloqueo.update()
                 return
 
-            # Validación: no debe haber otro bloqueo solapado
-            excluir_id = bloqueo_editando_id["value"]
-            if existe_bloqueo_en_rango(ini_str, fin_str, excluir_id):
-                mensaje_error_bloqueo.value = "Ya existe un bloqueo que se solapa con este rango."
+            if conflictos["bloqueos"]:
+                mensaje_error_bloqueo.value = (
+                    "Ya existe un bloqueo que se solapa con este rango "
+                    f"({_horarios_conflicto(conflictos['bloqueos'], 'fecha_hora_inicio')})."
+                )
                 mensaje_error_bloqueo.visible = True
                 if mensaje_error_bloqueo.page is not None:
                     mensaje_error_bloqueo.update()
@@ -1892,6 +1899,7 @@ def build_agenda_view(page: ft.Page) -> ft.Control:
 
         titulo_reserva.value = "Nueva reserva"
 
+        buscador_pacientes.cancelar()
         txt_buscar_paciente.value = ""
         resultados_pacientes.controls.clear()
 
@@ -2430,7 +2438,10 @@ def build_agenda_view(page: ft.Page) -> ft.Control:
         if bloqueos_celda:
             cell_on_click = None
         else:
-            cell_on_click = lambda e, dia=d, minuto=m: click_slot(dia, minuto)
+            # El día se resuelve al hacer clic: la celda se reutiliza entre semanas
+            cell_on_click = lambda e, dia_idx=d.weekday(), minuto=m: click_slot(
+                semana_lunes["value"] + timedelta(days=dia_idx), minuto
+            )
 
      # --------- Slot vacío seleccionado para agregar ---------
         es_slot_agregar = (
@@ -2725,96 +2736,153 @@ def build_agenda_view(page: ft.Page) -> ft.Control:
         end_min = END_HOUR * 60
         minutos = list(range(start_min, end_min + 1, intervalo))
 
-        inicio_dt = datetime.combine(dias[0], datetime.min.time())
-        fin_dt = datetime.combine(dias[-1], datetime.max.time())
+        citas_rows, bloqueos_rows = obtener_semana(dias[0])
+
+        # Reparto en (día, slot) por minutos enteros, una sola pasada por fila
+        bloqueos_por_celda = agrupar_en_slots(
+            bloqueos_rows,
+            dias,
+            start_min,
+            end_min,
+            intervalo,
+            campos_inicio=("fecha_hora_inicio", "fecha_hora"),
+            duracion_default=60,
+        ).celdas
+        citas_por_celda = agrupar_en_slots(
+            citas_rows,
+            dias,
+            start_min,
+            end_min,
+            intervalo,
+            duracion_default=int(slot_minutes.get("value") or 60),
+        ).celdas
+
+        inicio = dias[0]
+        fin = dias[-1]
+        texto_semana.value = (
+            f"{DIAS_SEMANA[inicio.weekday()]} {inicio.day:02d}/{inicio.month:02d}/{inicio.year} "
+            f"- {DIAS_SEMANA[fin.weekday()]} {fin.day:02d}/{fin.month:02d}/{fin.year}"
+        )
+
+        # Si cambian los slots (intervalo / horario) se arma el esqueleto de nuevo;
+        # si no, se reutilizan filas y celdas y solo se reemplazan las que cambiaron.
+        if grilla_cache["minutos"] != minutos:
+            construir_grilla(minutos)
+            cambiados = None
+        else:
+            cambiados = []
+
+        for k, d in enumerate(dias):
+            titulo = f"{DIAS_SEMANA[d.weekday()]} {d.day:02d}/{d.month:02d}"
+            txt = grilla_cache["titulos"][k]
+            if txt.value != titulo:
+                txt.value = titulo
+                if cambiados is not None and grilla_cache["encabezado"] not in cambiados:
+                    cambiados.append(grilla_cache["encabezado"])
+
+        firmas = grilla_cache["firmas"]
+        for i, m in enumerate(minutos):
+            fila = grilla_cache["filas"][i]
+            fila_cambiada = False
+            for k, d in enumerate(dias):
+                citas_celda = citas_por_celda.get((d, m), [])
+                bloqueos_celda = bloqueos_por_celda.get((d, m), [])
+                firma = firma_celda(d, m, citas_celda, bloqueos_celda)
+                if firmas.get((k, i)) == firma:
+                    continue
+                firmas[(k, i)] = firma
+                fila.controls[k + 1] = construir_celda(d, m, citas_celda, bloqueos_celda)
+                fila_cambiada = True
+            if fila_cambiada and cambiados is not None:
+                cambiados.append(fila)
+
+        if cambiados is None or calendario_semanal_col.page is None:
+            page.update()
+        else:
+            page.update(texto_semana, *cambiados)
+
+        prefetch_semanas_vecinas(dias[0])
+
+    # ----------------- CACHÉ DE SEMANAS (actual, anterior y siguiente) -------------------
+
+    # lunes -> (version_agenda, citas, bloqueos)
+    cache_semanas: dict[date, tuple[int, list[dict], list[dict]]] = {}
+    cache_semanas_lock = threading.Lock()
+
+    def cargar_semana_db(lunes: date) -> tuple[list[dict], list[dict]]:
+        inicio_dt = datetime.combine(lunes, datetime.min.time())
+        fin_dt = datetime.combine(lunes + timedelta(days=6), datetime.max.time())
         citas_rows = listar_citas_con_paciente_rango(
             inicio_dt.strftime("%Y-%m-%d %H:%M"),
             fin_dt.strftime("%Y-%m-%d %H:%M"),
         )
-        citas_rows = [dict(r) for r in citas_rows]
-
-         # --------- Bloqueos en el mismo rango ---------
         bloqueos_rows = listar_bloqueos_rango(
             inicio_dt.strftime("%Y-%m-%d %H:%M"),
             fin_dt.strftime("%Y-%m-%d %H:%M"),
         )
-        bloqueos_rows = [dict(b) for b in bloqueos_rows]
-
-        bloqueos_por_celda: dict[tuple[date, int], list[dict]] = {}
-        for b in bloqueos_rows:
-            ini_str = (b.get("fecha_hora_inicio") or b.get("fecha_hora") or "")[:16]
-            fin_str = (b.get("fecha_hora_fin") or "")[:16]
-            try:
-                dt_ini = datetime.strptime(ini_str, "%Y-%m-%d %H:%M")
-                dt_fin = datetime.strptime(fin_str, "%Y-%m-%d %H:%M") if fin_str else (dt_ini + timedelta(minutes=60))
-            except Exception:
-                continue
-
-            # Iterar slots cubiertos por el bloqueo (fin exclusivo)
-            dt_cur = dt_ini
-            while dt_cur < dt_fin:
-                fecha_d = dt_cur.date()
-                total_min = dt_cur.hour * 60 + dt_cur.minute
-                if start_min <= total_min <= end_min:
-                    slot_idx = (total_min - start_min) // intervalo
-                    slot_min = start_min + slot_idx * intervalo
-                    key = (fecha_d, slot_min)
-                    bloqueos_por_celda.setdefault(key, []).append(b)
-                dt_cur += timedelta(minutes=intervalo)
-
-        citas_por_celda: dict[tuple[date, int], list[dict]] = {}
-        for c in citas_rows:
-            ini_str = (c.get("fecha_hora") or "")[:16]
-            fin_str = (c.get("fecha_hora_fin") or "")[:16]
-
-            try:
-                dt_ini = datetime.strptime(ini_str, "%Y-%m-%d %H:%M")
-                if fin_str:
-                    dt_fin = datetime.strptime(fin_str, "%Y-%m-%d %H:%M")
-                else:
-                    dt_fin = dt_ini + timedelta(minutes=int(slot_minutes.get("value") or 60))
-            except Exception:
-                continue
-
-            # Iterar slots cubiertos por la cita (fin exclusivo)
-            dt_cur = dt_ini
-            while dt_cur < dt_fin:
-                fecha_d = dt_cur.date()
-                total_min = dt_cur.hour * 60 + dt_cur.minute
-
-                if start_min <= total_min <= end_min:
-                    slot_idx = (total_min - start_min) // intervalo
-                    slot_min = start_min + slot_idx * intervalo
-                    key = (fecha_d, slot_min)
-                    citas_por_celda.setdefault(key, []).append(c)
-
-                dt_cur += timedelta(minutes=intervalo)
+        return [dict(r) for r in citas_rows], [dict(b) for b in bloqueos_rows]
 
-        filas = []
-
-        inicio = dias[0]
-        fin = dias[-1]
-        texto_semana.value = (
-            f"{DIAS_SEMANA[inicio.weekday()]} {inicio.day:02d}/{inicio.month:02d}/{inicio.year} "
-            f"- {DIAS_SEMANA[fin.weekday()]} {fin.day:02d}/{fin.month:02d}/{fin.year}"
-        )
+    def obtener_semana(lunes: date) -> tuple[list[dict], list[dict]]:
+        """
+        Citas (con paciente) y bloqueos de la semana, desde memoria si ninguna
+        escritura en db.py cambió la agenda desde que se cargaron.
+        """
+        # La versión se lee antes de consultar: si alguien escribe en medio,
+        # la entrada queda vieja y se recarga en el próximo acceso.
+        version = version_agenda()
+        with cache_semanas_lock:
+            entrada = cache_semanas.get(lunes)
+            if entrada is not None and entrada[0] == version:
+                return entrada[1], entrada[2]
+
+        citas_rows, bloqueos_rows = cargar_semana_db(lunes)
+        with cache_semanas_lock:
+            cache_semanas[lunes] = (version, citas_rows, bloqueos_rows)
+        return citas_rows, bloqueos_rows
+
+    def prefetch_semanas_vecinas(lunes: date):
+        """Carga en segundo plano la semana anterior y la siguiente."""
+        vecinas = (lunes - timedelta(days=7), lunes + timedelta(days=7))
+
+        def tarea_prefetch():
+            for l in vecinas:
+                try:
+                    obtener_semana(l)
+                except Exception as ex:
+                    print("⚠️ Error precargando semana:", ex)
+            # Solo se conservan la semana actual y sus vecinas
+            with cache_semanas_lock:
+                for l in list(cache_semanas):
+                    if l != lunes and l not in vecinas:
+                        cache_semanas.pop(l, None)
+
+        threading.Thread(target=tarea_prefetch, daemon=True).start()
+
+    # Caché de la grilla semanal: filas/celdas reutilizables por posición (día, slot)
+    grilla_cache = {
+        "minutos": None,
+        "encabezado": None,
+        "titulos": [],
+        "filas": [],
+        "firmas": {},
+    }
 
+    def construir_grilla(minutos: list[int]):
+        titulos = [ft.Text("", weight="bold") for _ in range(7)]
         encabezado_cells = [ft.Container(width=TIME_COL_W)]
-        for d in dias:
+        for txt in titulos:
             encabezado_cells.append(
                 ft.Container(
-                    content=ft.Text(
-                        f"{DIAS_SEMANA[d.weekday()]} {d.day:02d}/{d.month:02d}",
-                        weight="bold",
-                    ),
+                    content=txt,
                     alignment=ft.alignment.center,
                     width=DAY_COL_W,
                     padding=5,
                 )
             )
         encabezado_cells.append(ft.Container(width=RIGHT_PAD_W))
-        filas.append(ft.Row(encabezado_cells, spacing=0))
+        encabezado = ft.Row(encabezado_cells, spacing=0)
 
+        filas = []
         for m in minutos:
             h = m // 60
             mm = m % 60
@@ -2828,23 +2896,60 @@ def build_agenda_view(page: ft.Page) -> ft.Control:
                     padding=5,
                 )
             ]
-            for d in dias:
-                cells.append(
-                    construir_celda(
-                        d,
-                        m,
-                        citas_por_celda.get((d, m), []),
-                        bloqueos_por_celda.get((d, m), []),
-                    )
-                )
+            # Las 7 celdas de día se llenan en dibujar_calendario_semanal()
+            cells.extend(ft.Container(width=DAY_COL_W) for _ in range(7))
             cells.append(ft.Container(width=RIGHT_PAD_W))
             filas.append(ft.Row(cells, spacing=0))
 
-        calendario_semanal_col.controls = filas
-        page.update()
+        grilla_cache["minutos"] = list(minutos)
+        grilla_cache["encabezado"] = encabezado
+        grilla_cache["titulos"] = titulos
+        grilla_cache["filas"] = filas
+        grilla_cache["firmas"] = {}
+        calendario_semanal_col.controls = [encabezado, *filas]
+
+    def firma_celda(d: date, m: int, citas_celda: list[dict], bloqueos_celda: list[dict]) -> tuple:
+        """
+        Todo lo que determina cómo se ve una celda. Las celdas vacías no dependen
+        de la fecha (el clic la resuelve con semana_lunes), así que se reutilizan
+        al cambiar de semana.
+        """
+        es_slot_agregar = (
+            not citas_celda
+            and not bloqueos_celda
+            and slot_agregar["fecha"] == d
+            and slot_agregar["minuto"] == m
+        )
+        return (
+            tuple(tuple(sorted(c.items())) for c in citas_celda),
+            tuple(tuple(sorted(b.items())) for b in bloqueos_celda),
+            d if es_slot_agregar else None,
+        )
 
     # ----------------- MINI CALENDARIO Y NAVEGACIÓN -------------------
 
+    # primer día del mes -> (version_agenda, {fecha: número de citas})
+    cache_conteo_mes: dict[date, tuple[int, dict[date, int]]] = {}
+
+    def citas_por_dia_mes(primer_dia: date, siguiente_mes: date) -> dict[date, int]:
+        """Citas que tocan cada día del mes (se recalcula solo si cambió la agenda)."""
+        version = version_agenda()
+        entrada = cache_conteo_mes.get(primer_dia)
+        if entrada is not None and entrada[0] == version:
+            return entrada[1]
+        try:
+            filas = listar_citas_rango(
+                primer_dia.strftime("%Y-%m-%d 00:00"),
+                siguiente_mes.strftime("%Y-%m-%d 00:00"),
+            )
+            conteo = contar_por_dia(dict(f) for f in filas)
+        except Exception as ex:
+            print("⚠️ Error contando citas del mes:", ex)
+            return {}
+        cache_conteo_mes.clear()
+        cache_conteo_mes[primer_dia] = (version, conteo)
+        return conteo
+
     def dibujar_mini_calendario():
         m = mes_actual["value"]
         year = m.year
@@ -2866,6 +2971,7 @@ def build_agenda_view(page: ft.Page) -> ft.Control:
         else:
             siguiente_mes = date(year, month + 1, 1)
         dias_en_mes = (siguiente_mes - timedelta(days=1)).day
+        conteo_dias = citas_por_dia_mes(primer_dia_mes, siguiente_mes)
 
         celdas = []
         for _ in range(offset):
@@ -2875,12 +2981,16 @@ def build_agenda_view(page: ft.Page) -> ft.Control:
             fecha_dia = date(year, month, dia_num)
             es_hoy = fecha_dia == hoy
             es_sel = fecha_dia == fecha_seleccionada["value"]
+            n_citas = conteo_dias.get(fecha_dia, 0)
 
             bgcolor = None
             border = None
             text_color = None
             weight = None
 
+            if n_citas:
+                bgcolor = ft.Colors.DEEP_PURPLE_50
+
             if es_sel:
                 bgcolor = ft.Colors.DEEP_PURPLE_200
                 text_color = ft.Colors.WHITE
@@ -2897,6 +3007,7 @@ def build_agenda_view(page: ft.Page) -> ft.Control:
                     bgcolor=bgcolor,
                     border=border,
                     border_radius=20,
+                    tooltip=(f"{n_citas} cita" if n_citas == 1 else f"{n_citas} citas") if n_citas else None,
                     content=ft.Text(
                         str(dia_num),
                         size=11,
@@ -0,0 +1,281 @@
+# backup_incremental.py
+"""
+Backups incrementales deduplicados (direccionados por contenido).
+
+Cada snapshot es una copia consistente de la BD (db.copiar_base_datos) partida
+en trozos de tamaño fijo (PAGINAS_POR_CHUNK páginas de SQLite). Cada trozo se
+guarda comprimido con su sha256 como nombre, así que un trozo que no cambió
+desde el snapshot anterior ya existe y no se vuelve a escribir. El manifiesto
+del snapshot es la lista ordenada de hashes: con él se rearma el .db.
+
+Estructura dentro de backup_dir:
+    sarapsicologa_snapshots/
+        chunks/ab/abcdef...                  trozos (zlib)
+        sarapsicologa_snap_YYYYmmdd_HHMMSS.json   manifiestos
+
+El manifiesto se escribe al final: si el proceso se corta a mitad, el snapshot
+no existe y los trozos huérfanos los borra recolectar_chunks().
+"""
+from __future__ import annotations
+
+import glob
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import zlib
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set
+
+from .db import copiar_base_datos, verificar_integridad_bd
+
+
+SNAPSHOT_DIRNAME = "sarapsicologa_snapshots"
+SNAPSHOT_PREFIX = "sarapsicologa_snap_"
+SNAPSHOT_GLOB = f"{SNAPSHOT_PREFIX}*.json"
+
+MANIFIESTO_VERSION = 1
+
+# 64 páginas de 4 KiB = trozos de 256 KiB: un cambio chico solo reescribe 256 KiB
+PAGINAS_POR_CHUNK = 64
+ZLIB_NIVEL = 6
+
+# progreso(fase, hecho, total): "copiando" (páginas), "verificando", "guardando" / "rearmando" (bytes)
+Progreso = Callable[[str, int, int], None]
+
+# Crear snapshots y recolectar trozos no pueden cruzarse (la recolección
+# borraría trozos de un snapshot cuyo manifiesto todavía no se escribió).
+_LOCK = threading.Lock()
+
+
+def snapshot_dir(backup_dir: str) -> str:
+    return os.path.join(backup_dir, SNAPSHOT_DIRNAME)
+
+
+def es_manifiesto(path: str) -> bool:
+    nombre = os.path.basename(path or "")
+    return nombre.startswith(SNAPSHOT_PREFIX) and nombre.lower().endswith(".json")
+
+
+def _chunk_path(store: str, h: str) -> str:
+    return os.path.join(store, "chunks", h[:2], h)
+
+
+def _escribir_atomico(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _page_size(db_path: str) -> int:
+    """Tamaño de página leído de la cabecera del .db (bytes 16-17, 1 = 65536)."""
+    with open(db_path, "rb") as f:
+        cabecera = f.read(100)
+    n = int.from_bytes(cabecera[16:18], "big")
+    return 65536 if n == 1 else (n or 4096)
+
+
+def crear_snapshot(backup_dir: str, method: str = "manual", progreso: Optional[Progreso] = None) -> str:
+    """
+    Crea un snapshot de la BD actual y devuelve la ruta de su manifiesto.
+    Solo se escriben los trozos que no estén ya en el almacén.
+    """
+    store = snapshot_dir(backup_dir)
+    os.makedirs(store, exist_ok=True)
+
+    with _LOCK:
+        tmp_dir = tempfile.mkdtemp(prefix="sarapsicologa_snap_")
+        try:
+            tmp_db = os.path.join(tmp_dir, "snapshot.db")
+            copiar_base_datos(
+                tmp_db,
+                progreso=(lambda hechas, total: progreso("copiando", hechas, total)) if progreso else None,
+            )
+
+            if progreso is not None:
+                progreso("verificando", 0, 1)
+            problemas = verificar_integridad_bd(tmp_db)
+            if problemas:
+                raise RuntimeError("La copia no pasó la verificación de integridad: " + "; ".join(problemas[:3]))
+
+            page_size = _page_size(tmp_db)
+            chunk_size = page_size * PAGINAS_POR_CHUNK
+            total = os.path.getsize(tmp_db)
+
+            hashes: List[str] = []
+            nuevos = 0
+            bytes_nuevos = 0
+            hecho = 0
+            with open(tmp_db, "rb") as f:
+                while True:
+                    bloque = f.read(chunk_size)
+                    if not bloque:
+                        break
+                    h = hashlib.sha256(bloque).hexdigest()
+                    destino = _chunk_path(store, h)
+                    if not os.path.exists(destino):
+                        comprimido = zlib.compress(bloque, ZLIB_NIVEL)
+                        _escribir_atomico(destino, comprimido)
+                        nuevos += 1
+                        bytes_nuevos += len(comprimido)
+                    hashes.append(h)
+                    hecho += len(bloque)
+                    if progreso is not None:
+                        progreso("guardando", hecho, total)
+
+            ahora = datetime.now()
+            manifiesto = {
+                "version": MANIFIESTO_VERSION,
+                "created_at": ahora.strftime("%Y-%m-%d %H:%M:%S"),
+                "method": method,
+                "page_size": page_size,
+                "chunk_size": chunk_size,
+                "size_bytes": total,
+                "chunks": hashes,
+                "chunks_nuevos": nuevos,
+                "bytes_nuevos": bytes_nuevos,
+            }
+            manifest_path = os.path.join(store, f"{SNAPSHOT_PREFIX}{ahora.strftime('%Y%m%d_%H%M%S')}.json")
+            _escribir_atomico(manifest_path, json.dumps(manifiesto, indent=1).encode("utf-8"))
+            return manifest_path
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def leer_manifiesto(path: str) -> Dict:
+    with open(path, "r", encoding="utf-8") as f:
+        manifiesto = json.load(f)
+    if manifiesto.get("version") != MANIFIESTO_VERSION:
+        raise ValueError(f"Versión de snapshot no soportada: {manifiesto.get('version')}")
+    return manifiesto
+
+
+def listar_snapshots(backup_dir: str) -> List[Dict]:
+    """
+    Snapshots de backup_dir con el mismo formato que backup_utils.list_backups
+    ({name, path, mtime, size_bytes}) más tipo="snapshot". size_bytes es el
+    tamaño del .db que se rearma, no lo que ocupa en disco.
+    """
+    store = snapshot_dir(backup_dir)
+    if not os.path.isdir(store):
+        return []
+
+    items: List[Dict] = []
+    for p in glob.glob(os.path.join(store, SNAPSHOT_GLOB)):
+        try:
+            st = os.stat(p)
+            manifiesto = leer_manifiesto(p)
+        except Exception:
+            continue
+        items.append(
+            {
+                "name": os.path.basename(p),
+                "path": p,
+                "mtime": st.st_mtime,
+                "size_bytes": int(manifiesto.get("size_bytes") or 0),
+                "tipo": "snapshot",
+            }
+        )
+    items.sort(key=lambda x: x["mtime"], reverse=True)
+    return items
+
+
+def reconstruir_snapshot(manifest_path: str, destino_db: str, progreso: Optional[Progreso] = None) -> str:
+    """
+    Rearma el .db de un snapshot en destino_db verificando el hash de cada
+    trozo. Lanza ValueError si falta un trozo o está dañado.
+    """
+    manifiesto = leer_manifiesto(manifest_path)
+    store = os.path.dirname(manifest_path)
+    total = int(manifiesto.get("size_bytes") or 0)
+
+    hecho = 0
+    with open(destino_db, "wb") as out:
+        for h in manifiesto["chunks"]:
+            try:
+                with open(_chunk_path(store, h), "rb") as f:
+                    bloque = zlib.decompress(f.read())
+            except (OSError, zlib.error) as ex:
+                raise ValueError(f"Snapshot incompleto: falta o está dañado el trozo {h[:12]}… ({ex})")
+            if hashlib.sha256(bloque).hexdigest() != h:
+                raise ValueError(f"Snapshot dañado: el trozo {h[:12]}… no coincide con su hash.")
+            out.write(bloque)
+            hecho += len(bloque)
+            if progreso is not None:
+                progreso("rearmando", hecho, total)
+
+    if total and hecho != total:
+        raise ValueError("Snapshot dañado: el tamaño rearmado no coincide con el manifiesto.")
+    return destino_db
+
+
+def eliminar_snapshot(manifest_path: str) -> None:
+    """Borra el manifiesto; sus trozos se liberan con recolectar_chunks()."""
+    os.remove(manifest_path)
+
+
+def recolectar_chunks(backup_dir: str) -> int:
+    """
+    Borra los trozos que ningún manifiesto usa (snapshots depurados o
+    interrumpidos). Devuelve cuántos trozos se borraron.
+    """
+    store = snapshot_dir(backup_dir)
+    chunks_dir = os.path.join(store, "chunks")
+    if not os.path.isdir(chunks_dir):
+        return 0
+
+    with _LOCK:
+        usados: Set[str] = set()
+        for p in glob.glob(os.path.join(store, SNAPSHOT_GLOB)):
+            try:
+                usados.update(leer_manifiesto(p)["chunks"])
+            except Exception:
+                # Un manifiesto ilegible no debe hacer borrar trozos que quizá use
+                return 0
+
+        borrados = 0
+        for sub in os.listdir(chunks_dir):
+            sub_path = os.path.join(chunks_dir, sub)
+            if not os.path.isdir(sub_path):
+                continue
+            for nombre in os.listdir(sub_path):
+                h = nombre[:-4] if nombre.endswith(".tmp") else nombre
+                if nombre.endswith(".tmp") or h not in usados:
+                    try:
+                        os.remove(os.path.join(sub_path, nombre))
+                        borrados += 1
+                    except Exception:
+                        pass
+            try:
+                os.rmdir(sub_path)  # solo si quedó vacía
+            except OSError:
+                pass
+        return borrados
+
+
+def estadisticas_snapshots(backup_dir: str) -> Dict[str, int]:
+    """{snapshots, chunks, bytes_en_disco, bytes_logicos} del almacén de backup_dir."""
+    snapshots = listar_snapshots(backup_dir)
+    chunks = 0
+    en_disco = 0
+    chunks_dir = os.path.join(snapshot_dir(backup_dir), "chunks")
+    if os.path.isdir(chunks_dir):
+        for raiz, _dirs, archivos in os.walk(chunks_dir):
+            for nombre in archivos:
+                try:
+                    en_disco += os.path.getsize(os.path.join(raiz, nombre))
+                    chunks += 1
+                except OSError:
+                    pass
+    return {
+        "snapshots": len(snapshots),
+        "chunks": chunks,
+        "bytes_en_disco": en_disco,
+        "bytes_logicos": sum(s["size_bytes"] for s in snapshots),
+    }
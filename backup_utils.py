@@ -6,9 +6,27 @@ import shutil
 import tempfile
 import zipfile
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
-
-from .db import DB_PATH
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .backup_incremental import (
+    crear_snapshot,
+    eliminar_snapshot,
+    es_manifiesto,
+    listar_snapshots,
+    recolectar_chunks,
+    reconstruir_snapshot,
+)
+from .db import (
+    DB_PATH,
+    cerrar_pool,
+    copiar_base_datos,
+    eliminar_archivos_wal,
+    init_db,
+    invalidar_cache_cuerpos_sesion,
+    marcar_agenda_modificada,
+    notificar_cambio_paciente,
+    verificar_integridad_bd,
+)
 
 
 BACKUP_PREFIX = "sarapsicologa_db_"
@@ -20,6 +38,11 @@ BACKUP_GLOB_ZIP = f"{BACKUP_PREFIX}*.zip"
 PRE_GLOB_DB = f"{PRE_RESTORE_PREFIX}*.db"
 PRE_GLOB_ZIP = f"{PRE_RESTORE_PREFIX}*.zip"
 
+# progreso(fase, hecho, total): fase "copiando" (páginas), "verificando", "comprimiendo" (bytes)
+ProgresoBackup = Callable[[str, int, int], None]
+
+ZIP_BLOQUE = 1024 * 1024
+
 
 def _ts() -> str:
     return datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -51,31 +74,60 @@ def _write_last_backup_meta(backup_dir: str, method: str, created_path: str) ->
         pass
 
 
-def backup_database(backup_dir: str, zip_backup: bool = True, method: str = "manual") -> str:
+def _zip_con_progreso(src: str, dst_zip: str, progreso: Optional[ProgresoBackup] = None) -> None:
+    """Comprime src en dst_zip por bloques, reportando bytes leídos."""
+    total = os.path.getsize(src)
+    hecho = 0
+    info = zipfile.ZipInfo.from_file(src, arcname=os.path.basename(src))
+    info.compress_type = zipfile.ZIP_DEFLATED
+    with zipfile.ZipFile(dst_zip, "w", compression=zipfile.ZIP_DEFLATED) as z:
+        with open(src, "rb") as fin, z.open(info, "w", force_zip64=True) as fout:
+            while True:
+                bloque = fin.read(ZIP_BLOQUE)
+                if not bloque:
+                    break
+                fout.write(bloque)
+                hecho += len(bloque)
+                if progreso is not None:
+                    progreso("comprimiendo", hecho, total)
+
+
+def _crear_copia(
+    backup_dir: str,
+    base_name: str,
+    zip_backup: bool,
+    method: str,
+    progreso: Optional[ProgresoBackup] = None,
+) -> str:
     """
-    Crea un backup de DB_PATH en backup_dir.
-    - Si zip_backup=True crea .zip (recomendado)
-    - Si zip_backup=False deja .db
-    Retorna el path del archivo creado.
+    Copia en caliente (API de backup de SQLite, por tramos) + integrity_check
+    de la copia + zip opcional. Si la copia no pasa la verificación se borra.
     """
-    _ensure_dir(backup_dir)
-
-    if not os.path.exists(DB_PATH):
-        raise FileNotFoundError(f"No existe DB en: {DB_PATH}")
-
-    base_name = f"{BACKUP_PREFIX}{_ts()}"
     dst_db = os.path.join(backup_dir, base_name + ".db")
 
-    # Copia simple
-    shutil.copy2(DB_PATH, dst_db)
+    copiar_base_datos(
+        dst_db,
+        progreso=(lambda hechas, total: progreso("copiando", hechas, total)) if progreso else None,
+    )
+
+    if progreso is not None:
+        progreso("verificando", 0, 1)
+    problemas = verificar_integridad_bd(dst_db)
+    if problemas:
+        try:
+            os.remove(dst_db)
+        except Exception:
+            pass
+        raise RuntimeError("La copia no pasó la verificación de integridad: " + "; ".join(problemas[:3]))
+    if progreso is not None:
+        progreso("verificando", 1, 1)
 
     if not zip_backup:
         _write_last_backup_meta(backup_dir, method=method, created_path=dst_db)
         return dst_db
 
     dst_zip = os.path.join(backup_dir, base_name + ".zip")
-    with zipfile.ZipFile(dst_zip, "w", compression=zipfile.ZIP_DEFLATED) as z:
-        z.write(dst_db, arcname=os.path.basename(dst_db))
+    _zip_con_progreso(dst_db, dst_zip, progreso)
 
     try:
         os.remove(dst_db)
@@ -86,10 +138,42 @@ def backup_database(backup_dir: str, zip_backup: bool = True, method: str = "man
     return dst_zip
 
 
+def backup_database(
+    backup_dir: str,
+    zip_backup: bool = True,
+    method: str = "manual",
+    progreso: Optional[ProgresoBackup] = None,
+    incremental: bool = False,
+) -> str:
+    """
+    Crea un backup de DB_PATH en backup_dir.
+    - Copia consistente aunque la app esté escribiendo (API de backup de SQLite)
+      y verificada con integrity_check.
+    - Si incremental=True crea un snapshot deduplicado (ver backup_incremental):
+      solo se escriben los trozos del .db que cambiaron. Retorna su manifiesto.
+    - Si zip_backup=True crea .zip (recomendado)
+    - Si zip_backup=False deja .db
+    - progreso(fase, hecho, total) para mostrar avance (se llama desde este hilo).
+    Retorna el path del archivo creado.
+    """
+    _ensure_dir(backup_dir)
+
+    if not os.path.exists(DB_PATH):
+        raise FileNotFoundError(f"No existe DB en: {DB_PATH}")
+
+    if incremental:
+        manifest_path = crear_snapshot(backup_dir, method=method, progreso=progreso)
+        _write_last_backup_meta(backup_dir, method=method, created_path=manifest_path)
+        return manifest_path
+
+    return _crear_copia(backup_dir, f"{BACKUP_PREFIX}{_ts()}", zip_backup, method, progreso)
+
+
 def list_backups(backup_dir: str) -> List[Dict]:
     """
-    Lista backups .db y .zip en backup_dir, ordenados por más reciente.
-    Retorna: [{name, path, mtime, size_bytes}]
+    Lista backups .db, .zip y snapshots incrementales en backup_dir, ordenados
+    por más reciente.
+    Retorna: [{name, path, mtime, size_bytes}] (los snapshots con tipo="snapshot")
     """
     if not backup_dir or not os.path.isdir(backup_dir):
         return []
@@ -116,6 +200,8 @@ def list_backups(backup_dir: str) -> List[Dict]:
         except Exception:
             continue
 
+    items.extend(listar_snapshots(backup_dir))
+
     items.sort(key=lambda x: x["mtime"], reverse=True)
     return items
 
@@ -130,25 +216,7 @@ def _make_pre_restore_backup(backup_dir: str, zip_backup: bool = True) -> str:
     if not os.path.exists(DB_PATH):
         raise FileNotFoundError(f"No existe DB actual en: {DB_PATH}")
 
-    ts = _ts()
-    pre_db = os.path.join(backup_dir, f"{PRE_RESTORE_PREFIX}{ts}.db")
-    shutil.copy2(DB_PATH, pre_db)
-
-    if not zip_backup:
-        _write_last_backup_meta(backup_dir, method="restore_pre", created_path=pre_db)
-        return pre_db
-
-    pre_zip = os.path.join(backup_dir, f"{PRE_RESTORE_PREFIX}{ts}.zip")
-    with zipfile.ZipFile(pre_zip, "w", compression=zipfile.ZIP_DEFLATED) as z:
-        z.write(pre_db, arcname=os.path.basename(pre_db))
-
-    try:
-        os.remove(pre_db)
-    except Exception:
-        pass
-
-    _write_last_backup_meta(backup_dir, method="restore_pre", created_path=pre_zip)
-    return pre_zip
+    return _crear_copia(backup_dir, f"{PRE_RESTORE_PREFIX}{_ts()}", zip_backup, "restore_pre")
 
 
 def restore_database_from_backup(
@@ -158,7 +226,8 @@ def restore_database_from_backup(
     prebackup_zip: bool = True,
 ) -> Tuple[Optional[str], str]:
     """
-    Restaura la DB desde un backup (.db o .zip con .db dentro) SOBREESCRIBIENDO DB_PATH.
+    Restaura la DB desde un backup (.db, .zip con .db dentro o manifiesto de
+    snapshot incremental) SOBREESCRIBIENDO DB_PATH.
 
     - Si make_prebackup=True: crea pre_restore antes de tocar la DB.
     Retorna (prebackup_path, restored_from_backup_path)
@@ -177,7 +246,11 @@ def restore_database_from_backup(
     tmp_dir: Optional[str] = None
 
     try:
-        if backup_path.lower().endswith(".zip"):
+        if es_manifiesto(backup_path):
+            tmp_dir = tempfile.mkdtemp(prefix="sarapsicologa_restore_")
+            src_db = reconstruir_snapshot(backup_path, os.path.join(tmp_dir, "snapshot.db"))
+
+        elif backup_path.lower().endswith(".zip"):
             tmp_dir = tempfile.mkdtemp(prefix="sarapsicologa_restore_")
             with zipfile.ZipFile(backup_path, "r") as z:
                 db_members = [m for m in z.namelist() if m.lower().endswith(".db")]
@@ -190,7 +263,21 @@ def restore_database_from_backup(
         if not src_db.lower().endswith(".db"):
             raise ValueError("El backup debe ser .db o .zip con .db.")
 
+        # No sobreescribir la BD con un backup dañado
+        problemas = verificar_integridad_bd(src_db)
+        if problemas:
+            raise ValueError("El backup está dañado: " + "; ".join(problemas[:3]))
+
+        # Soltar las conexiones reutilizables antes de sobreescribir el archivo
+        cerrar_pool()
+        # El -wal/-shm de la BD actual no corresponde al archivo restaurado
+        eliminar_archivos_wal(DB_PATH)
         shutil.copy2(src_db, DB_PATH)
+        # Un backup viejo puede no tener tablas/triggers nuevos (resúmenes, búsqueda)
+        init_db()
+        invalidar_cache_cuerpos_sesion()
+        marcar_agenda_modificada()
+        notificar_cambio_paciente(None)
         _write_last_backup_meta(backup_dir, method="restore", created_path=backup_path)
         return (pre_path, backup_path)
 
@@ -210,8 +297,10 @@ def purge_backups(
     """
     Depura backups antiguos.
     - Backups normales: conserva los keep_last más recientes.
+    - Snapshots incrementales: conserva los keep_last más recientes y borra los
+      trozos que ya no usa ninguno.
     - pre_restore: si include_pre_restore=True, conserva SOLO 1 (el más reciente).
-    Retorna lista de paths eliminados.
+    Retorna lista de paths eliminados (backups y manifiestos, no los trozos).
     """
     if not backup_dir or not os.path.isdir(backup_dir):
         return []
@@ -222,6 +311,8 @@ def purge_backups(
         return name.startswith(PRE_RESTORE_PREFIX)
 
     # Separar
+    snap_items = [x for x in items if x.get("tipo") == "snapshot"]
+    items = [x for x in items if x.get("tipo") != "snapshot"]
     pre_items = [x for x in items if is_pre_restore(x["name"])]
     normal_items = [x for x in items if not is_pre_restore(x["name"])]
 
@@ -241,6 +332,18 @@ def purge_backups(
         except Exception:
             pass
 
+    # 1b) Depurar snapshots: dejar keep_last y liberar los trozos huérfanos
+    to_delete_snap = snap_items[keep_last:] if keep_last >= 0 else snap_items
+    for it in to_delete_snap:
+        p = it["path"]
+        try:
+            eliminar_snapshot(p)
+            deleted.append(p)
+        except Exception:
+            pass
+    if snap_items:
+        recolectar_chunks(backup_dir)
+
     # 2) Depurar pre_restore: dejar SOLO 1 si se solicita
     if include_pre_restore:
         to_delete_pre = pre_items[1:]  # deja el más reciente (index 0)
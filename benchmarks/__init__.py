@@ -0,0 +1,8 @@
+# benchmarks/
+"""
+Benchmarks de la capa de datos (db.py) sobre una base sintética.
+
+Uso (desde la carpeta que contiene el paquete, igual que test_cie11_api):
+    python -m app.benchmarks --json resultados.json
+    python -m app.benchmarks --escala 0.1 --comparar resultados.json
+"""
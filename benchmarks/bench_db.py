@@ -0,0 +1,303 @@
+# benchmarks/bench_db.py
+"""
+Mide los puntos de entrada principales de db.py sobre una base sintética.
+
+Cada caso se ejecuta `repeticiones` veces con argumentos aleatorios (semilla
+fija) después de unas corridas de calentamiento, y se reporta p50/p95/media en
+milisegundos. Con --json se guarda el resultado y con --comparar se contrasta
+contra un JSON anterior para detectar regresiones.
+
+La base se genera en un SARA_BASE_DIR temporal: db.DB_PATH se redirige ahí y
+el pool se cierra antes y después, así nunca se toca la base real.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .. import db
+from .datos_sinteticos import VolumenDatos, generar_bd_sintetica, rango_fechas
+
+
+REPETICIONES_DEFAULT = 50
+CALENTAMIENTO_DEFAULT = 3
+UMBRAL_REGRESION_DEFAULT = 0.20  # +20% en p95
+
+# Un caso prepara sus argumentos con el rng (fuera del tiempo medido) y
+# devuelve la función a cronometrar.
+Caso = Callable[[random.Random], Callable[[], Any]]
+
+
+def percentil(valores: List[float], p: float) -> float:
+    """Percentil por rango más cercano (p en [0, 100])."""
+    if not valores:
+        return 0.0
+    orden = sorted(valores)
+    k = max(0, math.ceil(p / 100.0 * len(orden)) - 1)
+    return orden[k]
+
+
+def resumir_tiempos(tiempos_ms: List[float]) -> Dict[str, float]:
+    return {
+        "n": len(tiempos_ms),
+        "p50_ms": round(percentil(tiempos_ms, 50), 3),
+        "p95_ms": round(percentil(tiempos_ms, 95), 3),
+        "media_ms": round(sum(tiempos_ms) / len(tiempos_ms), 3) if tiempos_ms else 0.0,
+        "min_ms": round(min(tiempos_ms), 3) if tiempos_ms else 0.0,
+        "max_ms": round(max(tiempos_ms), 3) if tiempos_ms else 0.0,
+    }
+
+
+def medir(caso: Caso, rng: random.Random, repeticiones: int, calentamiento: int) -> Dict[str, float]:
+    for _ in range(calentamiento):
+        caso(rng)()
+    tiempos: List[float] = []
+    for _ in range(repeticiones):
+        llamada = caso(rng)
+        t0 = time.perf_counter()
+        llamada()
+        tiempos.append((time.perf_counter() - t0) * 1000.0)
+    return resumir_tiempos(tiempos)
+
+
+# ------------ Casos -------------
+
+def _casos(volumen: VolumenDatos) -> Dict[str, Tuple[Caso, float]]:
+    """
+    nombre -> (caso, fracción de repeticiones). Las consultas de tabla completa
+    (listar_pacientes) corren menos veces para que el benchmark no se eternice.
+    """
+    desde, hasta = rango_fechas(volumen)
+    dias = (hasta - desde).days
+
+    conn = db.get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT id FROM historia_clinica;")
+    historias = [r["id"] for r in cur.fetchall()]
+    cur.execute("SELECT id FROM empresas_convenio;")
+    empresas = [r["id"] for r in cur.fetchall()]
+    cur.execute("SELECT documento, nombre_completo FROM pacientes LIMIT 500;")
+    pacientes = [(r["documento"], r["nombre_completo"]) for r in cur.fetchall()]
+    conn.close()
+
+    def _dia(rng: random.Random) -> date:
+        return desde + timedelta(days=rng.randrange(dias))
+
+    def citas_semana(rng):
+        d = _dia(rng)
+        lunes = d - timedelta(days=d.weekday())
+        ini = f"{lunes.isoformat()} 00:00"
+        fin = f"{(lunes + timedelta(days=7)).isoformat()} 00:00"
+        return lambda: db.listar_citas_con_paciente_rango(ini, fin)
+
+    def existe_cita(rng):
+        d = _dia(rng)
+        ini = datetime(d.year, d.month, d.day, rng.randint(7, 19), rng.choice((0, 30)))
+        fin = ini + timedelta(minutes=60)
+        a, b = ini.strftime("%Y-%m-%d %H:%M"), fin.strftime("%Y-%m-%d %H:%M")
+        return lambda: db.existe_cita_en_rango(a, b)
+
+    def resumen_mes(rng):
+        d = _dia(rng)
+        primero = d.replace(day=1)
+        ultimo = (primero + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        a, b = primero.isoformat(), ultimo.isoformat()
+        return lambda: db.resumen_financiero_periodo(a, b)
+
+    def resumen_anio(rng):
+        anio = _dia(rng).year
+        return lambda: db.resumen_financiero_periodo(f"{anio}-01-01", f"{anio}-12-31")
+
+    def pacientes_todos(rng):
+        return db.listar_pacientes
+
+    def sesiones_historia(rng):
+        hid = rng.choice(historias) if historias else 0
+        return lambda: db.listar_sesiones_clinicas(hid)
+
+    def sesiones_historia_resumen(rng):
+        hid = rng.choice(historias) if historias else 0
+        return lambda: db.listar_sesiones_clinicas_resumen(hid)
+
+    def factura_nueva(rng):
+        doc, nombre = rng.choice(pacientes)
+        cabecera = {
+            "fecha": _dia(rng).isoformat(),
+            "empresa_id": rng.choice(empresas),
+            "paciente_documento": doc,
+            "paciente_nombre": nombre,
+            "forma_pago": "Transferencia",
+        }
+        items = [{"descripcion": "Sesiones de psicología", "cantidad": rng.randint(1, 6), "valor_unitario": 85_000}]
+        return lambda: db.crear_factura_convenio(cabecera, items)
+
+    return {
+        "listar_citas_con_paciente_rango (semana)": (citas_semana, 1.0),
+        "existe_cita_en_rango (1 h)": (existe_cita, 1.0),
+        "resumen_financiero_periodo (mes)": (resumen_mes, 1.0),
+        "resumen_financiero_periodo (año)": (resumen_anio, 0.4),
+        "listar_pacientes": (pacientes_todos, 0.2),
+        "listar_sesiones_clinicas": (sesiones_historia, 1.0),
+        "listar_sesiones_clinicas_resumen": (sesiones_historia_resumen, 1.0),
+        "crear_factura_convenio": (factura_nueva, 1.0),
+    }
+
+
+# ------------ Ejecución -------------
+
+def ejecutar_benchmarks(
+    volumen: VolumenDatos,
+    repeticiones: int = REPETICIONES_DEFAULT,
+    calentamiento: int = CALENTAMIENTO_DEFAULT,
+    semilla: int = 7,
+    base_dir: Optional[Path] = None,
+    filtro: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Genera (o reutiliza, si ya existe en base_dir) la base sintética y mide
+    todos los casos. Devuelve el dict que se guarda como JSON.
+    """
+    temporal = base_dir is None
+    base = Path(base_dir) if base_dir else Path(tempfile.mkdtemp(prefix="sara_bench_"))
+    ruta_bd = base / "data" / "sara_psico.db"
+    ruta_bd.parent.mkdir(parents=True, exist_ok=True)
+
+    ruta_original = db.DB_PATH
+    env_original = os.environ.get("SARA_BASE_DIR")
+    db.cerrar_pool()
+    db.DB_PATH = ruta_bd
+    os.environ["SARA_BASE_DIR"] = str(base)
+
+    try:
+        conteo: Dict[str, int] = {}
+        t0 = time.perf_counter()
+        if ruta_bd.exists() and ruta_bd.stat().st_size > 0:
+            print(f"[bench] Reutilizando {ruta_bd}")
+            db.init_db()
+        else:
+            print(f"[bench] Generando base sintética en {ruta_bd} …")
+            conteo = generar_bd_sintetica(volumen, semilla=semilla)
+        generacion_s = time.perf_counter() - t0
+        print(f"[bench] Base lista en {generacion_s:.1f} s")
+
+        resultados: Dict[str, Dict[str, float]] = {}
+        for nombre, (caso, fraccion) in _casos(volumen).items():
+            if filtro and filtro.lower() not in nombre.lower():
+                continue
+            n = max(5, int(repeticiones * fraccion))
+            # rng propio por caso: agregar o quitar casos no cambia los argumentos de los demás
+            rng = random.Random(f"{semilla}:{nombre}")
+            resultados[nombre] = medir(caso, rng, n, calentamiento)
+            r = resultados[nombre]
+            print(f"[bench] {nombre:<45} p50 {r['p50_ms']:>9.2f} ms   p95 {r['p95_ms']:>9.2f} ms   (n={r['n']})")
+
+        return {
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "plataforma": platform.platform(),
+            "semilla": semilla,
+            "repeticiones": repeticiones,
+            "volumen": volumen.__dict__,
+            "filas_generadas": conteo,
+            "tamano_bd_mb": round(ruta_bd.stat().st_size / 1e6, 1),
+            "generacion_s": round(generacion_s, 1),
+            "resultados": resultados,
+        }
+    finally:
+        db.cerrar_pool()
+        db.DB_PATH = ruta_original
+        if env_original is None:
+            os.environ.pop("SARA_BASE_DIR", None)
+        else:
+            os.environ["SARA_BASE_DIR"] = env_original
+        if temporal:
+            shutil.rmtree(base, ignore_errors=True)
+
+
+def comparar(actual: Dict[str, Any], base: Dict[str, Any], umbral: float = UMBRAL_REGRESION_DEFAULT) -> List[str]:
+    """
+    Imprime la variación de p50/p95 contra `base` y devuelve los nombres de
+    los casos cuyo p95 empeoró más que `umbral` (0.2 = +20%).
+    """
+    regresiones: List[str] = []
+    res_base = base.get("resultados", {})
+    print(f"\n[bench] Comparación contra corrida del {base.get('fecha', '?')}")
+    for nombre, r in actual.get("resultados", {}).items():
+        b = res_base.get(nombre)
+        if not b:
+            print(f"  {nombre:<45} (nuevo)")
+            continue
+        d50 = (r["p50_ms"] / b["p50_ms"] - 1) if b["p50_ms"] else 0.0
+        d95 = (r["p95_ms"] / b["p95_ms"] - 1) if b["p95_ms"] else 0.0
+        marca = ""
+        if d95 > umbral:
+            marca = "  ⚠️ regresión"
+            regresiones.append(nombre)
+        print(f"  {nombre:<45} p50 {d50:+7.1%}   p95 {d95:+7.1%}{marca}")
+    return regresiones
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.benchmarks",
+        description="Benchmarks de db.py sobre una base sintética.",
+    )
+    parser.add_argument("--escala", type=float, default=1.0,
+                        help="Multiplica el volumen por defecto (20k pacientes, 200k citas…). Ej: 0.1")
+    parser.add_argument("--anios", type=int, default=None, help="Años de historia a generar (default 5)")
+    parser.add_argument("--repeticiones", type=int, default=REPETICIONES_DEFAULT)
+    parser.add_argument("--calentamiento", type=int, default=CALENTAMIENTO_DEFAULT)
+    parser.add_argument("--semilla", type=int, default=7)
+    parser.add_argument("--base-dir", type=Path, default=None,
+                        help="Carpeta donde generar/reutilizar la base (se conserva). Default: temporal")
+    parser.add_argument("--solo", default=None, help="Ejecutar solo los casos que contengan este texto")
+    parser.add_argument("--json", type=Path, default=None, help="Guardar resultados en este archivo")
+    parser.add_argument("--comparar", type=Path, default=None, help="JSON de una corrida anterior")
+    parser.add_argument("--umbral", type=float, default=UMBRAL_REGRESION_DEFAULT,
+                        help="Empeoramiento de p95 tolerado al comparar (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    volumen = VolumenDatos().escalado(args.escala)
+    if args.anios:
+        volumen.anios = args.anios
+
+    resultado = ejecutar_benchmarks(
+        volumen,
+        repeticiones=args.repeticiones,
+        calentamiento=args.calentamiento,
+        semilla=args.semilla,
+        base_dir=args.base_dir,
+        filtro=args.solo,
+    )
+
+    if args.json:
+        args.json.parent.mkdir(parents=True, exist_ok=True)
+        args.json.write_text(json.dumps(resultado, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"[bench] Resultados guardados en {args.json}")
+
+    if args.comparar:
+        try:
+            base = json.loads(args.comparar.read_text(encoding="utf-8"))
+        except Exception as ex:
+            print("⚠️ No se pudo leer el JSON de comparación:", ex)
+            return 2
+        if comparar(resultado, base, args.umbral):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,394 @@
+# benchmarks/datos_sinteticos.py
+"""
+Generador de una base de datos sintética "de varios años" para benchmarks.
+
+Crea el esquema con db.init_db() y llena pacientes, citas, historias y
+sesiones (con HTML), empresas y facturas de convenio, gastos, paquetes y
+bloqueos con volúmenes configurables. Todo es determinístico para una misma
+semilla, así dos corridas sobre versiones distintas del código miden lo mismo.
+
+Los datos se insertan con executemany por lotes en conexiones del pool (para
+que los triggers de la app -inicio_min/fin_min, FTS, cumpleaños, resúmenes-
+se ejecuten igual que en producción), no con crear_cita() & cía., que harían
+la generación tan lenta como el propio benchmark. Las sesiones se indexan en
+FTS al final con db.reconstruir_busqueda_clinica().
+"""
+from __future__ import annotations
+
+import random
+from dataclasses import asdict, dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from .. import db
+from ..utils import html_to_plain_text
+
+
+@dataclass
+class VolumenDatos:
+    pacientes: int = 20_000
+    citas: int = 200_000
+    sesiones: int = 60_000
+    facturas: int = 6_000
+    gastos: int = 10_000
+    bloqueos: int = 3_000
+    empresas: int = 25
+    paquetes_arriendo: int = 60
+    anios: int = 5
+
+    def escalado(self, factor: float) -> "VolumenDatos":
+        """Mismo perfil multiplicado por `factor` (los años no cambian)."""
+        datos = asdict(self)
+        for k, v in datos.items():
+            if k != "anios":
+                datos[k] = max(1, int(round(v * factor)))
+        return VolumenDatos(**datos)
+
+
+LOTE_INSERCION = 5_000
+
+_NOMBRES = (
+    "Ana", "María", "Luisa", "Camila", "Valentina", "Sofía", "Daniela", "Laura", "Paula", "Juliana",
+    "Carlos", "Andrés", "Juan", "Santiago", "Felipe", "Sebastián", "David", "Mateo", "Jorge", "Diego",
+)
+_APELLIDOS = (
+    "Gómez", "Rodríguez", "Martínez", "López", "García", "Hernández", "Pérez", "Ramírez", "Sánchez",
+    "Torres", "Díaz", "Castro", "Vargas", "Rojas", "Moreno", "Jiménez", "Ortiz", "Ruiz", "Álvarez",
+)
+_EPS = ("Sura", "Sanitas", "Nueva EPS", "Compensar", "Famisanar", "Salud Total", "")
+_MOTIVOS = (
+    "Ansiedad", "Duelo", "Terapia de pareja", "Estrés laboral", "Seguimiento", "Evaluación inicial",
+    "Depresión", "Orientación familiar",
+)
+_PALABRAS = (
+    "paciente refiere", "sueño", "ansiedad", "familia", "trabajo", "se explora", "tarea terapéutica",
+    "respiración diafragmática", "reestructuración cognitiva", "red de apoyo", "pensamientos",
+    "autoestima", "límites", "emociones", "seguimiento", "plan", "conducta", "registro diario",
+)
+_TIPOS_GASTO = ("arriendo_consultorio", "carro", "hogar", "ocio", "otro")
+
+
+def _lotes(filas: Iterable[Sequence[Any]], tam: int = LOTE_INSERCION) -> Iterator[List[Sequence[Any]]]:
+    lote: List[Sequence[Any]] = []
+    for f in filas:
+        lote.append(f)
+        if len(lote) >= tam:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def _insertar(sql: str, filas: Iterable[Sequence[Any]]) -> int:
+    n = 0
+    conn = db.get_connection()
+    try:
+        cur = conn.cursor()
+        for lote in _lotes(filas):
+            cur.executemany(sql, lote)
+            conn.commit()
+            n += len(lote)
+    finally:
+        conn.close()
+    return n
+
+
+def _texto(rng: random.Random, palabras: int) -> str:
+    return " ".join(rng.choice(_PALABRAS) for _ in range(palabras)).capitalize() + "."
+
+
+def _html_sesion(rng: random.Random) -> str:
+    partes = [f"<p><strong>Motivo:</strong> {rng.choice(_MOTIVOS)}</p>"]
+    for _ in range(rng.randint(2, 6)):
+        partes.append(f"<p>{_texto(rng, rng.randint(20, 60))}</p>")
+    items = "".join(f"<li>{_texto(rng, rng.randint(4, 10))}</li>" for _ in range(rng.randint(2, 5)))
+    partes.append(f"<h3>Plan</h3><ul>{items}</ul>")
+    return "".join(partes)
+
+
+def _fecha_aleatoria(rng: random.Random, inicio: date, dias: int) -> date:
+    d = inicio + timedelta(days=rng.randrange(dias))
+    # Agenda real: casi todo entre semana
+    if d.weekday() >= 5 and rng.random() < 0.85:
+        d -= timedelta(days=d.weekday() - 4)
+    return d
+
+
+def generar_bd_sintetica(volumen: VolumenDatos, semilla: int = 7) -> Dict[str, int]:
+    """
+    Llena la BD apuntada por db.DB_PATH (debe estar vacía) y devuelve
+    {tabla: filas insertadas}. Las fechas terminan hoy y cubren volumen.anios.
+    """
+    rng = random.Random(semilla)
+    db.init_db()
+
+    hoy = date.today()
+    inicio = hoy - timedelta(days=365 * volumen.anios)
+    dias = (hoy - inicio).days + 1
+    conteo: Dict[str, int] = {}
+
+    # ---- Servicios y empresas ----
+    servicios = [
+        ("Consulta individual", "particular", 120_000.0, None),
+        ("Consulta virtual", "particular", 100_000.0, None),
+        ("Terapia de pareja", "particular", 160_000.0, None),
+        ("Consulta convenio", "convenio", 85_000.0, "Convenio"),
+    ]
+    conteo["servicios"] = _insertar(
+        "INSERT OR IGNORE INTO servicios (nombre, modalidad, precio, empresa, activo) VALUES (?, ?, ?, ?, 1);",
+        servicios,
+    )
+    conteo["empresas_convenio"] = _insertar(
+        "INSERT INTO empresas_convenio (nombre, nit, ciudad, pais, email_facturacion) VALUES (?, ?, ?, ?, ?);",
+        (
+            (f"Empresa {i:03d} S.A.S.", f"900{i:06d}-1", "Bogotá", "Colombia", f"facturas{i}@empresa.co")
+            for i in range(1, volumen.empresas + 1)
+        ),
+    )
+
+    # ---- Pacientes ----
+    documentos = [str(10_000_000 + i * 7) for i in range(volumen.pacientes)]
+
+    def _pacientes():
+        for doc in documentos:
+            nombre = f"{rng.choice(_NOMBRES)} {rng.choice(_APELLIDOS)} {rng.choice(_APELLIDOS)}"
+            nacimiento = date(1950, 1, 1) + timedelta(days=rng.randrange(365 * 58))
+            usuario = nombre.split()[0].lower() + doc[-4:]
+            yield (
+                doc, "CC", nombre, nacimiento.isoformat(), rng.choice(("Femenino", "Masculino")),
+                rng.choice(_EPS), f"{usuario}@correo.com", "57", f"3{rng.randrange(10**9):09d}",
+            )
+
+    conteo["pacientes"] = _insertar(
+        """
+        INSERT INTO pacientes (
+            documento, tipo_documento, nombre_completo, fecha_nacimiento, sexo,
+            eps, email, indicativo_pais, telefono
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
+        """,
+        _pacientes(),
+    )
+
+    # ---- Citas ----
+    # Cada paciente tiene un "ritmo": unos pocos concentran muchas citas.
+    pesos = [rng.paretovariate(1.5) for _ in documentos]
+    docs_citas = rng.choices(documentos, weights=pesos, k=volumen.citas)
+
+    def _citas():
+        for doc in docs_citas:
+            d = _fecha_aleatoria(rng, inicio, dias)
+            ini = datetime(d.year, d.month, d.day, rng.randint(7, 19), rng.choice((0, 15, 30, 45)))
+            fin = ini + timedelta(minutes=rng.choice((45, 60, 60, 90)))
+            convenio = rng.random() < 0.2
+            pasada = d < hoy
+            if convenio:
+                precio, canal = 85_000.0, "presencial"
+            else:
+                precio, canal = rng.choice(((120_000.0, "presencial"), (100_000.0, "virtual"), (160_000.0, "presencial")))
+            estado = rng.choice(("confirmado", "confirmado", "confirmado", "no_asistio")) if pasada else "reservado"
+            yield (
+                doc,
+                ini.strftime("%Y-%m-%d %H:%M"),
+                fin.strftime("%Y-%m-%d %H:%M"),
+                "convenio" if convenio else "particular",
+                canal,
+                rng.choice(_MOTIVOS),
+                estado,
+                precio,
+                1 if pasada and rng.random() < 0.9 else 0,
+            )
+
+    conteo["citas"] = _insertar(
+        """
+        INSERT INTO citas (
+            documento_paciente, fecha_hora, fecha_hora_fin, modalidad, canal,
+            motivo, estado, precio, pagado
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
+        """,
+        _citas(),
+    )
+
+    # ---- Historias y sesiones (enlazadas a citas pasadas) ----
+    conn = db.get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT id, documento_paciente, substr(fecha_hora, 1, 10) AS fecha
+        FROM citas
+        WHERE fecha_hora < ?
+        ORDER BY id
+        LIMIT ?;
+        """,
+        (hoy.isoformat(), volumen.sesiones),
+    )
+    citas_sesion = [(r["id"], r["documento_paciente"], r["fecha"]) for r in cur.fetchall()]
+    conn.close()
+
+    con_historia = sorted({doc for _, doc, _ in citas_sesion})
+    conteo["historia_clinica"] = _insertar(
+        """
+        INSERT INTO historia_clinica (documento_paciente, fecha_apertura, motivo_consulta_inicial)
+        VALUES (?, ?, ?);
+        """,
+        ((doc, inicio.isoformat(), rng.choice(_MOTIVOS)) for doc in con_historia),
+    )
+
+    conn = db.get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT id, documento_paciente FROM historia_clinica;")
+    historia_de = {r["documento_paciente"]: r["id"] for r in cur.fetchall()}
+    conn.close()
+
+    def _sesiones():
+        for cita_id, doc, fecha in citas_sesion:
+            html = _html_sesion(rng)
+            yield (
+                historia_de[doc], fecha, rng.choice(_MOTIVOS), html_to_plain_text(html), html,
+                _texto(rng, 8), cita_id, f"{fecha} 18:00:00",
+            )
+
+    conteo["sesiones_clinicas"] = _insertar(
+        """
+        INSERT INTO sesiones_clinicas (
+            historia_id, fecha, titulo, contenido, contenido_html, observaciones, cita_id, fecha_registro
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+        """,
+        _sesiones(),
+    )
+    # El índice FTS de sesiones no lo mantiene un trigger (ver db._indexar_sesiones)
+    db.reconstruir_busqueda_clinica()
+
+    # ---- Facturas de convenio ----
+    def _facturas():
+        for i in range(1, volumen.facturas + 1):
+            doc = rng.choice(documentos)
+            d = _fecha_aleatoria(rng, inicio, dias)
+            sesiones_fact = rng.randint(1, 8)
+            subtotal = 85_000.0 * sesiones_fact
+            estado = "pagada" if d < hoy - timedelta(days=60) else rng.choice(("pendiente", "pagada"))
+            if rng.random() < 0.03:
+                estado = "anulada"
+            yield (
+                f"PS{i:04d}", d.isoformat(), rng.randint(1, volumen.empresas), doc, f"Paciente {doc}",
+                subtotal, 0.0, subtotal, "Transferencia", estado,
+            )
+
+    conteo["facturas_convenio"] = _insertar(
+        """
+        INSERT INTO facturas_convenio (
+            numero, fecha, empresa_id, paciente_documento, paciente_nombre,
+            subtotal, iva, total, forma_pago, estado
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+        """,
+        _facturas(),
+    )
+    conteo["facturas_convenio_detalle"] = _insertar(
+        """
+        INSERT INTO facturas_convenio_detalle (factura_id, descripcion, cantidad, valor_unitario, valor_total)
+        SELECT id, 'Sesiones de psicología', subtotal / 85000.0, 85000.0, subtotal
+        FROM facturas_convenio WHERE id = ?;
+        """,
+        ((i,) for i in range(1, volumen.facturas + 1)),
+    )
+    conn = db.get_connection()
+    conn.execute(
+        """
+        INSERT INTO configuracion_facturacion (id, prefijo_factura, ultimo_consecutivo) VALUES (1, 'PS', ?)
+        ON CONFLICT(id) DO UPDATE SET ultimo_consecutivo = excluded.ultimo_consecutivo;
+        """,
+        (volumen.facturas,),
+    )
+    conn.commit()
+    conn.close()
+
+    # ---- Gastos, paquetes de arriendo y consumos ----
+    conteo["gastos_financieros"] = _insertar(
+        "INSERT INTO gastos_financieros (fecha, tipo, descripcion, monto) VALUES (?, ?, ?, ?);",
+        (
+            (
+                _fecha_aleatoria(rng, inicio, dias).isoformat(),
+                rng.choice(_TIPOS_GASTO),
+                _texto(rng, 3),
+                float(rng.randrange(20, 2_000) * 1_000),
+            )
+            for _ in range(volumen.gastos)
+        ),
+    )
+
+    conteo["paquetes_arriendo"] = _insertar(
+        "INSERT INTO paquetes_arriendo (fecha_compra, cantidad_citas, costo_total, citas_usadas, notas) VALUES (?, ?, ?, 0, ?);",
+        (
+            (
+                (inicio + timedelta(days=i * dias // volumen.paquetes_arriendo)).isoformat(),
+                40,
+                1_600_000.0,
+                f"Paquete {i + 1}",
+            )
+            for i in range(volumen.paquetes_arriendo)
+        ),
+    )
+
+    conn = db.get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT id, fecha_compra FROM paquetes_arriendo ORDER BY fecha_compra, id;")
+    paquetes = [(r["id"], r["fecha_compra"]) for r in cur.fetchall()]
+    cur.execute(
+        """
+        SELECT id, substr(fecha_hora, 1, 10) AS fecha FROM citas
+        WHERE canal = 'presencial' AND fecha_hora < ?
+        ORDER BY fecha_hora, id;
+        """,
+        (hoy.isoformat(),),
+    )
+    presenciales = [(r["id"], r["fecha"]) for r in cur.fetchall()]
+    conn.close()
+
+    def _consumos():
+        # Cada paquete cubre hasta 40 citas presenciales posteriores a su compra
+        j = 0
+        for k, (paquete_id, compra) in enumerate(paquetes):
+            limite = paquetes[k + 1][1] if k + 1 < len(paquetes) else "9999"
+            usadas = 0
+            while j < len(presenciales) and presenciales[j][1] < compra:
+                j += 1
+            while j < len(presenciales) and usadas < 40 and presenciales[j][1] < limite:
+                yield (paquete_id, presenciales[j][0], presenciales[j][1], "agenda")
+                usadas += 1
+                j += 1
+
+    conteo["consumo_paquetes_arriendo"] = _insertar(
+        "INSERT INTO consumo_paquetes_arriendo (paquete_id, cita_id, fecha_consumo, consumido_por) VALUES (?, ?, ?, ?);",
+        _consumos(),
+    )
+    conn = db.get_connection()
+    conn.execute(
+        """
+        UPDATE paquetes_arriendo
+        SET citas_usadas = (SELECT COUNT(*) FROM consumo_paquetes_arriendo c WHERE c.paquete_id = paquetes_arriendo.id);
+        """
+    )
+    conn.commit()
+    conn.close()
+
+    # ---- Bloqueos de agenda ----
+    def _bloqueos():
+        for _ in range(volumen.bloqueos):
+            d = _fecha_aleatoria(rng, inicio, dias)
+            ini = datetime(d.year, d.month, d.day, rng.choice((7, 8, 12, 14)), 0)
+            fin = ini + timedelta(hours=rng.choice((1, 2, 4)))
+            yield (rng.choice(("Almuerzo", "Supervisión", "Capacitación", "Personal")),
+                   ini.strftime("%Y-%m-%d %H:%M"), fin.strftime("%Y-%m-%d %H:%M"))
+
+    conteo["bloqueos_agenda"] = _insertar(
+        "INSERT INTO bloqueos_agenda (motivo, fecha_hora_inicio, fecha_hora_fin) VALUES (?, ?, ?);",
+        _bloqueos(),
+    )
+
+    db.marcar_agenda_modificada()
+    return conteo
+
+
+def rango_fechas(volumen: VolumenDatos) -> Tuple[date, date]:
+    """(primer día, último día) que cubren los datos generados."""
+    hoy = date.today()
+    return hoy - timedelta(days=365 * volumen.anios), hoy
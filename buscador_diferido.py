@@ -0,0 +1,99 @@
+# buscador_diferido.py
+"""
+Búsqueda "mientras se escribe" con retardo (debounce) y descarte de resultados viejos.
+
+Cada tecla llama a BuscadorDiferido.solicitar(texto). La búsqueda real se
+ejecuta en un hilo aparte cuando el usuario deja de escribir `retraso`
+segundos; si mientras tanto llega otra tecla, la búsqueda pendiente se cancela
+y cualquier resultado de una búsqueda ya en curso se descarta. Así, escribir
+"maria" rápido hace una sola búsqueda y un solo page.update().
+"""
+import threading
+from typing import Any, Callable, List, Optional
+
+
+RETRASO_DEFAULT = 0.25  # segundos
+MAX_RESULTADOS_DEFAULT = 30
+
+
+class BuscadorDiferido:
+    """
+    buscar(texto) -> lista       se ejecuta fuera del hilo de la UI
+    mostrar(texto, resultados)   pinta los resultados (ya recortados a max_resultados)
+
+    Si el texto tiene menos de `min_caracteres`, se llama mostrar(texto, [])
+    de inmediato, sin buscar.
+    """
+
+    def __init__(
+        self,
+        buscar: Callable[[str], List[Any]],
+        mostrar: Callable[[str, List[Any]], None],
+        retraso: float = RETRASO_DEFAULT,
+        max_resultados: Optional[int] = MAX_RESULTADOS_DEFAULT,
+        min_caracteres: int = 1,
+    ):
+        self._buscar = buscar
+        self._mostrar = mostrar
+        self.retraso = max(0.0, float(retraso))
+        self.max_resultados = max_resultados
+        self.min_caracteres = max(0, int(min_caracteres))
+
+        self._lock = threading.RLock()
+        self._generacion = 0
+        self._timer: Optional[threading.Timer] = None
+
+    def _vigente(self, generacion: int) -> bool:
+        return generacion == self._generacion
+
+    def solicitar(self, texto: Optional[str]) -> None:
+        """Programa una búsqueda para `texto`, cancelando la anterior."""
+        texto = (texto or "").strip()
+        with self._lock:
+            self._generacion += 1
+            generacion = self._generacion
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            if len(texto) < self.min_caracteres:
+                vacio = True
+            else:
+                vacio = False
+                self._timer = threading.Timer(self.retraso, self._ejecutar, args=(generacion, texto))
+                self._timer.daemon = True
+                self._timer.start()
+
+        if vacio:
+            self._entregar(generacion, texto, [])
+
+    def cancelar(self) -> None:
+        """Descarta la búsqueda pendiente y cualquier resultado en curso."""
+        with self._lock:
+            self._generacion += 1
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _ejecutar(self, generacion: int, texto: str) -> None:
+        if not self._vigente(generacion):
+            return
+        try:
+            resultados = list(self._buscar(texto) or [])
+        except Exception as ex:
+            print("⚠️ Error en búsqueda:", ex)
+            resultados = []
+        if self.max_resultados is not None:
+            resultados = resultados[: self.max_resultados]
+        self._entregar(generacion, texto, resultados)
+
+    def _entregar(self, generacion: int, texto: str, resultados: List[Any]) -> None:
+        # Se revisa la generación con el lock tomado para que una búsqueda
+        # vieja nunca pinte encima de una más nueva.
+        with self._lock:
+            if not self._vigente(generacion):
+                return
+            try:
+                self._mostrar(texto, resultados)
+            except Exception as ex:
+                print("⚠️ Error mostrando resultados:", ex)
@@ -0,0 +1,239 @@
+# busqueda_pacientes.py
+"""
+Índice en memoria para buscar pacientes por nombre, documento, teléfono o email.
+
+- Texto normalizado: minúsculas y sin tildes ("Ramírez" == "ramirez").
+- Búsqueda por prefijo de cada palabra con bisect sobre una lista ordenada de
+  claves (token, documento); varias palabras se combinan con AND.
+- Teléfonos indexados por sus dígitos, tal cual y normalizados con
+  utils.normalize_phone_co (sirve "3001234567" y "573001234567").
+- Si el prefijo no encuentra nada se intenta por subcadena y, por último,
+  con coincidencia aproximada (errores de tipeo).
+
+Se construye la primera vez que se usa y se actualiza paciente por paciente
+con los avisos de db.crear_paciente / actualizar_paciente / eliminar_paciente.
+"""
+import difflib
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from . import db
+from .utils import normalize_phone_co
+
+
+LIMITE_RESULTADOS_DEFAULT = 50
+
+# Puntajes de ranking (mayor = mejor)
+_P_DOCUMENTO_EXACTO = 100
+_P_NOMBRE_EMPIEZA = 40
+_P_TOKEN_EXACTO = 10
+_P_TOKEN_PREFIJO = 5
+_P_SUBCADENA = 2
+_P_APROXIMADO = 1
+
+
+def normalizar_texto(s: Any) -> str:
+    """Minúsculas, sin tildes y con cualquier separador convertido en espacio."""
+    s = unicodedata.normalize("NFKD", str(s or "").lower())
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    return "".join(ch if ch.isalnum() else " " for ch in s)
+
+
+def tokens(s: Any) -> List[str]:
+    return normalizar_texto(s).split()
+
+
+def _digitos(s: Any) -> str:
+    return "".join(ch for ch in str(s or "") if ch.isdigit())
+
+
+def _claves_paciente(p: Dict[str, Any]) -> Set[str]:
+    claves: Set[str] = set(tokens(p.get("nombre_completo")))
+
+    doc = normalizar_texto(p.get("documento")).replace(" ", "")
+    if doc:
+        claves.add(doc)
+
+    email = str(p.get("email") or "").strip().lower()
+    if email:
+        claves.add(email)
+        claves.update(tokens(email))
+
+    tel = str(p.get("telefono") or "")
+    for variante in (_digitos(tel), _digitos(normalize_phone_co(tel))):
+        if variante:
+            claves.add(variante)
+
+    return claves
+
+
+def _texto_completo(p: Dict[str, Any]) -> str:
+    """Texto para la búsqueda por subcadena (mismo criterio que los filtros viejos)."""
+    partes = [
+        normalizar_texto(p.get("nombre_completo")),
+        normalizar_texto(p.get("documento")),
+        str(p.get("email") or "").lower(),
+        _digitos(p.get("telefono")),
+    ]
+    return " ".join(partes)
+
+
+class IndicePacientes:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._construido = False
+        self._ruta: Optional[str] = None
+        self._pacientes: Dict[str, Dict[str, Any]] = {}
+        self._claves_por_doc: Dict[str, Set[str]] = {}
+        self._claves: List[Tuple[str, str]] = []  # (clave, documento) ordenado
+        self._textos: Dict[str, str] = {}
+
+    # ------------ construcción / actualización -------------
+
+    def _asegurar(self) -> None:
+        ruta = str(db.DB_PATH)
+        if self._construido and self._ruta == ruta:
+            return
+        filas = [dict(r) for r in db.listar_pacientes()]
+        self._pacientes = {}
+        self._claves_por_doc = {}
+        self._textos = {}
+        claves: List[Tuple[str, str]] = []
+        for p in filas:
+            doc = str(p.get("documento") or "")
+            ks = _claves_paciente(p)
+            self._pacientes[doc] = p
+            self._claves_por_doc[doc] = ks
+            self._textos[doc] = _texto_completo(p)
+            claves.extend((k, doc) for k in ks)
+        claves.sort()
+        self._claves = claves
+        self._ruta = ruta
+        self._construido = True
+
+    def invalidar(self) -> None:
+        with self._lock:
+            self._construido = False
+
+    def _quitar(self, doc: str) -> None:
+        for k in self._claves_por_doc.pop(doc, ()):
+            i = bisect_left(self._claves, (k, doc))
+            if i < len(self._claves) and self._claves[i] == (k, doc):
+                del self._claves[i]
+        self._pacientes.pop(doc, None)
+        self._textos.pop(doc, None)
+
+    def actualizar(self, documento: Optional[str]) -> None:
+        """Refleja el estado actual de la BD para `documento` (None = reconstruir todo)."""
+        with self._lock:
+            if documento is None:
+                self._construido = False
+                return
+            if not self._construido:
+                return  # se construirá completo al primer uso
+
+            doc = str(documento)
+            self._quitar(doc)
+            fila = db.obtener_paciente(doc)
+            if fila is None:
+                return
+            p = dict(fila)
+            ks = _claves_paciente(p)
+            self._pacientes[doc] = p
+            self._claves_por_doc[doc] = ks
+            self._textos[doc] = _texto_completo(p)
+            for k in ks:
+                insort(self._claves, (k, doc))
+
+    # ------------ consultas -------------
+
+    def _docs_con_prefijo(self, prefijo: str) -> Dict[str, int]:
+        """documento -> mejor puntaje del token (exacto > prefijo)."""
+        encontrados: Dict[str, int] = {}
+        i = bisect_left(self._claves, (prefijo, ""))
+        claves = self._claves
+        while i < len(claves) and claves[i][0].startswith(prefijo):
+            clave, doc = claves[i]
+            puntaje = _P_TOKEN_EXACTO if clave == prefijo else _P_TOKEN_PREFIJO
+            if puntaje > encontrados.get(doc, 0):
+                encontrados[doc] = puntaje
+            i += 1
+        return encontrados
+
+    def _docs_aproximados(self, token: str) -> Dict[str, int]:
+        if len(token) < 3:
+            return {}
+        vocabulario = sorted({k for k, _ in self._claves})
+        encontrados: Dict[str, int] = {}
+        for parecido in difflib.get_close_matches(token, vocabulario, n=5, cutoff=0.8):
+            for doc in self._docs_con_prefijo(parecido):
+                encontrados[doc] = _P_APROXIMADO
+        return encontrados
+
+    def buscar(self, texto: str, limite: Optional[int] = LIMITE_RESULTADOS_DEFAULT) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._asegurar()
+            q_tokens = tokens(texto)
+            # Un teléfono escrito con espacios ("300 123 4567") se busca también junto
+            q_digitos = _digitos(texto)
+            if not q_tokens:
+                return []
+
+            puntajes: Optional[Dict[str, int]] = None
+            for tok in q_tokens:
+                por_token = self._docs_con_prefijo(tok)
+                if puntajes is None:
+                    puntajes = por_token
+                else:
+                    puntajes = {d: puntajes[d] + s for d, s in por_token.items() if d in puntajes}
+                if not puntajes:
+                    break
+
+            if not puntajes and q_digitos and len(q_digitos) >= 3:
+                puntajes = self._docs_con_prefijo(q_digitos)
+
+            if not puntajes:
+                # Respaldo: subcadena (como los filtros anteriores) y luego aproximado
+                q = " ".join(q_tokens)
+                puntajes = {d: _P_SUBCADENA for d, t in self._textos.items() if q in t}
+            if not puntajes:
+                for tok in q_tokens:
+                    for d, s in self._docs_aproximados(tok).items():
+                        puntajes[d] = puntajes.get(d, 0) + s
+
+            q_doc = "".join(q_tokens)
+            q_nombre = " ".join(q_tokens)
+            ranking = []
+            for doc, puntaje in puntajes.items():
+                p = self._pacientes.get(doc)
+                if p is None:
+                    continue
+                nombre = normalizar_texto(p.get("nombre_completo"))
+                if normalizar_texto(doc).replace(" ", "") == q_doc:
+                    puntaje += _P_DOCUMENTO_EXACTO
+                if " ".join(nombre.split()).startswith(q_nombre):
+                    puntaje += _P_NOMBRE_EMPIEZA
+                ranking.append((-puntaje, nombre, doc))
+            ranking.sort()
+
+            if limite is not None:
+                ranking = ranking[:limite]
+            return [dict(self._pacientes[doc]) for _, _, doc in ranking]
+
+
+_INDICE = IndicePacientes()
+db.registrar_oyente_pacientes(_INDICE.actualizar)
+
+
+def buscar_pacientes(texto: str, limite: Optional[int] = LIMITE_RESULTADOS_DEFAULT) -> List[Dict[str, Any]]:
+    """
+    Pacientes que coinciden con `texto`, mejor coincidencia primero.
+    limite=None devuelve todos los resultados.
+    """
+    return _INDICE.buscar(texto, limite)
+
+
+def invalidar_indice_pacientes() -> None:
+    _INDICE.invalidar()
@@ -2,6 +2,7 @@ import flet as ft
 from datetime import date, datetime, timedelta
 
 from .db import listar_citas_con_paciente_rango, eliminar_cita, get_connection
+from .agenda_slots import fecha_hora_de_fila
 
 
 def _month_start(d: date) -> date:
@@ -28,17 +29,6 @@ def _fmt_money(value) -> str:
         return str(value or "")
 
 
-def _parse_fecha_hora(fecha_hora: str) -> datetime | None:
-    if not fecha_hora:
-        return None
-    for fmt in ("%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S"):
-        try:
-            return datetime.strptime(fecha_hora, fmt)
-        except Exception:
-            pass
-    return None
-
-
 def build_citas_tabla_view(
     page: ft.Page,
     *,
@@ -213,7 +203,7 @@ def build_citas_tabla_view(
         
     def _texto_confirmacion(r: dict) -> str:
         paciente = (r.get("nombre_completo") or "").strip() or "Paciente"
-        dt = _parse_fecha_hora(r.get("fecha_hora"))
+        dt = fecha_hora_de_fila(r)
         when = dt.strftime("%Y-%m-%d %H:%M") if dt else (r.get("fecha_hora") or "")
         return f"¿Cancelar esta cita?\n\n{paciente}\n{when}"
 
@@ -307,7 +297,7 @@ def build_citas_tabla_view(
         data_rows: list[ft.DataRow] = []
 
         for r in rows:
-            dt = _parse_fecha_hora(r.get("fecha_hora"))
+            dt = fecha_hora_de_fila(r)
             fecha = dt.strftime("%Y-%m-%d") if dt else (r.get("fecha_hora") or "")
             hora = dt.strftime("%H:%M") if dt else ""
             paciente = r.get("nombre_completo") or ""
@@ -368,7 +358,7 @@ def build_citas_tabla_view(
             tiene_sesion = bool(r.get("tiene_sesion"))
             estado_cita = (r.get("estado") or "").strip().lower()
 
-            dt = _parse_fecha_hora(r.get("fecha_hora"))
+            dt = fecha_hora_de_fila(r)
             ya_ocurrio = bool(dt) and (dt <= datetime.now())
 
             es_no_asistio = estado_cita in {"no asistió", "no asistio", "no_asistio", "no-asistio"}
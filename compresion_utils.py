@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import zlib
+from typing import Any
+
+try:
+    import zstandard  # type: ignore
+except Exception:  # pragma: no cover
+    zstandard = None  # type: ignore
+
+# Igual que el "enc::" de crypto_utils, un prefijo marca el formato del valor
+# guardado. Los comprimidos se guardan como BLOB (bytes) para no pagar base64;
+# un TEXT sin prefijo es HTML plano (filas viejas o compresión apagada).
+_ZLIB_PREFIX = b"zlib::"
+_ZSTD_PREFIX = b"zstd::"
+
+ALGORITMOS_COMPRESION = ("zlib", "zstd")
+
+# Por debajo de esto la cabecera de zlib/zstd se come la ganancia
+COMPRESION_MIN_BYTES = 512
+
+_ZLIB_NIVEL = 6
+_ZSTD_NIVEL = 9
+
+
+def zstd_disponible() -> bool:
+    return zstandard is not None
+
+
+def is_compressed(value: Any) -> bool:
+    return isinstance(value, (bytes, bytearray, memoryview)) and bytes(value[:6]) in (_ZLIB_PREFIX, _ZSTD_PREFIX)
+
+
+def compress_str(plain: str | None, algoritmo: str = "zlib", minimo: int = COMPRESION_MIN_BYTES) -> Any:
+    """
+    Devuelve prefijo + datos comprimidos (bytes), o el texto tal cual si es
+    corto o si comprimirlo no ahorra espacio.
+    """
+    if not plain:
+        return plain
+    datos = plain.encode("utf-8")
+    if len(datos) < minimo:
+        return plain
+
+    if algoritmo == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Falta dependencia 'zstandard'. Instala con: pip install zstandard")
+        comprimido = _ZSTD_PREFIX + zstandard.ZstdCompressor(level=_ZSTD_NIVEL).compress(datos)
+    elif algoritmo == "zlib":
+        comprimido = _ZLIB_PREFIX + zlib.compress(datos, _ZLIB_NIVEL)
+    else:
+        raise ValueError(f"Algoritmo de compresión desconocido: {algoritmo}")
+
+    return comprimido if len(comprimido) < len(datos) else plain
+
+
+def decompress_str(value: Any) -> str:
+    """Texto original de un valor guardado con compress_str (o el texto si no estaba comprimido)."""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+
+    datos = bytes(value)
+    prefijo, cuerpo = datos[:6], datos[6:]
+    if prefijo == _ZLIB_PREFIX:
+        return zlib.decompress(cuerpo).decode("utf-8")
+    if prefijo == _ZSTD_PREFIX:
+        if zstandard is None:
+            raise RuntimeError("Falta dependencia 'zstandard'. Instala con: pip install zstandard")
+        return zstandard.ZstdDecompressor().decompress(cuerpo).decode("utf-8")
+    # BLOB sin prefijo: texto guardado como bytes
+    return datos.decode("utf-8", errors="replace")
@@ -1,10 +1,21 @@
 from __future__ import annotations
 import sqlite3
 from pathlib import Path
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Callable, Dict, List, Any, Iterable, Iterator, Optional, Tuple
 from datetime import date, datetime, timedelta
+from collections import OrderedDict
+from contextlib import contextmanager
+import json
 import os
+import re
 import sys
+import threading
+import time
+import weakref
+
+from .compresion_utils import ALGORITMOS_COMPRESION, compress_str, decompress_str, zstd_disponible
+from .fechas import parse_fecha
+from .utils import html_to_plain_text
 
 
 # ----------------- Reglas de negocio de citas -----------------
@@ -63,22 +74,1376 @@ FACTURAS_DIR = DATA_DIR / "facturas_pdf"
 HISTORIAS_DIR = DATA_DIR / "historias_pdf"
 
 
-def get_connection() -> sqlite3.Connection:
-    """Devuelve una conexión a la base de datos SQLite."""
-    conn = sqlite3.connect(DB_PATH)
+# ------------ POOL DE CONEXIONES -------------
+#
+# Cada función de este módulo hace get_connection() -> consulta -> close().
+# Para no pagar connect/PRAGMA/teardown en cada llamada, get_connection()
+# entrega conexiones reutilizables de un pool: close() las devuelve al pool
+# (con rollback de lo que no se haya hecho commit, igual que un close real).
+#
+# - La UI de Flet, los threading.Thread de agenda y el ThreadingHTTPServer del
+#   editor enriquecido comparten el pool; una conexión solo la usa un hilo a la
+#   vez y, al pedir otra, cada hilo prefiere la última que usó.
+# - Tamaño configurable (SARA_DB_POOL_SIZE o configurar_pool()).
+# - Si el pool está agotado se espera; si el hilo ya tiene una conexión prestada
+#   (llamadas anidadas) o se agota la espera, se abre una conexión "desborde"
+#   fuera del pool para no bloquear la app.
+# - Una conexión prestada que nunca vuelve (una excepción antes del close())
+#   no retiene su lugar: al recolectarse, un weakref.finalize la descuenta.
+
+POOL_MAX_CONEXIONES_DEFAULT = 8
+POOL_TIMEOUT_ESPERA_DEFAULT = 5.0
+
+
+class _Prestamo:
+    """Estado de préstamo de una conexión; lo comparten la conexión y su finalizador."""
+
+    __slots__ = ("prestada", "hilo")
+
+    def __init__(self):
+        self.prestada = False
+        self.hilo: Optional[int] = None
+
+
+class _ConexionPool(sqlite3.Connection):
+    """Conexión SQLite cuyo close() la devuelve al pool en vez de cerrarla."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool: Optional["PoolConexiones"] = None
+        self._prestamo = _Prestamo()
+        self._finalizador: Optional[weakref.finalize] = None
+        self._generacion = -1
+        # Perfilado (ver PERFILADO DE CONSULTAS): función que pidió la conexión
+        self._perfil_funcion: Optional[str] = None
+        self._perfil_t0 = 0.0
+
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = _CursorPerfilado if self._perfil_funcion is not None else sqlite3.Cursor
+        return super().cursor(factory)
+
+    def close(self) -> None:
+        if self._perfil_funcion is not None:
+            _PERFIL.registrar_funcion(self._perfil_funcion, (time.perf_counter() - self._perfil_t0) * 1000.0)
+            self._perfil_funcion = None
+        pool = self._pool
+        if pool is None:
+            super().close()
+            return
+        if self._prestamo.prestada:
+            pool.devolver(self)
+
+    def _cerrar_real(self) -> None:
+        self._pool = None
+        if self._finalizador is not None:
+            self._finalizador.detach()
+            self._finalizador = None
+        try:
+            sqlite3.Connection.close(self)
+        except Exception:
+            pass
+
+
+def _texto_plano_html(valor: Any) -> str:
+    texto = decompress_str(valor)
+    if "<" not in texto and "&" not in texto:
+        return texto
+    return html_to_plain_text(texto)
+
+
+def _abrir_conexion(ruta: str) -> _ConexionPool:
+    conn = sqlite3.connect(ruta, timeout=5, check_same_thread=False, factory=_ConexionPool)
     # Activar foreign keys en SQLite
     conn.execute("PRAGMA foreign_keys = ON;")
+    # synchronous / cache_size / mmap_size / temp_store (ver ALMACENAMIENTO)
+    _aplicar_pragmas_conexion(conn)
+    # contenido_html puede estar comprimido (ver COMPRESIÓN DE NOTAS). Solo para
+    # lecturas: los triggers usan SQL estándar para que otros clientes de SQLite
+    # (DB Browser, sqlite3 CLI, scripts) puedan seguir escribiendo en la BD.
+    conn.create_function("descomprimir_html", 1, decompress_str, deterministic=True)
     # Para poder obtener filas como diccionarios si se quiere
     conn.row_factory = sqlite3.Row
     return conn
 
 
+class PoolConexiones:
+    """
+    Pool de conexiones SQLite thread-safe.
+
+    Lleva contadores (checkouts, reutilizadas, creadas, esperas, desbordes)
+    para poder ver en admin/diagnóstico cuánto overhead se ahorra.
+    """
+
+    def __init__(
+        self,
+        max_conexiones: int = POOL_MAX_CONEXIONES_DEFAULT,
+        timeout_espera: float = POOL_TIMEOUT_ESPERA_DEFAULT,
+    ):
+        self.max_conexiones = max(1, int(max_conexiones))
+        self.timeout_espera = float(timeout_espera)
+        # RLock: el finalizador de una conexión perdida puede correr (gc) en
+        # cualquier hilo, incluso uno que ya tiene el lock tomado.
+        self._cond = threading.Condition(threading.RLock())
+        self._libres: List[_ConexionPool] = []
+        self._abiertas = 0
+        self._ruta = ""
+        self._generacion = 0
+        # hilo -> conexiones prestadas a ese hilo (para detectar llamadas anidadas)
+        self._prestadas: Dict[int, int] = {}
+        self._stats = {
+            "checkouts": 0,
+            "reutilizadas": 0,
+            "creadas": 0,
+            "esperas": 0,
+            "tiempo_espera_ms": 0.0,
+            "desbordes": 0,
+            "descartadas": 0,
+            "reclamadas": 0,
+        }
+
+    # -- helpers internos (llamar con el lock tomado) --
+
+    def _sincronizar_ruta(self) -> str:
+        """Si DB_PATH cambió (tests/benchmarks/restauración), descarta conexiones viejas."""
+        ruta = str(DB_PATH)
+        if ruta != self._ruta:
+            for c in self._libres:
+                c._cerrar_real()
+            self._abiertas -= len(self._libres)
+            self._libres = []
+            self._ruta = ruta
+            self._generacion += 1
+        return ruta
+
+    def _tomar_libre(self, hilo: int) -> Optional[_ConexionPool]:
+        if not self._libres:
+            return None
+        for i in range(len(self._libres) - 1, -1, -1):
+            if self._libres[i]._prestamo.hilo == hilo:
+                return self._libres.pop(i)
+        return self._libres.pop()
+
+    def _marcar_prestada(self, conn: _ConexionPool, hilo: int) -> None:
+        conn._prestamo.prestada = True
+        conn._prestamo.hilo = hilo
+        self._prestadas[hilo] = self._prestadas.get(hilo, 0) + 1
+
+    def _descontar_prestada(self, hilo: Optional[int]) -> None:
+        n = self._prestadas.get(hilo, 0) - 1
+        if n > 0:
+            self._prestadas[hilo] = n
+        else:
+            self._prestadas.pop(hilo, None)
+
+    def _reclamar(self, prestamo: _Prestamo) -> None:
+        """Finalizador: la conexión se recolectó sin cerrarse; liberar su lugar."""
+        with self._cond:
+            self._abiertas -= 1
+            if prestamo.prestada:
+                prestamo.prestada = False
+                self._descontar_prestada(prestamo.hilo)
+                self._stats["reclamadas"] += 1
+            self._cond.notify()
+
+    # -- API --
+
+    def obtener(self) -> sqlite3.Connection:
+        hilo = threading.get_ident()
+        conn: Optional[_ConexionPool] = None
+        crear = False
+        desborde = False
+
+        with self._cond:
+            ruta = self._sincronizar_ruta()
+            generacion = self._generacion
+            self._stats["checkouts"] += 1
+            t0: Optional[float] = None
+
+            while True:
+                conn = self._tomar_libre(hilo)
+                if conn is not None:
+                    self._stats["reutilizadas"] += 1
+                    break
+                if self._abiertas < self.max_conexiones:
+                    self._abiertas += 1
+                    crear = True
+                    break
+                if self._prestadas.get(hilo, 0) > 0:
+                    # Llamada anidada en el mismo hilo: esperar podría bloquearnos.
+                    desborde = True
+                    break
+
+                if t0 is None:
+                    t0 = time.perf_counter()
+                    self._stats["esperas"] += 1
+                restante = self.timeout_espera - (time.perf_counter() - t0)
+                if restante <= 0 or not self._cond.wait(restante):
+                    if not self._libres and self._abiertas >= self.max_conexiones:
+                        desborde = True
+                        break
+
+            if t0 is not None:
+                self._stats["tiempo_espera_ms"] += (time.perf_counter() - t0) * 1000.0
+
+            if desborde:
+                self._stats["desbordes"] += 1
+            if crear:
+                self._stats["creadas"] += 1
+            elif not desborde:
+                self._marcar_prestada(conn, hilo)
+
+        if desborde:
+            # Conexión fuera del pool: su close() la cierra de verdad.
+            return _abrir_conexion(ruta)
+
+        if crear:
+            try:
+                conn = _abrir_conexion(ruta)
+            except Exception:
+                with self._cond:
+                    self._abiertas -= 1
+                    self._cond.notify()
+                raise
+
+            with self._cond:
+                conn._pool = self
+                conn._generacion = generacion
+                conn._finalizador = weakref.finalize(conn, self._reclamar, conn._prestamo)
+                conn._finalizador.atexit = False
+                self._marcar_prestada(conn, hilo)
+        return conn
+
+    def devolver(self, conn: _ConexionPool) -> None:
+        descartar = False
+        try:
+            if conn.in_transaction:
+                # Igual que un close() real: lo que no tuvo commit se descarta.
+                conn.rollback()
+            conn.row_factory = sqlite3.Row
+        except Exception:
+            descartar = True
+
+        with self._cond:
+            conn._prestamo.prestada = False
+            self._descontar_prestada(conn._prestamo.hilo)
+            if descartar or conn._generacion != self._generacion or len(self._libres) >= self.max_conexiones:
+                self._stats["descartadas"] += 1
+                self._abiertas -= 1
+                conn._cerrar_real()
+            else:
+                self._libres.append(conn)
+            self._cond.notify()
+
+    def configurar(self, max_conexiones: Optional[int] = None, timeout_espera: Optional[float] = None) -> None:
+        with self._cond:
+            if max_conexiones is not None:
+                self.max_conexiones = max(1, int(max_conexiones))
+                while len(self._libres) > self.max_conexiones:
+                    self._libres.pop(0)._cerrar_real()
+                    self._abiertas -= 1
+            if timeout_espera is not None:
+                self.timeout_espera = float(timeout_espera)
+            self._cond.notify_all()
+
+    def cerrar_todas(self) -> None:
+        """Cierra las conexiones libres (las prestadas se cierran al devolverse)."""
+        with self._cond:
+            for c in self._libres:
+                c._cerrar_real()
+            self._abiertas -= len(self._libres)
+            self._libres = []
+            # Las prestadas se descartan al volver
+            self._generacion += 1
+            self._cond.notify_all()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self._stats)
+            stats["tiempo_espera_ms"] = round(stats["tiempo_espera_ms"], 3)
+            stats["max_conexiones"] = self.max_conexiones
+            stats["abiertas"] = self._abiertas
+            stats["libres"] = len(self._libres)
+            stats["en_uso"] = self._abiertas - len(self._libres)
+            return stats
+
+    def reiniciar_estadisticas(self) -> None:
+        with self._cond:
+            for k in self._stats:
+                self._stats[k] = 0.0 if k == "tiempo_espera_ms" else 0
+
+
+def _pool_size_env() -> int:
+    try:
+        return int(os.environ.get("SARA_DB_POOL_SIZE") or POOL_MAX_CONEXIONES_DEFAULT)
+    except ValueError:
+        return POOL_MAX_CONEXIONES_DEFAULT
+
+
+_POOL = PoolConexiones(max_conexiones=_pool_size_env())
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Devuelve una conexión a la base de datos SQLite (reutilizada del pool).
+    Llamar conn.close() al terminar la devuelve al pool.
+    """
+    conn = _POOL.obtener()
+    if _PERFIL.activo:
+        conn._perfil_funcion = _funcion_llamadora(sys._getframe(1))
+        conn._perfil_t0 = time.perf_counter()
+    return conn
+
+
+def configurar_pool(max_conexiones: Optional[int] = None, timeout_espera: Optional[float] = None) -> None:
+    """Ajusta el tamaño del pool y/o el tiempo máximo de espera (segundos)."""
+    _POOL.configurar(max_conexiones=max_conexiones, timeout_espera=timeout_espera)
+
+
+def estadisticas_pool() -> Dict[str, Any]:
+    """Contadores del pool: checkouts, reutilizadas, creadas, esperas, desbordes, etc."""
+    return _POOL.estadisticas()
+
+
+def cerrar_pool() -> None:
+    """Cierra las conexiones del pool (p. ej. antes de restaurar un backup)."""
+    _POOL.cerrar_todas()
+
+
+@contextmanager
+def conexion() -> Iterator[sqlite3.Connection]:
+    """
+    Context manager de solo préstamo:
+        with conexion() as conn:
+            conn.execute(...)
+    """
+    conn = get_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def transaccion() -> Iterator[sqlite3.Connection]:
+    """
+    Context manager transaccional: commit si el bloque termina bien,
+    rollback si lanza excepción. Siempre devuelve la conexión al pool.
+    """
+    conn = get_connection()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+# ------------ ALMACENAMIENTO (WAL / PRAGMAs / mantenimiento) -------------
+#
+# La UI, el servidor HTTP del editor enriquecido (guarda contenido_html) y los
+# hilos de sincronización con Google escriben en la misma BD. Con el journal
+# por defecto (DELETE) un escritor bloquea a los lectores; en WAL los lectores
+# siguen viendo la última versión confirmada mientras alguien escribe.
+#
+# - journal_mode (y auto_vacuum) quedan guardados en el archivo: se fijan en
+#   init_db() / guardar_ajustes_almacenamiento().
+# - synchronous, cache_size, mmap_size y temp_store son por conexión: se aplican
+#   en _abrir_conexion() con los ajustes de la tabla configuracion_almacenamiento.
+# - mantenimiento_almacenamiento() corre PRAGMA optimize, incremental_vacuum y
+#   un checkpoint del WAL; iniciar_mantenimiento_periodico() lo lanza en un hilo
+#   de fondo cada `optimizar_cada_horas`. El VACUUM completo que pasa una BD
+#   vieja a auto_vacuum incremental solo se hace desde admin ("Optimizar ahora").
+# - En WAL la BD son tres archivos (.db, -wal, -shm): para copiarla usar
+#   copiar_base_datos() (API de backup, por tramos) y antes de sobrescribirla
+#   eliminar_archivos_wal(). verificar_integridad_bd() revisa una copia.
+
+SYNCHRONOUS_VALIDOS = ("NORMAL", "FULL")
+
+ALMACENAMIENTO_DEFAULT: Dict[str, Any] = {
+    "wal": True,
+    "synchronous": "NORMAL",      # en WAL, NORMAL no arriesga corrupción (solo la última transacción ante un apagón)
+    "cache_mb": 32,
+    "mmap_mb": 128,               # 0 = sin memory-mapped I/O
+    "temp_store_memoria": True,
+    "vacuum_incremental": True,
+    "optimizar_cada_horas": 24,   # 0 = sin mantenimiento automático
+    "compresion_html": "no",      # "no" | "zlib" | "zstd" (contenido_html de las sesiones; opcional)
+}
+
+# Límites de lo que se acepta desde admin
+_LIMITES_ALMACENAMIENTO = {
+    "cache_mb": (2, 1024),
+    "mmap_mb": (0, 4096),
+    "optimizar_cada_horas": (0, 24 * 30),
+}
+
+# Backup en caliente: páginas por tramo (1 MiB con páginas de 4 KiB) y pausa entre tramos
+BACKUP_PAGINAS_POR_PASO = 256
+BACKUP_PAUSA_SEG = 0.005
+# Si otras conexiones escriben sin parar la copia por tramos se reinicia una y
+# otra vez: después de estos reinicios se copia el resto de un solo paso (en
+# WAL eso solo toma un lock de lectura, no frena a los que escriben).
+BACKUP_MAX_REINICIOS = 3
+
+# Páginas (4 KiB) devueltas al sistema por cada incremental_vacuum
+VACUUM_INCREMENTAL_MAX_PAGINAS = 5000
+MANTENIMIENTO_REVISION_SEG = 600
+MANTENIMIENTO_ESPERA_INICIAL_SEG = 60
+
+_ALMACENAMIENTO: Dict[str, Any] = dict(ALMACENAMIENTO_DEFAULT)
+_ALMACENAMIENTO_LOCK = threading.Lock()
+_MANTENIMIENTO_LOCK = threading.Lock()
+_MANTENIMIENTO_PARAR = threading.Event()
+_MANTENIMIENTO_HILO: Optional[threading.Thread] = None
+
+
+def _normalizar_ajustes_almacenamiento(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    aj = dict(ALMACENAMIENTO_DEFAULT)
+    for k in ("wal", "temp_store_memoria", "vacuum_incremental"):
+        if k in cfg and cfg[k] is not None:
+            aj[k] = bool(cfg[k])
+
+    sync = str(cfg.get("synchronous") or aj["synchronous"]).strip().upper()
+    aj["synchronous"] = sync if sync in SYNCHRONOUS_VALIDOS else ALMACENAMIENTO_DEFAULT["synchronous"]
+
+    compresion = str(cfg.get("compresion_html") or aj["compresion_html"]).strip().lower()
+    if compresion == "zstd" and not zstd_disponible():
+        compresion = "zlib"
+    aj["compresion_html"] = (
+        compresion if compresion in ("no",) + ALGORITMOS_COMPRESION else ALMACENAMIENTO_DEFAULT["compresion_html"]
+    )
+
+    for k, (minimo, maximo) in _LIMITES_ALMACENAMIENTO.items():
+        try:
+            v = int(cfg.get(k, aj[k]))
+        except (TypeError, ValueError):
+            v = ALMACENAMIENTO_DEFAULT[k]
+        aj[k] = min(maximo, max(minimo, v))
+    return aj
+
+
+def _pragmas_conexion(aj: Dict[str, Any]) -> List[str]:
+    return [
+        f"PRAGMA synchronous = {aj['synchronous']};",
+        # Negativo = tamaño en KiB (no en páginas)
+        f"PRAGMA cache_size = {-int(aj['cache_mb']) * 1024};",
+        f"PRAGMA mmap_size = {int(aj['mmap_mb']) * 1024 * 1024};",
+        f"PRAGMA temp_store = {'MEMORY' if aj['temp_store_memoria'] else 'DEFAULT'};",
+    ]
+
+
+def _aplicar_pragmas_conexion(conn: sqlite3.Connection) -> None:
+    with _ALMACENAMIENTO_LOCK:
+        aj = dict(_ALMACENAMIENTO)
+    for sql in _pragmas_conexion(aj):
+        conn.execute(sql)
+
+
+def ajustes_almacenamiento() -> Dict[str, Any]:
+    """Ajustes vigentes (los que usan las conexiones nuevas)."""
+    with _ALMACENAMIENTO_LOCK:
+        return dict(_ALMACENAMIENTO)
+
+
+def _fijar_journal_mode(conn: sqlite3.Connection, wal: bool) -> str:
+    """
+    Cambia el journal_mode del archivo. No puede hacerse dentro de una
+    transacción, y salir de WAL requiere que no haya otras conexiones leyendo:
+    si falla se deja el modo actual y se avisa.
+    """
+    deseado = "wal" if wal else "delete"
+    actual = str(conn.execute("PRAGMA journal_mode;").fetchone()[0]).lower()
+    if actual == deseado or actual == "memory":
+        return actual
+    try:
+        actual = str(conn.execute(f"PRAGMA journal_mode = {deseado.upper()};").fetchone()[0]).lower()
+    except sqlite3.OperationalError as ex:
+        print("⚠️ No se pudo cambiar journal_mode:", ex)
+    if actual != deseado:
+        print(f"⚠️ journal_mode sigue en {actual} (se pidió {deseado}); se reintentará al reiniciar.")
+    return actual
+
+
+def asegurar_almacenamiento(cur: sqlite3.Cursor) -> None:
+    """
+    Tabla de ajustes + journal_mode/auto_vacuum del archivo. Se llama al inicio
+    de init_db(): en una BD nueva auto_vacuum solo se puede fijar antes de crear
+    la primera tabla (en una existente, "Optimizar ahora" de admin con un VACUUM).
+    """
+    conn = cur.connection
+    if cur.execute("PRAGMA page_count;").fetchone()[0] == 0:
+        cur.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS configuracion_almacenamiento (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            wal INTEGER NOT NULL DEFAULT 1,
+            synchronous TEXT NOT NULL DEFAULT 'NORMAL',
+            cache_mb INTEGER NOT NULL DEFAULT 32,
+            mmap_mb INTEGER NOT NULL DEFAULT 128,
+            temp_store_memoria INTEGER NOT NULL DEFAULT 1,
+            vacuum_incremental INTEGER NOT NULL DEFAULT 1,
+            optimizar_cada_horas INTEGER NOT NULL DEFAULT 24,
+            ultimo_mantenimiento TEXT        -- 'YYYY-MM-DD HH:MM:SS'
+        );
+        """
+    )
+    cur.execute("PRAGMA table_info(configuracion_almacenamiento);")
+    cols = [row[1] for row in cur.fetchall()]
+    if "compresion_html" not in cols:
+        cur.execute("ALTER TABLE configuracion_almacenamiento ADD COLUMN compresion_html TEXT NOT NULL DEFAULT 'no';")
+    cur.execute("INSERT OR IGNORE INTO configuracion_almacenamiento (id) VALUES (1);")
+    conn.commit()
+
+    row = cur.execute("SELECT * FROM configuracion_almacenamiento WHERE id = 1;").fetchone()
+    aj = _normalizar_ajustes_almacenamiento(dict(row))
+    with _ALMACENAMIENTO_LOCK:
+        cambio = aj != _ALMACENAMIENTO
+        _ALMACENAMIENTO.update(aj)
+
+    _fijar_journal_mode(conn, aj["wal"])
+    if cambio:
+        # Esta conexión (y las demás del pool) se abrieron con los valores por defecto
+        for sql in _pragmas_conexion(aj):
+            cur.execute(sql)
+        cerrar_pool()
+
+
+def guardar_ajustes_almacenamiento(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Guarda los ajustes (desde admin) y los aplica: el pool se vacía para que
+    las conexiones nuevas tomen los PRAGMAs y se cambia el journal_mode si hace falta.
+    Devuelve los ajustes normalizados.
+    """
+    aj = _normalizar_ajustes_almacenamiento({**ajustes_almacenamiento(), **(cfg or {})})
+
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        UPDATE configuracion_almacenamiento
+        SET wal = ?, synchronous = ?, cache_mb = ?, mmap_mb = ?,
+            temp_store_memoria = ?, vacuum_incremental = ?, optimizar_cada_horas = ?,
+            compresion_html = ?
+        WHERE id = 1;
+        """,
+        (
+            1 if aj["wal"] else 0,
+            aj["synchronous"],
+            aj["cache_mb"],
+            aj["mmap_mb"],
+            1 if aj["temp_store_memoria"] else 0,
+            1 if aj["vacuum_incremental"] else 0,
+            aj["optimizar_cada_horas"],
+            aj["compresion_html"],
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+    with _ALMACENAMIENTO_LOCK:
+        _ALMACENAMIENTO.update(aj)
+    cerrar_pool()
+
+    conn = get_connection()
+    try:
+        _fijar_journal_mode(conn, aj["wal"])
+    finally:
+        conn.close()
+    return aj
+
+
+def archivos_base_datos(ruta: Optional[Path] = None) -> List[Path]:
+    """[.db, .db-wal, .db-shm] de la BD (existan o no)."""
+    ruta = Path(ruta or DB_PATH)
+    return [ruta, Path(f"{ruta}-wal"), Path(f"{ruta}-shm")]
+
+
+def eliminar_archivos_wal(ruta: Optional[Path] = None) -> None:
+    """
+    Borra -wal/-shm de la BD. Llamar con el pool cerrado y justo antes de
+    sobrescribir el .db (restauración): si quedaran, SQLite aplicaría las
+    páginas del WAL viejo sobre el archivo restaurado.
+    """
+    for p in archivos_base_datos(ruta)[1:]:
+        try:
+            p.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class _BackupReiniciado(Exception):
+    """La copia por tramos se reinició demasiadas veces (escrituras concurrentes)."""
+
+
+def copiar_base_datos(
+    destino: str | Path,
+    progreso: Optional[Callable[[int, int], None]] = None,
+    paginas_por_paso: int = BACKUP_PAGINAS_POR_PASO,
+    pausa: float = BACKUP_PAUSA_SEG,
+) -> Path:
+    """
+    Copia consistente de la BD a `destino` (un solo archivo .db) con la API de
+    backup de SQLite. Incluye lo que todavía está en el -wal, cosa que un
+    shutil.copy del .db no hace.
+
+    Copia por tramos de `paginas_por_paso` y entre tramo y tramo no se tiene
+    ningún lock y se duerme `pausa` segundos: la UI, el editor enriquecido y
+    los hilos de sincronización siguen escribiendo durante un backup grande (si
+    otra conexión escribe, SQLite retoma la copia para que quede consistente).
+    progreso(paginas_copiadas, paginas_totales) se llama después de cada tramo.
+    """
+    destino = Path(destino)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    estado = {"restantes": None, "reinicios": 0}
+
+    def _paso(_estado: int, restantes: int, total: int) -> None:
+        anterior = estado["restantes"]
+        estado["restantes"] = restantes
+        if anterior is not None and restantes > anterior:
+            estado["reinicios"] += 1
+            if estado["reinicios"] > BACKUP_MAX_REINICIOS:
+                raise _BackupReiniciado()
+        if progreso is not None:
+            progreso(total - restantes, total)
+        if pausa > 0 and restantes > 0:
+            time.sleep(pausa)
+
+    origen = get_connection()
+    dst = sqlite3.connect(str(destino))
+    try:
+        try:
+            origen.backup(dst, pages=max(1, int(paginas_por_paso)), progress=_paso)
+        except _BackupReiniciado:
+            origen.backup(dst, pages=-1)
+            if progreso is not None:
+                total = origen.execute("PRAGMA page_count;").fetchone()[0]
+                progreso(total, total)
+        # La copia queda como archivo único aunque el origen esté en WAL
+        dst.execute("PRAGMA journal_mode = DELETE;")
+    finally:
+        dst.close()
+        origen.close()
+    return destino
+
+
+def verificar_integridad_bd(ruta: Optional[str | Path] = None) -> List[str]:
+    """
+    PRAGMA integrity_check sobre el archivo `ruta` (por defecto la BD actual).
+    Devuelve [] si está bien o la lista de problemas que reporta SQLite.
+    """
+    if ruta is None:
+        conn = get_connection()
+    else:
+        # Solo lectura: verificar una copia nunca la modifica
+        conn = sqlite3.connect(f"{Path(ruta).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        mensajes = [str(r[0]) for r in conn.execute("PRAGMA integrity_check;").fetchall()]
+    except sqlite3.DatabaseError as ex:
+        # p. ej. "file is not a database"
+        mensajes = [str(ex)]
+    finally:
+        conn.close()
+    return [] if mensajes == ["ok"] else mensajes
+
+
+def _tamano_archivo(p: Path) -> int:
+    try:
+        return p.stat().st_size
+    except OSError:
+        return 0
+
+
+def _leer_ultimo_mantenimiento(conn: sqlite3.Connection) -> Optional[datetime]:
+    row = conn.execute("SELECT ultimo_mantenimiento FROM configuracion_almacenamiento WHERE id = 1;").fetchone()
+    if not row or not row[0]:
+        return None
+    try:
+        return datetime.fromisoformat(row[0])
+    except ValueError:
+        return None
+
+
+def mantenimiento_pendiente() -> bool:
+    """True si pasaron `optimizar_cada_horas` desde el último mantenimiento."""
+    horas = ajustes_almacenamiento()["optimizar_cada_horas"]
+    if horas <= 0:
+        return False
+    conn = get_connection()
+    try:
+        ultimo = _leer_ultimo_mantenimiento(conn)
+    finally:
+        conn.close()
+    return ultimo is None or datetime.now() - ultimo >= timedelta(hours=horas)
+
+
+def mantenimiento_almacenamiento(compactar: bool = False) -> Dict[str, Any]:
+    """
+    PRAGMA optimize (ANALYZE solo de lo que lo necesita), incremental_vacuum y
+    checkpoint del WAL. Si el archivo todavía no tiene auto_vacuum incremental
+    (BD creada antes de estos ajustes) pasarlo exige un VACUUM completo, que
+    reescribe toda la BD con el lock de escritura tomado: solo se hace con
+    compactar=True ("Optimizar ahora" en admin); sin él queda vacuum="pendiente".
+    No toca las notas: comprimir las existentes es una acción explícita
+    (comprimir_html_sesiones, desde admin). Devuelve lo que hizo para mostrarlo.
+    """
+    aj = ajustes_almacenamiento()
+    res: Dict[str, Any] = {
+        "optimize": False,
+        "vacuum": "",
+        "paginas_liberadas": 0,
+        "checkpoint": None,
+        "duracion_ms": 0.0,
+    }
+    t0 = time.perf_counter()
+
+    with _MANTENIMIENTO_LOCK:
+        conn = get_connection()
+        try:
+            conn.execute("PRAGMA optimize;")
+            res["optimize"] = True
+
+            if aj["vacuum_incremental"]:
+                auto_vacuum = conn.execute("PRAGMA auto_vacuum;").fetchone()[0]
+                if auto_vacuum != 2:
+                    if compactar:
+                        conn.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+                        conn.execute("VACUUM;")
+                        res["vacuum"] = "completo"
+                    else:
+                        res["vacuum"] = "pendiente"
+                else:
+                    libres = conn.execute("PRAGMA freelist_count;").fetchone()[0]
+                    if libres:
+                        # Cada paso del PRAGMA libera una página y execute() solo da el
+                        # primero (no devuelve columnas); executescript lo corre completo.
+                        conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_INCREMENTAL_MAX_PAGINAS});")
+                        res["paginas_liberadas"] = libres - conn.execute("PRAGMA freelist_count;").fetchone()[0]
+                        res["vacuum"] = "incremental"
+
+            if str(conn.execute("PRAGMA journal_mode;").fetchone()[0]).lower() == "wal":
+                # (busy, páginas en el WAL, páginas copiadas al .db)
+                res["checkpoint"] = tuple(conn.execute("PRAGMA wal_checkpoint(TRUNCATE);").fetchone())
+
+            conn.execute(
+                "UPDATE configuracion_almacenamiento SET ultimo_mantenimiento = ? WHERE id = 1;",
+                (datetime.now().strftime("%Y-%m-%d %H:%M:%S"),),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    res["duracion_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+    return res
+
+
+def _bucle_mantenimiento(revision_seg: float) -> None:
+    espera = min(MANTENIMIENTO_ESPERA_INICIAL_SEG, revision_seg)
+    while not _MANTENIMIENTO_PARAR.wait(espera):
+        espera = revision_seg
+        try:
+            if mantenimiento_pendiente():
+                mantenimiento_almacenamiento()
+        except Exception as ex:
+            print("⚠️ Error en mantenimiento de la BD:", ex)
+
+
+def iniciar_mantenimiento_periodico(revision_seg: float = MANTENIMIENTO_REVISION_SEG) -> None:
+    """
+    Hilo de fondo que cada `revision_seg` revisa si toca mantenimiento
+    (según optimizar_cada_horas). Idempotente: si ya corre no hace nada.
+    """
+    global _MANTENIMIENTO_HILO
+    if _MANTENIMIENTO_HILO is not None and _MANTENIMIENTO_HILO.is_alive():
+        return
+    _MANTENIMIENTO_PARAR.clear()
+    _MANTENIMIENTO_HILO = threading.Thread(
+        target=_bucle_mantenimiento,
+        args=(float(revision_seg),),
+        name="sara-mantenimiento-bd",
+        daemon=True,
+    )
+    _MANTENIMIENTO_HILO.start()
+
+
+def detener_mantenimiento_periodico() -> None:
+    _MANTENIMIENTO_PARAR.set()
+
+
+def estado_almacenamiento() -> Dict[str, Any]:
+    """Modo del journal, PRAGMAs efectivos de una conexión y tamaños de archivo."""
+    conn = get_connection()
+    try:
+        def pragma(nombre: str) -> Any:
+            return conn.execute(f"PRAGMA {nombre};").fetchone()[0]
+
+        estado = {
+            "journal_mode": str(pragma("journal_mode")).lower(),
+            "synchronous": {0: "OFF", 1: "NORMAL", 2: "FULL", 3: "EXTRA"}.get(pragma("synchronous"), "?"),
+            "cache_size": pragma("cache_size"),
+            "mmap_size": pragma("mmap_size"),
+            "temp_store": {0: "DEFAULT", 1: "FILE", 2: "MEMORY"}.get(pragma("temp_store"), "?"),
+            "auto_vacuum": {0: "NONE", 1: "FULL", 2: "INCREMENTAL"}.get(pragma("auto_vacuum"), "?"),
+            "page_size": pragma("page_size"),
+            "page_count": pragma("page_count"),
+            "freelist_count": pragma("freelist_count"),
+        }
+        ultimo = _leer_ultimo_mantenimiento(conn)
+    finally:
+        conn.close()
+
+    db, wal, _shm = archivos_base_datos()
+    estado["tamano_bd_bytes"] = _tamano_archivo(db)
+    estado["tamano_wal_bytes"] = _tamano_archivo(wal)
+    estado["ultimo_mantenimiento"] = ultimo.strftime("%Y-%m-%d %H:%M") if ultimo else None
+    estado["ajustes"] = ajustes_almacenamiento()
+    return estado
+
+
+# ------------ PERFILADO DE CONSULTAS (opt-in) -------------
+#
+# Desactivado por defecto (costo cero salvo un if en get_connection). Se
+# activa con SARA_DB_PERFIL=1 o con activar_perfilado_consultas() desde
+# Configuración > Diagnóstico. Mientras está activo:
+#
+# - Cada conexión prestada recuerda qué función la pidió; al devolverla se
+#   suma ese tiempo a la latencia de la función.
+# - Sus cursores (_CursorPerfilado) miden cada sentencia, incluido el tiempo
+#   de fetch, y cuentan las filas devueltas.
+# - La primera vez que se ve cada sentencia se guarda su EXPLAIN QUERY PLAN y
+#   se marca si recorre una tabla completa (SCAN sin índice). Así aparecen
+#   solos los filtros tipo date(col) / datetime(col) que no pueden usar índices.
+# - Las sentencias que superan el umbral van a un log rotativo
+#   (data/logs/consultas_lentas.log) y a una lista en memoria para el panel.
+#
+# Los parámetros de las consultas nunca se registran (son datos clínicos).
+
+PERFIL_UMBRAL_MS_DEFAULT = 100.0
+PERFIL_MAX_LENTAS = 200
+PERFIL_MAX_PLANES = 1000
+PERFIL_LOG_MAX_BYTES = 1_000_000
+PERFIL_LOG_RESPALDOS = 3
+
+_SENTENCIAS_CON_PLAN = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+_FRAMES_INTERNOS = {"get_connection", "conexion", "transaccion", "__enter__", "__exit__"}
+
+
+def _funcion_llamadora(frame: Any) -> str:
+    """Nombre de la primera función "de negocio" en la pila (salta helpers de conexión)."""
+    while frame is not None:
+        codigo = frame.f_code
+        if codigo.co_name not in _FRAMES_INTERNOS and not codigo.co_filename.endswith("contextlib.py"):
+            modulo = frame.f_globals.get("__name__", "").rsplit(".", 1)[-1]
+            return codigo.co_name if modulo == "db" else f"{modulo}.{codigo.co_name}"
+        frame = frame.f_back
+    return "?"
+
+
+def _escaneos_en_plan(plan: List[str]) -> List[str]:
+    """Tablas que el plan recorre completas ('SCAN tabla' sin índice)."""
+    tablas = []
+    for detalle in plan:
+        if not detalle.startswith("SCAN "):
+            continue
+        if "USING" in detalle or "VIRTUAL TABLE" in detalle or "CONSTANT ROW" in detalle:
+            continue
+        objetivo = detalle[5:].split(" ", 1)[0]
+        if objetivo.startswith("(") or objetivo in ("CTE", "SUBQUERY"):
+            continue
+        tablas.append(objetivo)
+    return tablas
+
+
+class _Perfilador:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.activo = os.environ.get("SARA_DB_PERFIL", "").strip().lower() in ("1", "true", "si", "sí")
+        try:
+            self.umbral_ms = float(os.environ.get("SARA_DB_PERFIL_UMBRAL_MS") or PERFIL_UMBRAL_MS_DEFAULT)
+        except ValueError:
+            self.umbral_ms = PERFIL_UMBRAL_MS_DEFAULT
+        self._log = None
+        self._log_ruta = ""
+        self.reiniciar()
+
+    def reiniciar(self) -> None:
+        with self._lock:
+            self._funciones: Dict[str, Dict[str, Any]] = {}
+            self._sentencias: Dict[str, Dict[str, Any]] = {}
+            self._planes: Dict[str, Tuple[List[str], List[str]]] = {}
+            self._lentas: List[Dict[str, Any]] = []
+
+    # -- registro --
+
+    def registrar_funcion(self, funcion: str, ms: float) -> None:
+        with self._lock:
+            f = self._funciones.get(funcion)
+            if f is None:
+                f = self._funciones[funcion] = {"llamadas": 0, "total_ms": 0.0, "max_ms": 0.0}
+            f["llamadas"] += 1
+            f["total_ms"] += ms
+            if ms > f["max_ms"]:
+                f["max_ms"] = ms
+
+    def plan(self, conn: sqlite3.Connection, sql: str, params: Any) -> Tuple[List[str], List[str]]:
+        """(detalles del plan, tablas con escaneo completo); se calcula una vez por sentencia."""
+        cache = self._planes.get(sql)
+        if cache is not None:
+            return cache
+        detalles: List[str] = []
+        if sql.lstrip()[:7].upper().startswith(_SENTENCIAS_CON_PLAN) and params is not None:
+            try:
+                # Cursor base: el EXPLAIN no se perfila a sí mismo
+                cur = sqlite3.Cursor(conn)
+                cur.execute("EXPLAIN QUERY PLAN " + sql, params)
+                detalles = [str(r[3]) for r in cur.fetchall()]
+                cur.close()
+            except Exception:
+                detalles = []
+        resultado = (detalles, _escaneos_en_plan(detalles))
+        with self._lock:
+            if len(self._planes) >= PERFIL_MAX_PLANES:
+                self._planes.clear()
+            self._planes[sql] = resultado
+        return resultado
+
+    def registrar_sentencia(self, funcion: str, sql: str, ms: float, filas: int, plan: Tuple[List[str], List[str]]) -> None:
+        texto = " ".join(sql.split())
+        lenta = ms >= self.umbral_ms
+        with self._lock:
+            s = self._sentencias.get(texto)
+            if s is None:
+                s = self._sentencias[texto] = {
+                    "sql": texto,
+                    "funcion": funcion,
+                    "llamadas": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "filas": 0,
+                    "lentas": 0,
+                    "plan": plan[0],
+                    "escaneos": plan[1],
+                }
+            s["llamadas"] += 1
+            s["total_ms"] += ms
+            s["filas"] += filas
+            if ms > s["max_ms"]:
+                s["max_ms"] = ms
+            if lenta:
+                s["lentas"] += 1
+                self._lentas.append({
+                    "fecha": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "funcion": funcion,
+                    "ms": round(ms, 2),
+                    "filas": filas,
+                    "sql": texto,
+                    "plan": plan[0],
+                    "escaneos": plan[1],
+                })
+                del self._lentas[:-PERFIL_MAX_LENTAS]
+        if lenta:
+            self._escribir_log(funcion, texto, ms, filas, plan)
+
+    def _escribir_log(self, funcion: str, sql: str, ms: float, filas: int, plan: Tuple[List[str], List[str]]) -> None:
+        try:
+            logger = self._logger()
+            escaneo = f" | SCAN: {', '.join(plan[1])}" if plan[1] else ""
+            logger.warning(
+                "%.1f ms | %s | filas=%d%s | %s | plan: %s",
+                ms, funcion, filas, escaneo, sql, " / ".join(plan[0]) or "-",
+            )
+        except Exception as ex:
+            print("⚠️ No se pudo escribir el log de consultas lentas:", ex)
+
+    def _logger(self):
+        import logging
+        from logging.handlers import RotatingFileHandler
+
+        ruta = str(ruta_log_consultas_lentas())
+        with self._lock:
+            if self._log is not None and self._log_ruta == ruta:
+                return self._log
+            Path(ruta).parent.mkdir(parents=True, exist_ok=True)
+            logger = logging.getLogger("sara.db.consultas_lentas")
+            logger.propagate = False
+            logger.setLevel(logging.WARNING)
+            for h in list(logger.handlers):
+                logger.removeHandler(h)
+                h.close()
+            handler = RotatingFileHandler(
+                ruta, maxBytes=PERFIL_LOG_MAX_BYTES, backupCount=PERFIL_LOG_RESPALDOS, encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            logger.addHandler(handler)
+            self._log, self._log_ruta = logger, ruta
+            return logger
+
+    # -- lectura --
+
+    def resumen(self, limite: int) -> Dict[str, Any]:
+        with self._lock:
+            funciones = [
+                {
+                    "funcion": nombre,
+                    "llamadas": f["llamadas"],
+                    "total_ms": round(f["total_ms"], 2),
+                    "media_ms": round(f["total_ms"] / f["llamadas"], 3) if f["llamadas"] else 0.0,
+                    "max_ms": round(f["max_ms"], 2),
+                }
+                for nombre, f in self._funciones.items()
+            ]
+            sentencias = [dict(s) for s in self._sentencias.values()]
+            lentas = [dict(x) for x in reversed(self._lentas)]
+
+        for s in sentencias:
+            s["total_ms"] = round(s["total_ms"], 2)
+            s["max_ms"] = round(s["max_ms"], 2)
+            s["media_ms"] = round(s["total_ms"] / s["llamadas"], 3) if s["llamadas"] else 0.0
+
+        funciones.sort(key=lambda f: f["total_ms"], reverse=True)
+        sentencias.sort(key=lambda s: s["total_ms"], reverse=True)
+        escaneos = [s for s in sentencias if s["escaneos"]]
+        return {
+            "activo": self.activo,
+            "umbral_ms": self.umbral_ms,
+            "log": str(ruta_log_consultas_lentas()),
+            "funciones": funciones[:limite],
+            "sentencias": sentencias[:limite],
+            "escaneos": escaneos[:limite],
+            "lentas": lentas[:limite],
+        }
+
+
+_PERFIL = _Perfilador()
+
+
+class _CursorPerfilado(sqlite3.Cursor):
+    """
+    Cursor que mide cada sentencia (execute + fetch) y cuenta filas. La
+    medición de una sentencia se cierra al ejecutar la siguiente, al cerrar el
+    cursor o cuando el cursor se libera.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        super().__init__(conn)
+        self._medicion: Optional[List[Any]] = None  # [funcion, sql, ms, filas, plan]
+
+    def _cerrar_medicion(self) -> None:
+        m = self._medicion
+        if m is not None:
+            self._medicion = None
+            _PERFIL.registrar_sentencia(*m)
+
+    def _medir(self, metodo, sql: str, params: Any, muchas: bool):
+        self._cerrar_medicion()
+        t0 = time.perf_counter()
+        try:
+            return metodo(self, sql, params)
+        finally:
+            ms = (time.perf_counter() - t0) * 1000.0
+            conn = self.connection
+            funcion = getattr(conn, "_perfil_funcion", None) or _funcion_llamadora(sys._getframe(2))
+            # executemany no tiene un único juego de parámetros para el EXPLAIN
+            plan = _PERFIL.plan(conn, sql, None if muchas else params)
+            self._medicion = [funcion, sql, ms, 0, plan]
+
+    def _sumar(self, t0: float, filas: int) -> None:
+        m = self._medicion
+        if m is not None:
+            m[2] += (time.perf_counter() - t0) * 1000.0
+            m[3] += filas
+
+    def execute(self, sql, parameters=()):
+        return self._medir(sqlite3.Cursor.execute, sql, parameters, False)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._medir(sqlite3.Cursor.executemany, sql, seq_of_parameters, True)
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        fila = super().fetchone()
+        self._sumar(t0, 0 if fila is None else 1)
+        return fila
+
+    def fetchmany(self, size=None):
+        t0 = time.perf_counter()
+        filas = super().fetchmany(self.arraysize if size is None else size)
+        self._sumar(t0, len(filas))
+        return filas
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        filas = super().fetchall()
+        self._sumar(t0, len(filas))
+        return filas
+
+    def __next__(self):
+        t0 = time.perf_counter()
+        try:
+            fila = super().__next__()
+        except StopIteration:
+            self._sumar(t0, 0)
+            raise
+        self._sumar(t0, 1)
+        return fila
+
+    def close(self):
+        self._cerrar_medicion()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._cerrar_medicion()
+        except Exception:
+            pass
+
+
+def ruta_log_consultas_lentas() -> Path:
+    return Path(DB_PATH).parent / "logs" / "consultas_lentas.log"
+
+
+def activar_perfilado_consultas(activo: bool = True, umbral_ms: Optional[float] = None) -> None:
+    """Enciende/apaga el perfilado (afecta a las conexiones pedidas desde ahora)."""
+    if umbral_ms is not None:
+        _PERFIL.umbral_ms = max(0.0, float(umbral_ms))
+    _PERFIL.activo = bool(activo)
+
+
+def perfilado_consultas_activo() -> bool:
+    return _PERFIL.activo
+
+
+def resumen_perfilado_consultas(limite: int = 20) -> Dict[str, Any]:
+    """
+    Lo acumulado desde el último reinicio:
+      - funciones: latencia por función de db.py (tiempo con la conexión tomada)
+      - sentencias: tiempo/filas por sentencia, con su plan
+      - escaneos: sentencias cuyo plan recorre tablas completas
+      - lentas: últimas sentencias sobre el umbral (más reciente primero)
+    """
+    return _PERFIL.resumen(limite)
+
+
+def reiniciar_perfilado_consultas() -> None:
+    _PERFIL.reiniciar()
+
+
+# ------------ FECHAS (adaptador tipado) -------------
+#
+# Formato canónico en la BD:
+#   - fechas:       'YYYY-MM-DD'
+#   - fecha + hora: 'YYYY-MM-DD HH:MM'
+# Los datos viejos (Excel / Forms) pueden venir como 'DD-MM-YYYY'; las
+# escrituras de db.py normalizan con fecha_a_bd() y migrar_fechas_iso() (en
+# init_db) convierte lo que ya estaba guardado. La UI muestra con
+# fechas.formatear_fecha() y lee con fecha_desde_bd() / fechas.parse_fecha().
+
+# date -> 'YYYY-MM-DD' al pasar parámetros (el adaptador por defecto está deprecado)
+sqlite3.register_adapter(date, date.isoformat)
+
+# (tabla, columna) con fechas en texto que se normalizan a ISO
+_COLUMNAS_FECHA: Tuple[Tuple[str, str], ...] = (
+    ("pacientes", "fecha_nacimiento"),
+    ("citas", "fecha_hora"),
+    ("citas", "fecha_hora_fin"),
+    ("bloqueos_agenda", "fecha_hora_inicio"),
+    ("bloqueos_agenda", "fecha_hora_fin"),
+    ("historia_clinica", "fecha_apertura"),
+    ("sesiones_clinicas", "fecha"),
+    ("facturas_convenio", "fecha"),
+    ("gastos_financieros", "fecha"),
+    ("paquetes_arriendo", "fecha_compra"),
+    ("consumo_paquetes_arriendo", "fecha_consumo"),
+    ("paquetes_consultorio", "fecha_compra"),
+    ("consumo_paquetes", "fecha"),
+)
+
+MIGRACION_FECHAS_LOTE = 500
+
+
+def fecha_desde_bd(valor: Any) -> Optional[date]:
+    """Fecha guardada en la BD (o en cualquier formato aceptado) -> date / None."""
+    return parse_fecha(valor)
+
+
+def _normalizar_texto_fecha(valor: Any) -> Optional[str]:
+    """
+    Texto de fecha (con o sin hora) en formato canónico. La parte de la hora
+    se conserva tal cual. Devuelve None si no es una fecha reconocible.
+    """
+    s = "" if valor is None else str(valor).strip()
+    if not s:
+        return s
+    cabeza, resto = s[:10], s[10:]
+    if resto and resto[0] not in " T":
+        # 'D-M-YYYY HH:MM' y similares: la fecha es lo que va antes del espacio
+        cabeza, _, resto = s.partition(" ")
+        resto = f" {resto}" if resto else ""
+    d = parse_fecha(cabeza)
+    if d is None:
+        return None
+    return d.isoformat() + resto
+
+
+def fecha_a_bd(valor: Any) -> Any:
+    """
+    Normaliza una fecha antes de guardarla ('DD-MM-YYYY' -> 'YYYY-MM-DD').
+    Si no se reconoce, devuelve el valor sin tocar (la validación es de la UI).
+    """
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat(sep=" ", timespec="minutes") if isinstance(valor, datetime) else valor.isoformat()
+    normal = _normalizar_texto_fecha(valor)
+    return valor if normal is None else normal
+
+
+def migrar_fechas_iso(conn: sqlite3.Connection, lote: int = MIGRACION_FECHAS_LOTE) -> None:
+    """
+    Migración única y reanudable de _COLUMNAS_FECHA a formato ISO.
+
+    Recorre cada columna por rowid en lotes; cada lote se confirma junto con
+    su avance en migracion_fechas, así que si la app se cierra a mitad de
+    camino continúa donde quedó. Los valores que no son fechas válidas no se
+    tocan y quedan listados en migracion_fechas_invalidas.
+    """
+    cur = conn.cursor()
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS migracion_fechas (
+            tabla TEXT NOT NULL,
+            columna TEXT NOT NULL,
+            ultimo_rowid INTEGER NOT NULL DEFAULT 0,
+            convertidas INTEGER NOT NULL DEFAULT 0,
+            invalidas INTEGER NOT NULL DEFAULT 0,
+            terminada INTEGER NOT NULL DEFAULT 0,
+            actualizada_en TEXT,
+            PRIMARY KEY (tabla, columna)
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS migracion_fechas_invalidas (
+            tabla TEXT NOT NULL,
+            columna TEXT NOT NULL,
+            fila INTEGER NOT NULL,          -- rowid
+            valor TEXT,
+            PRIMARY KEY (tabla, columna, fila)
+        );
+        """
+    )
+    conn.commit()
+
+    cur.execute("SELECT tabla, columna FROM migracion_fechas WHERE terminada = 1;")
+    terminadas = {(r[0], r[1]) for r in cur.fetchall()}
+
+    for tabla, columna in _COLUMNAS_FECHA:
+        if (tabla, columna) in terminadas:
+            continue
+        cur.execute(
+            "INSERT OR IGNORE INTO migracion_fechas (tabla, columna) VALUES (?, ?);",
+            (tabla, columna),
+        )
+        cur.execute(
+            "SELECT ultimo_rowid FROM migracion_fechas WHERE tabla = ? AND columna = ?;",
+            (tabla, columna),
+        )
+        ultimo = int(cur.fetchone()[0] or 0)
+
+        while True:
+            cur.execute(
+                f"SELECT rowid, {columna} FROM {tabla} WHERE rowid > ? ORDER BY rowid LIMIT ?;",
+                (ultimo, int(lote)),
+            )
+            filas = cur.fetchall()
+            if not filas:
+                cur.execute(
+                    """
+                    UPDATE migracion_fechas
+                    SET terminada = 1, actualizada_en = datetime('now','localtime')
+                    WHERE tabla = ? AND columna = ?;
+                    """,
+                    (tabla, columna),
+                )
+                conn.commit()
+                break
+
+            cambios: List[Tuple[str, int]] = []
+            invalidas: List[Tuple[str, str, int, str]] = []
+            for rowid, valor in filas:
+                if valor is None:
+                    continue
+                normal = _normalizar_texto_fecha(valor)
+                if normal is None:
+                    invalidas.append((tabla, columna, rowid, str(valor)))
+                elif normal != valor:
+                    cambios.append((normal, rowid))
+
+            if cambios:
+                cur.executemany(f"UPDATE {tabla} SET {columna} = ? WHERE rowid = ?;", cambios)
+                if tabla == "sesiones_clinicas":
+                    # Sin trigger de UPDATE en busqueda_clinica (ver _indexar_sesiones)
+                    _indexar_sesiones(cur, [rowid for _, rowid in cambios])
+            if invalidas:
+                cur.executemany(
+                    """
+                    INSERT OR REPLACE INTO migracion_fechas_invalidas (tabla, columna, fila, valor)
+                    VALUES (?, ?, ?, ?);
+                    """,
+                    invalidas,
+                )
+            ultimo = int(filas[-1][0])
+            cur.execute(
+                """
+                UPDATE migracion_fechas
+                SET ultimo_rowid = ?,
+                    convertidas = convertidas + ?,
+                    invalidas = invalidas + ?,
+                    actualizada_en = datetime('now','localtime')
+                WHERE tabla = ? AND columna = ?;
+                """,
+                (ultimo, len(cambios), len(invalidas), tabla, columna),
+            )
+            conn.commit()
+
+        cur.execute(
+            "SELECT convertidas, invalidas FROM migracion_fechas WHERE tabla = ? AND columna = ?;",
+            (tabla, columna),
+        )
+        convertidas, n_invalidas = cur.fetchone()
+        if convertidas or n_invalidas:
+            print(f"Migración de fechas {tabla}.{columna}: {convertidas} convertidas, {n_invalidas} no reconocidas.")
+        if n_invalidas:
+            print(f"⚠️ Revisa migracion_fechas_invalidas ({tabla}.{columna}).")
+
+
+def reporte_migracion_fechas() -> Dict[str, Any]:
+    """
+    Estado de la migración de fechas:
+      - columnas: [{tabla, columna, convertidas, invalidas, terminada, ...}]
+      - invalidas: [{tabla, columna, fila, valor}] (valores no reconocidos)
+    """
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM migracion_fechas ORDER BY tabla, columna;")
+    columnas = [dict(r) for r in cur.fetchall()]
+    cur.execute("SELECT * FROM migracion_fechas_invalidas ORDER BY tabla, columna, fila;")
+    invalidas = [dict(r) for r in cur.fetchall()]
+    conn.close()
+    return {"columnas": columnas, "invalidas": invalidas}
+
+
 def init_db() -> None:
     """Crea las tablas necesarias si no existen."""
     conn = get_connection()
     cur = conn.cursor()
     
-    
+    # WAL, auto_vacuum y ajustes de PRAGMAs (antes de crear cualquier tabla)
+    asegurar_almacenamiento(cur)
 
     #######################TABLAS ########################
     # Tabla de pacientes
@@ -113,6 +1478,17 @@ def init_db() -> None:
     if "indicativo_pais" not in columnas_pacientes:
         cur.execute("ALTER TABLE pacientes ADD COLUMN indicativo_pais TEXT NOT NULL DEFAULT '57';")
 
+    # Índices para la tabla paginada de pacientes (ver listar_pacientes_pagina)
+    for col in _COLUMNAS_ORDEN_PACIENTES:
+        if col != "documento":
+            cur.execute(
+                f"CREATE INDEX IF NOT EXISTS ix_pacientes_{col} "
+                f"ON pacientes ({col} COLLATE NOCASE, documento);"
+            )
+
+    # Fecha de nacimiento ISO + clave MM-DD indexada (cumpleaños)
+    asegurar_columnas_cumpleanios(cur)
+
       # Tabla de citas
     cur.execute(
         """
@@ -382,6 +1758,11 @@ def init_db() -> None:
         """
     )
 
+    # --- Migración: timestamps canónicos (minutos epoch) para consultas por rango ---
+    # datetime(fecha_hora) en el WHERE impide usar índices; guardamos inicio/fin
+    # como enteros ordenables, mantenidos por triggers, e indexados.
+    asegurar_columnas_rango_tiempo(cur)
+
     ########### Historia clínica ################
      # Tabla de historia clínica (una por paciente)
     cur.execute(
@@ -418,6 +1799,11 @@ def init_db() -> None:
         ON sesiones_clinicas(cita_id)
         WHERE cita_id IS NOT NULL;
     """)
+    # Listado de sesiones por historia ya ordenado (sin recorrer la tabla)
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS ix_sesiones_clinicas_historia
+        ON sesiones_clinicas(historia_id, fecha DESC, id DESC);
+    """)
     
     # --- Migración segura: HTML enriquecido en sesiones clínicas ---
     cur.execute("PRAGMA table_info(sesiones_clinicas);")
@@ -438,6 +1824,12 @@ def init_db() -> None:
         WHERE fecha_registro IS NULL OR trim(fecha_registro) = '';
     """)
 
+    # --- Tamaño de contenido / contenido_html (para listar sin leer los cuerpos) ---
+    asegurar_tamanos_sesiones(cur)
+
+    # --- Búsqueda de texto completo (FTS5) sobre notas clínicas ---
+    asegurar_busqueda_clinica(cur)
+
     # Tabla de paquetes de arriendo de consultorio
     cur.execute(
         """
@@ -581,8 +1973,17 @@ def init_db() -> None:
     );
     """
 )
+
+    # --- Resúmenes financieros mensuales materializados ---
+    asegurar_resumenes_financieros(cur)
+
+    # --- Índices por fecha para los reportes por rango ---
+    asegurar_indices_reportes_financieros(cur)
     
     conn.commit()
+
+    # Fechas en texto -> ISO (una sola vez; confirma por lotes y es reanudable)
+    migrar_fechas_iso(conn)
     conn.close()
     
     
@@ -593,57 +1994,78 @@ def init_db() -> None:
 
 # ------------ PACIENTES -------------
 
+# Funciones a las que se avisa cuando cambia un paciente: reciben el documento,
+# o None si pudo cambiar todo (p. ej. al restaurar un backup).
+_OYENTES_PACIENTES: List[Callable[[Optional[str]], None]] = []
+
+
+def registrar_oyente_pacientes(fn: Callable[[Optional[str]], None]) -> None:
+    if fn not in _OYENTES_PACIENTES:
+        _OYENTES_PACIENTES.append(fn)
+
+
+def notificar_cambio_paciente(documento: Optional[str] = None) -> None:
+    for fn in list(_OYENTES_PACIENTES):
+        try:
+            fn(documento)
+        except Exception:
+            # Un índice desactualizado no debe tumbar la escritura
+            pass
+
 
 def crear_paciente(paciente: Dict[str, Any]) -> None:
     """Inserta un nuevo paciente en la base de datos."""
     conn = get_connection()
     cur = conn.cursor()
 
-    datos = dict(paciente)
-    # Compatibilidad: si no viene indicativo_pais, asumimos Colombia (57)
-    datos.setdefault('indicativo_pais', '57')
-
-    cur.execute(
-        """
-        INSERT INTO pacientes (
-            documento,
-            tipo_documento,
-            nombre_completo,
-            fecha_nacimiento,
-            sexo,
-            estado_civil,
-            escolaridad,
-            eps,
-            direccion,
-            email,
-            indicativo_pais,
-            telefono,
-            contacto_emergencia_nombre,
-            contacto_emergencia_telefono,
-            observaciones
-        ) VALUES (
-            :documento,
-            :tipo_documento,
-            :nombre_completo,
-            :fecha_nacimiento,
-            :sexo,
-            :estado_civil,
-            :escolaridad,
-            :eps,
-            :direccion,
-            :email,
-            :indicativo_pais,
-            :telefono,
-            :contacto_emergencia_nombre,
-            :contacto_emergencia_telefono,
-            :observaciones
-        );
-        """,
-        datos,
-    )
+    try:
+        datos = dict(paciente)
+        # Compatibilidad: si no viene indicativo_pais, asumimos Colombia (57)
+        datos.setdefault('indicativo_pais', '57')
+        datos['fecha_nacimiento'] = fecha_a_bd(datos.get('fecha_nacimiento'))
 
-    conn.commit()
-    conn.close()
+        cur.execute(
+            """
+            INSERT INTO pacientes (
+                documento,
+                tipo_documento,
+                nombre_completo,
+                fecha_nacimiento,
+                sexo,
+                estado_civil,
+                escolaridad,
+                eps,
+                direccion,
+                email,
+                indicativo_pais,
+                telefono,
+                contacto_emergencia_nombre,
+                contacto_emergencia_telefono,
+                observaciones
+            ) VALUES (
+                :documento,
+                :tipo_documento,
+                :nombre_completo,
+                :fecha_nacimiento,
+                :sexo,
+                :estado_civil,
+                :escolaridad,
+                :eps,
+                :direccion,
+                :email,
+                :indicativo_pais,
+                :telefono,
+                :contacto_emergencia_nombre,
+                :contacto_emergencia_telefono,
+                :observaciones
+            );
+            """,
+            datos,
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    notificar_cambio_paciente(datos["documento"])
 
 def listar_pacientes() -> List[sqlite3.Row]:
     conn = get_connection()
@@ -658,6 +2080,84 @@ def listar_pacientes() -> List[sqlite3.Row]:
     conn.close()
     return filas
 
+# Columnas por las que se puede ordenar la tabla paginada (todas NOT NULL e indexadas)
+_COLUMNAS_ORDEN_PACIENTES = ("documento", "tipo_documento", "nombre_completo")
+
+
+def listar_pacientes_pagina(
+    limite: int = 50,
+    orden: str = "nombre_completo",
+    descendente: bool = False,
+    despues_de: Optional[Tuple[Any, str]] = None,
+) -> List[sqlite3.Row]:
+    """
+    Una página de pacientes con paginación por llave (keyset), sin OFFSET.
+
+    - orden: una de _COLUMNAS_ORDEN_PACIENTES (se desempata por documento).
+    - despues_de: (valor de la columna de orden, documento) de la última fila
+      de la página anterior; None para la primera página.
+
+    El costo no crece con el número de página: SQLite salta directo al
+    cursor usando el índice (orden COLLATE NOCASE, documento).
+    """
+    if orden not in _COLUMNAS_ORDEN_PACIENTES:
+        raise ValueError(f"No se puede ordenar pacientes por '{orden}'.")
+
+    op = "<" if descendente else ">"
+    direccion = "DESC" if descendente else "ASC"
+    if orden == "documento":
+        clave_sql = "documento"
+        orden_sql = f"documento {direccion}"
+    else:
+        clave_sql = f"({orden}, documento)"
+        orden_sql = f"{orden} COLLATE NOCASE {direccion}, documento {direccion}"
+
+    where = ""
+    params: List[Any] = []
+    if despues_de is not None:
+        if orden == "documento":
+            where = f"WHERE documento {op} ?"
+            params.append(despues_de[1])
+        else:
+            # El COLLATE va en el lado derecho para que SQLite busque en el índice (SEARCH, no SCAN)
+            where = f"WHERE {clave_sql} {op} (? COLLATE NOCASE, ?)"
+            params.extend([despues_de[0], despues_de[1]])
+    params.append(int(limite))
+
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        SELECT *
+        FROM pacientes
+        {where}
+        ORDER BY {orden_sql}
+        LIMIT ?;
+        """,
+        params,
+    )
+    filas = cur.fetchall()
+    conn.close()
+    return filas
+
+
+def listar_eps_registradas() -> List[str]:
+    """Valores distintos de EPS ya usados (para autocompletar)."""
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT DISTINCT trim(eps) AS eps
+        FROM pacientes
+        WHERE eps IS NOT NULL AND trim(eps) <> ''
+        ORDER BY eps COLLATE NOCASE;
+        """
+    )
+    valores = [r[0] for r in cur.fetchall()]
+    conn.close()
+    return valores
+
+
 def obtener_paciente(documento: str) -> Optional[sqlite3.Row]:
     """Obtiene un paciente por su documento."""
     conn = get_connection()
@@ -676,35 +2176,38 @@ def actualizar_paciente(paciente: Dict[str, Any]) -> None:
     conn = get_connection()
     cur = conn.cursor()
 
-    datos = dict(paciente)
-    datos.setdefault('indicativo_pais', '57')
-
-    cur.execute(
-        """
-        UPDATE pacientes
-        SET
-            tipo_documento = :tipo_documento,
-            nombre_completo = :nombre_completo,
-            fecha_nacimiento = :fecha_nacimiento,
-            sexo = :sexo,
-            estado_civil = :estado_civil,
-            escolaridad = :escolaridad,
-            eps = :eps,
-            direccion = :direccion,
-            email = :email,
-            indicativo_pais = :indicativo_pais,
-            telefono = :telefono,
-            contacto_emergencia_nombre = :contacto_emergencia_nombre,
-            contacto_emergencia_telefono = :contacto_emergencia_telefono,
-            observaciones = :observaciones,
-            updated_at = datetime('now','localtime')
-        WHERE documento = :documento;
-        """,
-        paciente,
-    )
+    try:
+        datos = dict(paciente)
+        datos.setdefault('indicativo_pais', '57')
+        datos['fecha_nacimiento'] = fecha_a_bd(datos.get('fecha_nacimiento'))
 
-    conn.commit()
-    conn.close()
+        cur.execute(
+            """
+            UPDATE pacientes
+            SET
+                tipo_documento = :tipo_documento,
+                nombre_completo = :nombre_completo,
+                fecha_nacimiento = :fecha_nacimiento,
+                sexo = :sexo,
+                estado_civil = :estado_civil,
+                escolaridad = :escolaridad,
+                eps = :eps,
+                direccion = :direccion,
+                email = :email,
+                indicativo_pais = :indicativo_pais,
+                telefono = :telefono,
+                contacto_emergencia_nombre = :contacto_emergencia_nombre,
+                contacto_emergencia_telefono = :contacto_emergencia_telefono,
+                observaciones = :observaciones,
+                updated_at = datetime('now','localtime')
+            WHERE documento = :documento;
+            """,
+            datos,
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    notificar_cambio_paciente(datos["documento"])
 
 
 def eliminar_paciente(documento: str) -> None:
@@ -718,6 +2221,16 @@ def eliminar_paciente(documento: str) -> None:
     cur.execute("DELETE FROM antecedentes_psicologicos WHERE documento_paciente = ?;", (documento,))
 
     # Eliminar sesiones e historia clínica asociada
+    cur.execute(
+        """
+        SELECT id FROM sesiones_clinicas
+        WHERE historia_id IN (
+            SELECT id FROM historia_clinica WHERE documento_paciente = ?
+        );
+        """,
+        (documento,),
+    )
+    sesiones_ids = [fila[0] for fila in cur.fetchall()]
     cur.execute(
         """
         DELETE FROM sesiones_clinicas
@@ -734,6 +2247,10 @@ def eliminar_paciente(documento: str) -> None:
 
     conn.commit()
     conn.close()
+    for sesion_id in sesiones_ids:
+        _CUERPOS_SESION.invalidar(sesion_id)
+    marcar_agenda_modificada()
+    notificar_cambio_paciente(documento)
 
 
 # --------- ANTECEDENTES MÉDICOS / PSICOLÓGICOS ---------
@@ -986,152 +2503,841 @@ def eliminar_diagnostico_historia(dx_id: int):
 from typing import Any, Dict, List, Optional
 import sqlite3
 
-def listar_sesiones_clinicas(historia_id: int) -> List[sqlite3.Row]:
-    """Lista sesiones clínicas de una historia, ordenadas de la más reciente a la más antigua."""
+# Columnas de sesiones_clinicas sin los cuerpos (contenido / contenido_html)
+_COLUMNAS_RESUMEN_SESION = """
+            s.id,
+            s.historia_id,
+            s.fecha,
+            s.titulo,
+            s.observaciones,
+            s.cita_id,
+            s.fecha_registro,
+            s.tamano_contenido,
+            s.tamano_html"""
+
+# Columnas de la cita vinculada que acompañan a cada sesión (LEFT JOIN)
+_COLUMNAS_CITA_SESION = """
+            c.fecha_hora AS cita_fecha_hora,
+            c.estado AS cita_estado"""
+
+
+def listar_sesiones_clinicas(historia_id: int) -> List[sqlite3.Row]:
+    """
+    Lista sesiones clínicas de una historia, ordenadas de la más reciente a la más antigua.
+    Trae todas las columnas (contenido y contenido_html ya descomprimido, p. ej.
+    para el PDF) más cita_fecha_hora / cita_estado de la cita vinculada (NULL si no hay).
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        SELECT{_COLUMNAS_RESUMEN_SESION},
+            s.contenido,
+            descomprimir_html(s.contenido_html) AS contenido_html,{_COLUMNAS_CITA_SESION}
+        FROM sesiones_clinicas s
+        LEFT JOIN citas c ON c.id = s.cita_id
+        WHERE s.historia_id = ?
+        ORDER BY s.fecha DESC, s.id DESC;
+        """,
+        (historia_id,),
+    )
+    filas = cur.fetchall()
+    conn.close()
+    return filas
+
+
+def listar_sesiones_clinicas_resumen(historia_id: int) -> List[sqlite3.Row]:
+    """
+    Igual que listar_sesiones_clinicas() pero sin contenido / contenido_html,
+    para listados: una sola consulta con la fecha y el estado de la cita
+    vinculada, y tamano_contenido / tamano_html (caracteres) en vez de los
+    cuerpos. Para editar una sesión usar obtener_sesion_clinica(id) y para el
+    texto, obtener_cuerpo_sesion(id).
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        SELECT{_COLUMNAS_RESUMEN_SESION},{_COLUMNAS_CITA_SESION}
+        FROM sesiones_clinicas s
+        LEFT JOIN citas c ON c.id = s.cita_id
+        WHERE s.historia_id = ?
+        ORDER BY s.fecha DESC, s.id DESC;
+        """,
+        (historia_id,),
+    )
+    filas = cur.fetchall()
+    conn.close()
+    return filas
+
+
+def obtener_sesion_clinica(sesion_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Sesión clínica completa como dict: columnas del resumen + datos de la cita
+    vinculada + contenido / contenido_html (vía obtener_cuerpo_sesion, con caché).
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        SELECT{_COLUMNAS_RESUMEN_SESION},{_COLUMNAS_CITA_SESION}
+        FROM sesiones_clinicas s
+        LEFT JOIN citas c ON c.id = s.cita_id
+        WHERE s.id = ?;
+        """,
+        (int(sesion_id),),
+    )
+    fila = cur.fetchone()
+    conn.close()
+    if fila is None:
+        return None
+
+    sesion = dict(fila)
+    sesion.update(obtener_cuerpo_sesion(sesion["id"]) or {"contenido": "", "contenido_html": ""})
+    return sesion
+
+
+def _normalizar_cita_id(valor: Any) -> Optional[int]:
+    """
+    Convierte a int si es válido, si no devuelve None.
+    Acepta None, "", "  ", 0 (lo vuelve None), "123", 123.
+    """
+    if valor is None:
+        return None
+    if isinstance(valor, str):
+        valor = valor.strip()
+        if not valor:
+            return None
+    try:
+        n = int(valor)
+        return n if n > 0 else None
+    except Exception:
+        return None
+
+
+def _now_ts() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def guardar_sesion_clinica(datos: Dict[str, Any]) -> int:
+    """
+    Crea o actualiza una sesión clínica.
+
+    NUEVO:
+      - fecha_registro: timestamp de creación (cuando se registró la sesión)
+        * En INSERT se asigna automáticamente.
+        * En UPDATE NO se modifica (se conserva el registro original).
+      - contenido_html (opcional): si viene en `datos` se guarda (comprimido
+        según los ajustes); si no viene, no se toca el HTML existente.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+
+    sesion_id = datos.get("id")
+    historia_id = datos.get("historia_id")
+    fecha = datos.get("fecha")
+    titulo = datos.get("titulo")
+    contenido = datos.get("contenido")
+    observaciones = datos.get("observaciones")
+
+    cita_id = _normalizar_cita_id(datos.get("cita_id"))
+    con_html = "contenido_html" in datos
+    contenido_html = _html_para_guardar(datos.get("contenido_html")) if con_html else None
+    tamano_html = len(datos.get("contenido_html") or "") if con_html else 0
+
+    # --- Validación opcional: 1 cita -> 1 sesión clínica ---
+    if cita_id is not None:
+        if sesion_id:
+            cur.execute(
+                "SELECT id FROM sesiones_clinicas WHERE cita_id = ? AND id <> ? LIMIT 1;",
+                (cita_id, sesion_id),
+            )
+        else:
+            cur.execute(
+                "SELECT id FROM sesiones_clinicas WHERE cita_id = ? LIMIT 1;",
+                (cita_id,),
+            )
+        dup = cur.fetchone()
+        if dup:
+            conn.close()
+            dup_id = dup["id"] if isinstance(dup, sqlite3.Row) else dup[0]
+            raise ValueError(
+                f"Esta cita (id={cita_id}) ya está vinculada a otra sesión clínica (sesión id={dup_id})."
+            )
+
+    if sesion_id:
+        # UPDATE: NO tocar fecha_registro (se conserva)
+        cur.execute(
+            """
+            UPDATE sesiones_clinicas
+            SET fecha = ?, titulo = ?, contenido = ?, observaciones = ?, cita_id = ?
+            WHERE id = ?;
+            """,
+            (
+                fecha,
+                titulo,
+                contenido,
+                observaciones,
+                cita_id,
+                sesion_id,
+            ),
+        )
+
+        # Blindaje: si quedó vacío por migraciones viejas, lo setea una sola vez
+        cur.execute(
+            """
+            UPDATE sesiones_clinicas
+            SET fecha_registro = COALESCE(NULLIF(trim(fecha_registro), ''), ?)
+            WHERE id = ?;
+            """,
+            (_now_ts(), sesion_id),
+        )
+
+        if con_html:
+            cur.execute(
+                "UPDATE sesiones_clinicas SET contenido_html = ?, tamano_html = ? WHERE id = ?;",
+                (contenido_html, tamano_html, sesion_id),
+            )
+
+    else:
+        # INSERT: asignar fecha_registro = NOW
+        cur.execute(
+            """
+            INSERT INTO sesiones_clinicas (
+                historia_id,
+                fecha,
+                titulo,
+                contenido,
+                observaciones,
+                cita_id,
+                fecha_registro,
+                contenido_html,
+                tamano_html
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
+            """,
+            (
+                historia_id,
+                fecha,
+                titulo,
+                contenido,
+                observaciones,
+                cita_id,
+                _now_ts(),
+                contenido_html,
+                tamano_html,
+            ),
+        )
+        sesion_id = cur.lastrowid
+
+    _indexar_sesiones(cur, [sesion_id])
+    conn.commit()
+    conn.close()
+    _CUERPOS_SESION.invalidar(sesion_id)
+    return int(sesion_id)
+
+def eliminar_sesion_clinica(sesion_id: int) -> None:
+    """Elimina una sesión clínica por id."""
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM sesiones_clinicas WHERE id = ?;", (sesion_id,))
+    conn.commit()
+    conn.close()
+    _CUERPOS_SESION.invalidar(sesion_id)
+
+
+# ------------ CUERPOS DE SESIONES CLÍNICAS (bajo demanda) -------------
+#
+# contenido / contenido_html pueden pesar decenas de KB por sesión. Los
+# listados usan listar_sesiones_clinicas_resumen() (sin cuerpos, con
+# tamano_contenido / tamano_html que mantienen triggers) y el texto se lee solo
+# al abrir una sesión, con una caché LRU de las últimas notas abiertas.
+# Toda escritura de cuerpos pasa por guardar_sesion_clinica() /
+# guardar_html_sesion() / eliminar_sesion_clinica() / eliminar_paciente(),
+# que invalidan la caché.
+
+CACHE_CUERPOS_MAX_SESIONES = 32
+CACHE_CUERPOS_MAX_CHARS = 4_000_000
+
+
+class _CacheCuerposSesion:
+    """LRU thread-safe {(bd, sesion_id): {"contenido", "contenido_html"}} acotada por cantidad y tamaño."""
+
+    def __init__(self, max_sesiones: int = CACHE_CUERPOS_MAX_SESIONES, max_chars: int = CACHE_CUERPOS_MAX_CHARS):
+        self.max_sesiones = max(1, int(max_sesiones))
+        self.max_chars = max(0, int(max_chars))
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[Tuple[str, int], Dict[str, str]]" = OrderedDict()
+        self._chars = 0
+        self.aciertos = 0
+        self.fallos = 0
+
+    @staticmethod
+    def _clave(sesion_id: int) -> Tuple[str, int]:
+        # La ruta en la clave evita mezclar BDs (tests/benchmarks/restauración)
+        return (str(DB_PATH), int(sesion_id))
+
+    @staticmethod
+    def _tamano(cuerpo: Dict[str, str]) -> int:
+        return len(cuerpo["contenido"]) + len(cuerpo["contenido_html"])
+
+    def obtener(self, sesion_id: int) -> Optional[Dict[str, str]]:
+        clave = self._clave(sesion_id)
+        with self._lock:
+            cuerpo = self._items.get(clave)
+            if cuerpo is None:
+                self.fallos += 1
+                return None
+            self._items.move_to_end(clave)
+            self.aciertos += 1
+            return cuerpo
+
+    def guardar(self, sesion_id: int, cuerpo: Dict[str, str]) -> None:
+        tamano = self._tamano(cuerpo)
+        if tamano > self.max_chars:
+            return
+        clave = self._clave(sesion_id)
+        with self._lock:
+            viejo = self._items.pop(clave, None)
+            if viejo is not None:
+                self._chars -= self._tamano(viejo)
+            self._items[clave] = cuerpo
+            self._chars += tamano
+            while len(self._items) > self.max_sesiones or self._chars > self.max_chars:
+                _, sacado = self._items.popitem(last=False)
+                self._chars -= self._tamano(sacado)
+
+    def invalidar(self, sesion_id: Optional[int] = None) -> None:
+        """Quita una sesión (o todas si sesion_id es None)."""
+        with self._lock:
+            if sesion_id is None:
+                self._items.clear()
+                self._chars = 0
+                return
+            try:
+                clave = self._clave(sesion_id)
+            except (TypeError, ValueError):
+                return
+            viejo = self._items.pop(clave, None)
+            if viejo is not None:
+                self._chars -= self._tamano(viejo)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sesiones": len(self._items),
+                "chars": self._chars,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+            }
+
+
+_CUERPOS_SESION = _CacheCuerposSesion()
+
+
+def asegurar_tamanos_sesiones(cur: sqlite3.Cursor) -> None:
+    """
+    Migración segura: sesiones_clinicas.tamano_contenido / tamano_html
+    (caracteres), mantenidas por triggers y con backfill de las filas existentes.
+    """
+    cur.execute("PRAGMA table_info(sesiones_clinicas);")
+    cols = [row[1] for row in cur.fetchall()]
+    nuevas = False
+    for col in ("tamano_contenido", "tamano_html"):
+        if col not in cols:
+            cur.execute(f"ALTER TABLE sesiones_clinicas ADD COLUMN {col} INTEGER NOT NULL DEFAULT 0;")
+            nuevas = True
+
+    # tamano_html es el largo del HTML ya descomprimido (no lo que ocupa en disco).
+    # Un BLOB comprimido no se puede medir en SQL estándar: para esos el trigger
+    # conserva el tamano_html que escribió la app en la misma sentencia
+    # (guardar_sesion_clinica / guardar_html_sesion).
+    # Los triggers se recrean siempre para que cambios aquí apliquen a BDs existentes.
+    set_sql = (
+        "tamano_contenido = COALESCE(length(NEW.contenido), 0), "
+        "tamano_html = CASE WHEN typeof(NEW.contenido_html) = 'blob' "
+        "THEN NEW.tamano_html ELSE COALESCE(length(NEW.contenido_html), 0) END"
+    )
+    cur.execute("DROP TRIGGER IF EXISTS trg_sesiones_clinicas_tamano_ins;")
+    cur.execute("DROP TRIGGER IF EXISTS trg_sesiones_clinicas_tamano_upd;")
+    cur.execute(
+        f"""
+        CREATE TRIGGER trg_sesiones_clinicas_tamano_ins
+        AFTER INSERT ON sesiones_clinicas
+        BEGIN
+            UPDATE sesiones_clinicas SET {set_sql} WHERE id = NEW.id;
+        END;
+        """
+    )
+    cur.execute(
+        f"""
+        CREATE TRIGGER trg_sesiones_clinicas_tamano_upd
+        AFTER UPDATE OF contenido, contenido_html ON sesiones_clinicas
+        BEGIN
+            UPDATE sesiones_clinicas SET {set_sql} WHERE id = NEW.id;
+        END;
+        """
+    )
+
+    if nuevas:
+        cur.execute(
+            """
+            UPDATE sesiones_clinicas
+            SET tamano_contenido = COALESCE(length(contenido), 0),
+                tamano_html = COALESCE(length(contenido_html), 0)
+            WHERE typeof(contenido_html) <> 'blob';
+            """
+        )
+        cur.execute("SELECT id, contenido_html FROM sesiones_clinicas WHERE typeof(contenido_html) = 'blob';")
+        cur.executemany(
+            "UPDATE sesiones_clinicas SET tamano_html = ? WHERE id = ?;",
+            [(len(decompress_str(f[1])), f[0]) for f in cur.fetchall()],
+        )
+
+
+def obtener_cuerpo_sesion(sesion_id: int) -> Optional[Dict[str, str]]:
+    """
+    {"contenido", "contenido_html"} de una sesión ("" si están vacíos), o None
+    si no existe. Las últimas sesiones abiertas se sirven desde la caché.
+    """
+    cuerpo = _CUERPOS_SESION.obtener(sesion_id)
+    if cuerpo is not None:
+        return cuerpo
+
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT contenido, descomprimir_html(contenido_html) AS contenido_html FROM sesiones_clinicas WHERE id = ?;",
+        (int(sesion_id),),
+    )
+    fila = cur.fetchone()
+    conn.close()
+    if fila is None:
+        return None
+
+    cuerpo = {"contenido": fila["contenido"] or "", "contenido_html": fila["contenido_html"] or ""}
+    _CUERPOS_SESION.guardar(sesion_id, cuerpo)
+    return cuerpo
+
+
+def obtener_html_sesion(sesion_id: int) -> str:
+    """contenido_html de la sesión ("" si no tiene o no existe)."""
+    cuerpo = obtener_cuerpo_sesion(sesion_id)
+    return cuerpo["contenido_html"] if cuerpo else ""
+
+
+def tamano_html_sesion(sesion_id: int) -> int:
+    """Largo de contenido_html sin leerlo (columna tamano_html); 0 si no existe."""
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT tamano_html FROM sesiones_clinicas WHERE id = ?;", (int(sesion_id),))
+    fila = cur.fetchone()
+    conn.close()
+    return int(fila[0] or 0) if fila else 0
+
+
+def guardar_html_sesion(sesion_id: int, html: str) -> bool:
+    """
+    Guarda el HTML del editor enriquecido en la sesión (comprimido si está
+    activa la compresión de notas). Devuelve False si la sesión no existe.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE sesiones_clinicas SET contenido_html = ?, tamano_html = ? WHERE id = ?;",
+        (_html_para_guardar(html), len(html or ""), int(sesion_id)),
+    )
+    actualizadas = cur.rowcount
+    if actualizadas:
+        _indexar_sesiones(cur, [sesion_id])
+    conn.commit()
+    conn.close()
+    _CUERPOS_SESION.invalidar(sesion_id)
+    return actualizadas > 0
+
+
+def invalidar_cache_cuerpos_sesion() -> None:
+    """Vacía la caché de cuerpos (p. ej. después de restaurar un backup)."""
+    _CUERPOS_SESION.invalidar()
+
+
+def estadisticas_cache_cuerpos_sesion() -> Dict[str, Any]:
+    return _CUERPOS_SESION.estadisticas()
+
+
+# ------------ COMPRESIÓN DE NOTAS (contenido_html) -------------
+#
+# El editor enriquecido guarda el HTML completo de Quill en cada guardado.
+# Con compresion_html activa (configuracion_almacenamiento) se guarda como
+# BLOB "zlib::..." / "zstd::..." (ver compresion_utils); la lectura es
+# transparente: obtener_cuerpo_sesion / listar_sesiones_clinicas usan la
+# función SQL descomprimir_html y _indexar_sesiones (FTS) también descomprime.
+# La compresión es opcional (por defecto "no"): las filas ya guardadas solo se
+# comprimen cuando el usuario lo pide desde admin (comprimir_html_sesiones).
+
+COMPRESION_LOTE = 200
+
+
+def _html_para_guardar(html: Optional[str]) -> Any:
+    """HTML listo para la columna: comprimido si está activa la compresión y vale la pena."""
+    if not html:
+        return html
+    algoritmo = ajustes_almacenamiento()["compresion_html"]
+    if algoritmo == "no":
+        return html
+    return compress_str(html, algoritmo=algoritmo)
+
+
+def comprimir_html_sesiones(
+    lote: int = COMPRESION_LOTE,
+    max_filas: Optional[int] = None,
+    progreso: Optional[Callable[[int], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Comprime con el algoritmo configurado el contenido_html guardado como texto
+    plano. Confirma cada lote (se puede interrumpir y retomar) y devuelve cuánto
+    se ahorró:
+        {"revisadas", "comprimidas", "bytes_antes", "bytes_despues", "ahorro_bytes", "pendientes"}
+    `max_filas` acota el trabajo de una pasada. Lanza ValueError si la
+    compresión de notas está desactivada.
+    """
+    algoritmo = ajustes_almacenamiento()["compresion_html"]
+    if algoritmo == "no":
+        raise ValueError("La compresión de notas está desactivada. Elige zlib o zstd y guarda los ajustes.")
+
+    res: Dict[str, Any] = {
+        "revisadas": 0,
+        "comprimidas": 0,
+        "bytes_antes": 0,
+        "bytes_despues": 0,
+        "ahorro_bytes": 0,
+        "pendientes": False,
+    }
+    ultimo_id = 0
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        while True:
+            limite = lote if max_filas is None else min(lote, max_filas - res["revisadas"])
+            if limite <= 0:
+                res["pendientes"] = True
+                break
+            cur.execute(
+                """
+                SELECT id, contenido_html
+                FROM sesiones_clinicas
+                WHERE id > ? AND typeof(contenido_html) = 'text' AND length(contenido_html) > 0
+                ORDER BY id
+                LIMIT ?;
+                """,
+                (ultimo_id, limite),
+            )
+            filas = cur.fetchall()
+            if not filas:
+                break
+
+            cambios = []
+            for fila in filas:
+                html = fila["contenido_html"]
+                guardado = compress_str(html, algoritmo=algoritmo)
+                if isinstance(guardado, bytes):
+                    antes = len(html.encode("utf-8"))
+                    res["comprimidas"] += 1
+                    res["bytes_antes"] += antes
+                    res["bytes_despues"] += len(guardado)
+                    cambios.append((guardado, fila["id"]))
+            res["revisadas"] += len(filas)
+            ultimo_id = filas[-1]["id"]
+
+            if cambios:
+                cur.executemany("UPDATE sesiones_clinicas SET contenido_html = ? WHERE id = ?;", cambios)
+            conn.commit()
+            if progreso is not None:
+                progreso(res["revisadas"])
+    finally:
+        conn.close()
+
+    res["ahorro_bytes"] = res["bytes_antes"] - res["bytes_despues"]
+    return res
+
+
+def estadisticas_compresion_html() -> Dict[str, Any]:
+    """Sesiones con HTML comprimido / sin comprimir y bytes que ocupa la columna."""
     conn = get_connection()
     cur = conn.cursor()
     cur.execute(
         """
-        SELECT *
-        FROM sesiones_clinicas
-        WHERE historia_id = ?
-        ORDER BY fecha DESC, id DESC;
-        """,
-        (historia_id,),
+        SELECT
+            COALESCE(SUM(typeof(contenido_html) = 'blob'), 0) AS comprimidas,
+            COALESCE(SUM(typeof(contenido_html) = 'text' AND length(contenido_html) > 0), 0) AS sin_comprimir,
+            COALESCE(SUM(length(CAST(contenido_html AS BLOB))), 0) AS bytes_guardados,
+            COALESCE(SUM(tamano_html), 0) AS chars_html
+        FROM sesiones_clinicas;
+        """
     )
-    filas = cur.fetchall()
+    fila = dict(cur.fetchone())
     conn.close()
-    return filas
+    return fila
 
 
-def _normalizar_cita_id(valor: Any) -> Optional[int]:
-    """
-    Convierte a int si es válido, si no devuelve None.
-    Acepta None, "", "  ", 0 (lo vuelve None), "123", 123.
-    """
-    if valor is None:
-        return None
-    if isinstance(valor, str):
-        valor = valor.strip()
-        if not valor:
-            return None
-    try:
-        n = int(valor)
-        return n if n > 0 else None
-    except Exception:
-        return None
+# ------------ BÚSQUEDA EN NOTAS CLÍNICAS (FTS5) -------------
+
+# Cada fila de busqueda_clinica usa rowid = id_origen * 4 + código, así los
+# triggers borran/reemplazan por rowid sin recorrer la tabla.
+# origen -> (código, tabla, columnas que disparan reindexado, expresiones SQL con R = fila)
+#
+# Las sesiones son la excepción: su cuerpo es HTML (quizá comprimido) que hay
+# que pasar a texto, y eso no se puede hacer en SQL estándar. Para ellas solo
+# hay trigger de DELETE; las escrituras de la app las indexan con
+# _indexar_sesiones(). Si se editan sesiones con otra herramienta, llamar
+# reconstruir_busqueda_clinica() después.
+_FUENTES_BUSQUEDA: Dict[str, Tuple[int, str, Tuple[str, ...], Dict[str, str]]] = {
+    "sesion": (
+        0,
+        "sesiones_clinicas",
+        ("historia_id", "fecha", "titulo", "contenido", "contenido_html", "observaciones"),
+        {
+            "titulo": "COALESCE(R.titulo, '')",
+            # Parámetro: lo arma _cuerpo_busqueda_sesion() en Python
+            "cuerpo": "?",
+            "historia_id": "R.historia_id",
+            "documento_paciente": "(SELECT documento_paciente FROM historia_clinica WHERE id = R.historia_id)",
+            "fecha": "R.fecha",
+        },
+    ),
+    "historia": (
+        1,
+        "historia_clinica",
+        ("fecha_apertura", "motivo_consulta_inicial", "informacion_adicional"),
+        {
+            "titulo": "'Historia clínica'",
+            "cuerpo": "COALESCE(R.motivo_consulta_inicial, '') || char(10) || COALESCE(R.informacion_adicional, '')",
+            "historia_id": "R.id",
+            "documento_paciente": "R.documento_paciente",
+            "fecha": "R.fecha_apertura",
+        },
+    ),
+    "antecedente_medico": (
+        2,
+        "antecedentes_medicos",
+        ("descripcion",),
+        {
+            "titulo": "'Antecedente médico'",
+            "cuerpo": "COALESCE(R.descripcion, '')",
+            "historia_id": "(SELECT id FROM historia_clinica WHERE documento_paciente = R.documento_paciente)",
+            "documento_paciente": "R.documento_paciente",
+            "fecha": "R.fecha_registro",
+        },
+    ),
+    "antecedente_psicologico": (
+        3,
+        "antecedentes_psicologicos",
+        ("descripcion",),
+        {
+            "titulo": "'Antecedente psicológico'",
+            "cuerpo": "COALESCE(R.descripcion, '')",
+            "historia_id": "(SELECT id FROM historia_clinica WHERE documento_paciente = R.documento_paciente)",
+            "documento_paciente": "R.documento_paciente",
+            "fecha": "R.fecha_registro",
+        },
+    ),
+}
 
+_COLUMNAS_BUSQUEDA = ("titulo", "cuerpo", "origen", "ref_id", "historia_id", "documento_paciente", "fecha")
 
-def _now_ts() -> str:
-    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+# Orígenes sin triggers de INSERT/UPDATE (se indexan desde Python)
+_BUSQUEDA_INDEXADA_EN_PYTHON = ("sesion",)
 
-def guardar_sesion_clinica(datos: Dict[str, Any]) -> int:
-    """
-    Crea o actualiza una sesión clínica.
+BUSQUEDA_LOTE = 200
 
-    NUEVO:
-      - fecha_registro: timestamp de creación (cuando se registró la sesión)
-        * En INSERT se asigna automáticamente.
-        * En UPDATE NO se modifica (se conserva el registro original).
-    """
-    conn = get_connection()
-    cur = conn.cursor()
 
-    sesion_id = datos.get("id")
-    historia_id = datos.get("historia_id")
-    fecha = datos.get("fecha")
-    titulo = datos.get("titulo")
-    contenido = datos.get("contenido")
-    observaciones = datos.get("observaciones")
+def _sql_insertar_busqueda(origen: str, fila: str) -> str:
+    """INSERT ... SELECT para indexar filas de `origen`; `fila` es NEW (trigger) o el alias de la tabla."""
+    codigo, _, _, expr = _FUENTES_BUSQUEDA[origen]
+    valores = [
+        f"{fila}.id * 4 + {codigo}",
+        expr["titulo"].replace("R.", f"{fila}."),
+        expr["cuerpo"].replace("R.", f"{fila}."),
+        f"'{origen}'",
+        f"{fila}.id",
+        expr["historia_id"].replace("R.", f"{fila}."),
+        expr["documento_paciente"].replace("R.", f"{fila}."),
+        expr["fecha"].replace("R.", f"{fila}."),
+    ]
+    return (
+        f"INSERT INTO busqueda_clinica (rowid, {', '.join(_COLUMNAS_BUSQUEDA)}) "
+        f"SELECT {', '.join(valores)}"
+    )
 
-    cita_id = _normalizar_cita_id(datos.get("cita_id"))
 
-    # --- Validación opcional: 1 cita -> 1 sesión clínica ---
-    if cita_id is not None:
-        if sesion_id:
-            cur.execute(
-                "SELECT id FROM sesiones_clinicas WHERE cita_id = ? AND id <> ? LIMIT 1;",
-                (cita_id, sesion_id),
-            )
-        else:
-            cur.execute(
-                "SELECT id FROM sesiones_clinicas WHERE cita_id = ? LIMIT 1;",
-                (cita_id,),
-            )
-        dup = cur.fetchone()
-        if dup:
-            conn.close()
-            dup_id = dup["id"] if isinstance(dup, sqlite3.Row) else dup[0]
-            raise ValueError(
-                f"Esta cita (id={cita_id}) ya está vinculada a otra sesión clínica (sesión id={dup_id})."
-            )
+def asegurar_busqueda_clinica(cur: sqlite3.Cursor) -> None:
+    """
+    Crea la tabla FTS5 busqueda_clinica y los triggers que la mantienen al día
+    con sesiones, historia y antecedentes. Los triggers se recrean siempre para
+    que cambios en _FUENTES_BUSQUEDA apliquen a bases existentes.
+    """
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'busqueda_clinica';")
+    nueva = cur.fetchone() is None
+
+    # remove_diacritics: "ideacion" encuentra "ideación"
+    cur.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS busqueda_clinica USING fts5(
+            titulo,
+            cuerpo,
+            origen UNINDEXED,
+            ref_id UNINDEXED,
+            historia_id UNINDEXED,
+            documento_paciente UNINDEXED,
+            fecha UNINDEXED,
+            tokenize = 'unicode61 remove_diacritics 2'
+        );
+        """
+    )
+
+    for origen, (codigo, tabla, columnas, _) in _FUENTES_BUSQUEDA.items():
+        for sufijo in ("ins", "upd", "del"):
+            cur.execute(f"DROP TRIGGER IF EXISTS trg_busqueda_{tabla}_{sufijo};")
 
-    if sesion_id:
-        # UPDATE: NO tocar fecha_registro (se conserva)
         cur.execute(
+            f"""
+            CREATE TRIGGER trg_busqueda_{tabla}_del AFTER DELETE ON {tabla}
+            BEGIN
+                DELETE FROM busqueda_clinica WHERE rowid = OLD.id * 4 + {codigo};
+            END;
             """
-            UPDATE sesiones_clinicas
-            SET fecha = ?, titulo = ?, contenido = ?, observaciones = ?, cita_id = ?
-            WHERE id = ?;
-            """,
-            (
-                fecha,
-                titulo,
-                contenido,
-                observaciones,
-                cita_id,
-                sesion_id,
-            ),
         )
+        if origen in _BUSQUEDA_INDEXADA_EN_PYTHON:
+            continue
 
-        # Blindaje: si quedó vacío por migraciones viejas, lo setea una sola vez
+        insertar = _sql_insertar_busqueda(origen, "NEW")
         cur.execute(
+            f"""
+            CREATE TRIGGER trg_busqueda_{tabla}_ins AFTER INSERT ON {tabla}
+            BEGIN
+                {insertar};
+            END;
             """
-            UPDATE sesiones_clinicas
-            SET fecha_registro = COALESCE(NULLIF(trim(fecha_registro), ''), ?)
-            WHERE id = ?;
-            """,
-            (_now_ts(), sesion_id),
         )
-
-    else:
-        # INSERT: asignar fecha_registro = NOW
         cur.execute(
+            f"""
+            CREATE TRIGGER trg_busqueda_{tabla}_upd AFTER UPDATE OF {', '.join(columnas)} ON {tabla}
+            BEGIN
+                DELETE FROM busqueda_clinica WHERE rowid = OLD.id * 4 + {codigo};
+                {insertar};
+            END;
             """
-            INSERT INTO sesiones_clinicas (
-                historia_id,
-                fecha,
-                titulo,
-                contenido,
-                observaciones,
-                cita_id,
-                fecha_registro
-            ) VALUES (?, ?, ?, ?, ?, ?, ?);
-            """,
-            (
-                historia_id,
-                fecha,
-                titulo,
-                contenido,
-                observaciones,
-                cita_id,
-                _now_ts(),
-            ),
         )
-        sesion_id = cur.lastrowid
 
+    if nueva:
+        _poblar_busqueda_clinica(cur)
+
+
+def _cuerpo_busqueda_sesion(contenido: Any, contenido_html: Any, observaciones: Any) -> str:
+    """Texto indexado de una sesión: si hay HTML enriquecido, contenido es solo su vista previa."""
+    cuerpo = decompress_str(contenido_html) or (contenido or "")
+    return f"{_texto_plano_html(cuerpo)}\n{observaciones or ''}"
+
+
+def _indexar_sesiones(cur: sqlite3.Cursor, ids: Optional[Iterable[int]] = None) -> None:
+    """(Re)indexa en busqueda_clinica las sesiones `ids` (todas si es None)."""
+    codigo = _FUENTES_BUSQUEDA["sesion"][0]
+    if ids is None:
+        cur.execute("SELECT id FROM sesiones_clinicas ORDER BY id;")
+        ids = [fila[0] for fila in cur.fetchall()]
+    ids = [int(i) for i in ids]
+
+    insertar = f"{_sql_insertar_busqueda('sesion', 's')} FROM sesiones_clinicas s WHERE s.id = ?;"
+    for i in range(0, len(ids), BUSQUEDA_LOTE):
+        lote = ids[i:i + BUSQUEDA_LOTE]
+        marcas = ", ".join("?" * len(lote))
+        cur.execute(
+            f"SELECT id, contenido, contenido_html, observaciones FROM sesiones_clinicas WHERE id IN ({marcas});",
+            lote,
+        )
+        filas = cur.fetchall()
+        cur.executemany("DELETE FROM busqueda_clinica WHERE rowid = ?;", [(sid * 4 + codigo,) for sid in lote])
+        cur.executemany(
+            insertar,
+            [(_cuerpo_busqueda_sesion(f[1], f[2], f[3]), f[0]) for f in filas],
+        )
+
+
+def _poblar_busqueda_clinica(cur: sqlite3.Cursor) -> None:
+    cur.execute("DELETE FROM busqueda_clinica;")
+    for origen, (_, tabla, _, _) in _FUENTES_BUSQUEDA.items():
+        if origen in _BUSQUEDA_INDEXADA_EN_PYTHON:
+            continue
+        cur.execute(f"{_sql_insertar_busqueda(origen, 't')} FROM {tabla} t;")
+    _indexar_sesiones(cur)
+
+
+def reconstruir_busqueda_clinica() -> None:
+    """Vuelve a indexar todas las notas clínicas (p. ej. tras importar o editar datos por fuera de la app)."""
+    conn = get_connection()
+    cur = conn.cursor()
+    _poblar_busqueda_clinica(cur)
+    cur.execute("INSERT INTO busqueda_clinica (busqueda_clinica) VALUES ('optimize');")
     conn.commit()
     conn.close()
-    return int(sesion_id)
 
-def eliminar_sesion_clinica(sesion_id: int) -> None:
-    """Elimina una sesión clínica por id."""
+
+def _consulta_fts(texto: str) -> str:
+    """
+    Convierte lo que escribe el usuario en una consulta FTS5 segura:
+    cada palabra como prefijo entre comillas, todas requeridas (AND).
+    """
+    palabras = re.findall(r"\w+", texto or "")
+    return " ".join(f'"{p}"*' for p in palabras)
+
+
+def buscar_notas_clinicas(
+    texto: str,
+    limite: int = 50,
+    documento_paciente: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Busca en sesiones, historia clínica y antecedentes. Devuelve dicts con:
+      origen ('sesion' | 'historia' | 'antecedente_medico' | 'antecedente_psicologico'),
+      ref_id, historia_id, documento_paciente, nombre_completo, fecha, titulo,
+      fragmento (texto con la coincidencia entre « »), puntaje (menor = mejor).
+    """
+    consulta = _consulta_fts(texto)
+    if not consulta:
+        return []
+
+    filtro = ""
+    params: List[Any] = [consulta]
+    if documento_paciente:
+        filtro = "AND b.documento_paciente = ?"
+        params.append(documento_paciente)
+    params.append(int(limite))
+
     conn = get_connection()
     cur = conn.cursor()
-    cur.execute("DELETE FROM sesiones_clinicas WHERE id = ?;", (sesion_id,))
-    conn.commit()
+    cur.execute(
+        f"""
+        SELECT
+            b.origen,
+            b.ref_id,
+            b.historia_id,
+            b.documento_paciente,
+            p.nombre_completo,
+            b.fecha,
+            b.titulo,
+            snippet(busqueda_clinica, 1, '«', '»', '…', 16) AS fragmento,
+            bm25(busqueda_clinica, 5.0, 1.0) AS puntaje
+        FROM busqueda_clinica b
+        LEFT JOIN pacientes p ON p.documento = b.documento_paciente
+        WHERE busqueda_clinica MATCH ?
+          {filtro}
+        ORDER BY puntaje
+        LIMIT ?;
+        """,
+        params,
+    )
+    filas = [dict(r) for r in cur.fetchall()]
     conn.close()
-    
+    return filas
+
 def obtener_sesion_id_por_cita(cita_id: int) -> int | None:
     conn = get_connection()
     conn.row_factory = sqlite3.Row
@@ -1152,6 +3358,24 @@ def cita_tiene_sesion(cita_id: int) -> bool:
 
 # ===================== C I T A S =====================
 
+# Contador de cambios en citas/bloqueos. Los índices en memoria de la agenda
+# (ver agenda_intervalos.py) lo comparan para saber cuándo deben recargarse.
+_VERSION_AGENDA = 0
+_VERSION_AGENDA_LOCK = threading.Lock()
+
+
+def marcar_agenda_modificada() -> None:
+    """Invalida los índices en memoria de la agenda (llamar tras escribir citas/bloqueos)."""
+    global _VERSION_AGENDA
+    with _VERSION_AGENDA_LOCK:
+        _VERSION_AGENDA += 1
+
+
+def version_agenda() -> int:
+    """Versión actual de los datos de agenda (cambia en cada escritura de citas/bloqueos)."""
+    return _VERSION_AGENDA
+
+
 def crear_cita(cita: Dict[str, Any]) -> int:
     """
     Inserta una nueva cita en la base de datos.
@@ -1226,6 +3450,7 @@ def crear_cita(cita: Dict[str, Any]) -> int:
     cita_id = cur.lastrowid
     conn.commit()
     conn.close()
+    marcar_agenda_modificada()
     return int(cita_id)
 
 
@@ -1251,7 +3476,7 @@ def listar_citas() -> List[sqlite3.Row]:
         """
         SELECT *
         FROM citas
-        ORDER BY datetime(fecha_hora) ASC;
+        ORDER BY inicio_min ASC, id ASC;
         """
     )
     filas = cur.fetchall()
@@ -1274,14 +3499,13 @@ def listar_citas_rango(fecha_inicio: str, fecha_fin: str) -> List[sqlite3.Row]:
     cur = conn.cursor()
 
     cur.execute(
-        """
+        f"""
         SELECT *
         FROM citas
-        WHERE datetime(fecha_hora) < datetime(?)
-          AND datetime(fecha_hora_fin) > datetime(?)
-        ORDER BY datetime(fecha_hora) ASC;
+        WHERE {_where_solape("citas")}
+        ORDER BY inicio_min ASC;
         """,
-        (fecha_fin, fecha_inicio),
+        _params_solape(fecha_inicio, fecha_fin),
     )
 
     filas = cur.fetchall()
@@ -1305,7 +3529,7 @@ def listar_citas_con_paciente_rango(fecha_inicio: str, fecha_fin: str) -> List[s
     cur = conn.cursor()
 
     cur.execute(
-        """
+        f"""
         SELECT
             c.*,
             p.nombre_completo,
@@ -1315,11 +3539,10 @@ def listar_citas_con_paciente_rango(fecha_inicio: str, fecha_fin: str) -> List[s
         FROM citas c
         JOIN pacientes p
             ON p.documento = c.documento_paciente
-        WHERE datetime(c.fecha_hora) < datetime(?)
-          AND datetime(c.fecha_hora_fin) > datetime(?)
-        ORDER BY datetime(c.fecha_hora) ASC;
+        WHERE {_where_solape("citas", "c")}
+        ORDER BY c.inicio_min ASC;
         """,
-        (fecha_fin, fecha_inicio),
+        _params_solape(fecha_inicio, fecha_fin),
     )
 
     filas = cur.fetchall()
@@ -1342,7 +3565,7 @@ def listar_citas_con_paciente_y_servicio_rango(fecha_inicio: str, fecha_fin: str
 
     # OJO: asumimos tabla `servicios` con columnas (id, nombre)
     cur.execute(
-        """
+        f"""
         SELECT
             c.*,
             p.nombre_completo,
@@ -1355,11 +3578,10 @@ def listar_citas_con_paciente_y_servicio_rango(fecha_inicio: str, fecha_fin: str
             ON p.documento = c.documento_paciente
         LEFT JOIN servicios s
             ON s.id = c.servicio_id
-        WHERE datetime(c.fecha_hora) < datetime(?)
-          AND datetime(c.fecha_hora_fin) > datetime(?)
-        ORDER BY datetime(c.fecha_hora) ASC;
+        WHERE {_where_solape("citas", "c")}
+        ORDER BY c.inicio_min ASC;
         """,
-        (fecha_fin, fecha_inicio),
+        _params_solape(fecha_inicio, fecha_fin),
     )
 
     filas = cur.fetchall()
@@ -1407,24 +3629,22 @@ def existe_cita_en_rango(fecha_inicio: str, fecha_fin: str, cita_id_excluir: int
 
     if cita_id_excluir is None:
         cur.execute(
-            """
+            f"""
             SELECT COUNT(*)
             FROM citas
-            WHERE datetime(fecha_hora) < datetime(?)
-              AND datetime(fecha_hora_fin) > datetime(?);
+            WHERE {_where_solape("citas")};
             """,
-            (fecha_fin, fecha_inicio),
+            _params_solape(fecha_inicio, fecha_fin),
         )
     else:
         cur.execute(
-            """
+            f"""
             SELECT COUNT(*)
             FROM citas
-            WHERE datetime(fecha_hora) < datetime(?)
-              AND datetime(fecha_hora_fin) > datetime(?)
+            WHERE {_where_solape("citas")}
               AND id != ?;
             """,
-            (fecha_fin, fecha_inicio, cita_id_excluir),
+            (*_params_solape(fecha_inicio, fecha_fin), cita_id_excluir),
         )
 
     count = int(cur.fetchone()[0])
@@ -1477,6 +3697,7 @@ def actualizar_cita(cita_id: int, campos: Dict[str, Any]) -> None:
 
     conn.commit()
     conn.close()
+    marcar_agenda_modificada()
 
 
 def eliminar_cita(cita_id: int) -> None:
@@ -1488,6 +3709,7 @@ def eliminar_cita(cita_id: int) -> None:
 
     conn.commit()
     conn.close()
+    marcar_agenda_modificada()
 
 
 # =====================
@@ -1512,6 +3734,119 @@ def asegurar_migracion_citas(cur: sqlite3.Cursor) -> None:
         cur.execute("ALTER TABLE citas ADD COLUMN servicio_id INTEGER;")
 
 
+# Expresión SQL equivalente a _minutos_epoch() (minutos desde 1970-01-01, hora local "naive")
+_SQL_MINUTOS = "CAST(strftime('%s', {col}) AS INTEGER) / 60"
+
+# tabla -> (columna inicio, columna fin)
+_TABLAS_RANGO_TIEMPO: Dict[str, Tuple[str, str]] = {
+    "citas": ("fecha_hora", "fecha_hora_fin"),
+    "bloqueos_agenda": ("fecha_hora_inicio", "fecha_hora_fin"),
+}
+
+
+def _minutos_epoch(valor: Any) -> Optional[int]:
+    """
+    Convierte 'YYYY-MM-DD HH:MM[:SS]' (o con 'T', o solo 'YYYY-MM-DD', o datetime/date)
+    a minutos desde 1970-01-01. Devuelve None si no se puede interpretar.
+    Debe coincidir con _SQL_MINUTOS para que las comparaciones sean exactas.
+    """
+    if valor is None:
+        return None
+    if isinstance(valor, datetime):
+        dt = valor.replace(tzinfo=None)
+    elif isinstance(valor, date):
+        dt = datetime(valor.year, valor.month, valor.day)
+    else:
+        s = str(valor).strip()
+        if not s:
+            return None
+        try:
+            dt = datetime.fromisoformat(s)
+        except ValueError:
+            return None
+        dt = dt.replace(tzinfo=None)
+    return int((dt - datetime(1970, 1, 1)).total_seconds()) // 60
+
+
+def asegurar_columnas_rango_tiempo(cur: sqlite3.Cursor) -> None:
+    """
+    Migración segura para citas y bloqueos_agenda:
+      - columnas inicio_min / fin_min (INTEGER, minutos epoch)
+      - backfill de filas existentes
+      - triggers que las mantienen al insertar/actualizar
+      - índice compuesto (inicio_min, fin_min) + índice de duración
+    """
+    for tabla, (col_ini, col_fin) in _TABLAS_RANGO_TIEMPO.items():
+        cur.execute(f"PRAGMA table_info({tabla});")
+        cols = [row[1] for row in cur.fetchall()]
+        nuevas = False
+        if "inicio_min" not in cols:
+            cur.execute(f"ALTER TABLE {tabla} ADD COLUMN inicio_min INTEGER;")
+            nuevas = True
+        if "fin_min" not in cols:
+            cur.execute(f"ALTER TABLE {tabla} ADD COLUMN fin_min INTEGER;")
+            nuevas = True
+
+        set_sql = (
+            f"inicio_min = {_SQL_MINUTOS.format(col='NEW.' + col_ini)}, "
+            f"fin_min = {_SQL_MINUTOS.format(col='NEW.' + col_fin)}"
+        )
+        cur.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{tabla}_rango_ins
+            AFTER INSERT ON {tabla}
+            BEGIN
+                UPDATE {tabla} SET {set_sql} WHERE id = NEW.id;
+            END;
+            """
+        )
+        cur.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{tabla}_rango_upd
+            AFTER UPDATE OF {col_ini}, {col_fin} ON {tabla}
+            BEGIN
+                UPDATE {tabla} SET {set_sql} WHERE id = NEW.id;
+            END;
+            """
+        )
+
+        # Backfill (todas si las columnas son nuevas; si no, solo las que falten)
+        where = "" if nuevas else "WHERE inicio_min IS NULL OR fin_min IS NULL"
+        cur.execute(
+            f"""
+            UPDATE {tabla}
+            SET inicio_min = {_SQL_MINUTOS.format(col=col_ini)},
+                fin_min = {_SQL_MINUTOS.format(col=col_fin)}
+            {where};
+            """
+        )
+
+        cur.execute(f"CREATE INDEX IF NOT EXISTS ix_{tabla}_rango ON {tabla} (inicio_min, fin_min);")
+        # Permite MAX(duración) en O(log n) para acotar por abajo la búsqueda de solapes
+        cur.execute(f"CREATE INDEX IF NOT EXISTS ix_{tabla}_duracion ON {tabla} ((fin_min - inicio_min));")
+
+
+def _where_solape(tabla: str, alias: str = "") -> str:
+    """
+    Fragmento WHERE (3 parámetros, ver _params_solape) para filas que SE SOLAPAN
+    con [inicio, fin): (inicio_min < fin) AND (fin_min > inicio).
+
+    Se agrega la cota inferior inicio_min > inicio - duración_máxima para que
+    el índice (inicio_min, fin_min) haga un range scan acotado por ambos lados.
+    """
+    p = f"{alias}." if alias else ""
+    return (
+        f"{p}inicio_min < ? "
+        f"AND {p}inicio_min > ? - COALESCE((SELECT MAX(fin_min - inicio_min) FROM {tabla}), 0) "
+        f"AND {p}fin_min > ?"
+    )
+
+
+def _params_solape(fecha_inicio: Any, fecha_fin: Any) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+    ini = _minutos_epoch(fecha_inicio)
+    return (_minutos_epoch(fecha_fin), ini, ini)
+
+
 # ------------ CONFIGURACIÓN PROFESIONAL -------------
 
 
@@ -1688,6 +4023,7 @@ def crear_bloqueo(bloqueo: Dict[str, Any]) -> int:
     bloqueo_id = cur.lastrowid
     conn.commit()
     conn.close()
+    marcar_agenda_modificada()
     return bloqueo_id
 
 
@@ -1700,13 +4036,13 @@ def listar_bloqueos_rango(fecha_inicio: str, fecha_fin: str) -> List[Any]:
     cur = conn.cursor()
 
     cur.execute(
-        """
+        f"""
         SELECT *
         FROM bloqueos_agenda
-        WHERE NOT (fecha_hora_fin <= ? OR fecha_hora_inicio >= ?)
-        ORDER BY fecha_hora_inicio;
+        WHERE {_where_solape("bloqueos_agenda")}
+        ORDER BY inicio_min;
         """,
-        (fecha_inicio, fecha_fin),
+        _params_solape(fecha_inicio, fecha_fin),
     )
 
     filas = cur.fetchall()
@@ -1737,6 +4073,7 @@ def actualizar_bloqueo(bloqueo_id: int, datos: Dict[str, Any]) -> None:
 
     conn.commit()
     conn.close()
+    marcar_agenda_modificada()
 
 
 def eliminar_bloqueo(bloqueo_id: int) -> None:
@@ -1751,6 +4088,7 @@ def eliminar_bloqueo(bloqueo_id: int) -> None:
 
     conn.commit()
     conn.close()
+    marcar_agenda_modificada()
 
 
 def existe_bloqueo_en_rango(fecha_inicio: str, fecha_fin: str, bloqueo_id_excluir: Optional[int] = None) -> bool:
@@ -1763,22 +4101,22 @@ def existe_bloqueo_en_rango(fecha_inicio: str, fecha_fin: str, bloqueo_id_exclui
 
     if bloqueo_id_excluir is None:
         cur.execute(
-            """
+            f"""
             SELECT COUNT(*)
             FROM bloqueos_agenda
-            WHERE NOT (fecha_hora_fin <= ? OR fecha_hora_inicio >= ?);
+            WHERE {_where_solape("bloqueos_agenda")};
             """,
-            (fecha_inicio, fecha_fin),
+            _params_solape(fecha_inicio, fecha_fin),
         )
     else:
         cur.execute(
-            """
+            f"""
             SELECT COUNT(*)
             FROM bloqueos_agenda
-            WHERE NOT (fecha_hora_fin <= ? OR fecha_hora_inicio >= ?)
+            WHERE {_where_solape("bloqueos_agenda")}
               AND id != ?;
             """,
-            (fecha_inicio, fecha_fin, bloqueo_id_excluir),
+            (*_params_solape(fecha_inicio, fecha_fin), bloqueo_id_excluir),
         )
 
     count = cur.fetchone()[0]
@@ -1817,17 +4155,19 @@ def crear_servicio(nombre: str, modalidad: str, precio: float, empresa: str | No
         empresa = (empresa or "").strip() or None
 
     conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO servicios (nombre, modalidad, precio, empresa, activo)
-        VALUES (?, ?, ?, ?, ?);
-        """,
-        (nombre, modalidad, float(precio), empresa, 1 if activo else 0),
-    )
-    servicio_id = cur.lastrowid
-    conn.commit()
-    conn.close()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            INSERT INTO servicios (nombre, modalidad, precio, empresa, activo)
+            VALUES (?, ?, ?, ?, ?);
+            """,
+            (nombre, modalidad, float(precio), empresa, 1 if activo else 0),
+        )
+        servicio_id = cur.lastrowid
+        conn.commit()
+    finally:
+        conn.close()
     return servicio_id
 
 
@@ -1856,16 +4196,18 @@ def actualizar_servicio(
 ) -> None:
     conn = get_connection()
     cur = conn.cursor()
-    cur.execute(
-        """
-        UPDATE servicios
-        SET nombre = ?, modalidad = ?, precio = ?, empresa = ?, activo = ?
-        WHERE id = ?;
-        """,
-        (nombre, modalidad, precio, empresa, 1 if activo else 0, servicio_id),
-    )
-    conn.commit()
-    conn.close()
+    try:
+        cur.execute(
+            """
+            UPDATE servicios
+            SET nombre = ?, modalidad = ?, precio = ?, empresa = ?, activo = ?
+            WHERE id = ?;
+            """,
+            (nombre, modalidad, precio, empresa, 1 if activo else 0, servicio_id),
+        )
+        conn.commit()
+    finally:
+        conn.close()
 
 
 
@@ -2625,26 +4967,49 @@ def _primer_y_ultimo_dia_mes(anio: int, mes: int) -> tuple[str, str]:
     )
 
 
-def resumen_financiero_periodo(fecha_desde: str, fecha_hasta: str) -> Dict[str, Any]:
-    """
-    Calcula un resumen financiero entre fecha_desde y fecha_hasta (incluidas).
+def _acumulado_financiero_vacio() -> Dict[str, Any]:
+    return {
+        "citas": {
+            "presencial": {"cantidad": 0, "total": 0.0},
+            "virtual": {"cantidad": 0, "total": 0.0},
+        },
+        "cantidad_citas_convenio": 0,
+        "facturas": [],  # (estado, cantidad, total)
+        "gastos": [],  # (tipo, total)
+        "total_paquetes": 0.0,
+        "total_paquetes_arriendo": 0.0,
+        "bolsillo": 0.0,
+        "consumos": 0,
+    }
 
-    - Ingresos por citas particulares (virtual/presencial) que estén pagadas.
-    - Conteo de citas de convenio.
-    - Ingresos por facturas de convenio (por estado).
-      * Para no duplicar ingresos, solo se toma el valor económico de las
-        facturas de convenio, no el campo 'precio' de las citas de tipo
-        'convenio_empresarial'.
-    - Gastos (arriendo de consultorio y otros).
+
+def _acumulados_financieros(
+    cur: sqlite3.Cursor,
+    fecha_desde: str,
+    fecha_hasta: str,
+    clave_sql: str,
+) -> Dict[str, Dict[str, Any]]:
     """
-    conn = get_connection()
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
+    Ejecuta las consultas del resumen financiero agrupando por `clave_sql`
+    (plantilla con {col}, ej. "strftime('%m', date({col}))" para agrupar por
+    mes, o "''" para un solo grupo). Devuelve clave -> acumulados crudos.
+    """
+    grupos: Dict[str, Dict[str, Any]] = {}
+
+    def grupo(clave: Any) -> Dict[str, Any]:
+        clave = str(clave or "")
+        if clave not in grupos:
+            grupos[clave] = _acumulado_financiero_vacio()
+        return grupos[clave]
+
+    rango = (fecha_desde, fecha_hasta)
 
     # ---- Ingresos por citas particulares (virtual/presencial) pagadas ----
+    clave = clave_sql.format(col="fecha_hora")
     cur.execute(
-        """
+        f"""
         SELECT
+            {clave} AS clave,
             canal,
             COUNT(*) AS cantidad,
             COALESCE(SUM(precio), 0) AS total
@@ -2653,131 +5018,100 @@ def resumen_financiero_periodo(fecha_desde: str, fecha_hasta: str) -> Dict[str,
         AND modalidad = 'particular'
         AND canal IN ('presencial', 'virtual')
         AND date(fecha_hora) BETWEEN date(?) AND date(?)
-        GROUP BY canal;
+        GROUP BY clave, canal;
         """,
-        (fecha_desde, fecha_hasta),
+        rango,
     )
-    filas_citas = cur.fetchall()
-
-    ingresos_citas = {
-        "presencial": {"cantidad": 0, "total": 0.0},
-        "virtual": {"cantidad": 0, "total": 0.0},
-    }
-
-    for r in filas_citas:
-        ch = r["canal"]
-        if ch in ingresos_citas:
-            ingresos_citas[ch]["cantidad"] = int(r["cantidad"] or 0)
-            ingresos_citas[ch]["total"] = float(r["total"] or 0)
+    for r in cur.fetchall():
+        citas = grupo(r["clave"])["citas"]
+        if r["canal"] in citas:
+            citas[r["canal"]] = {"cantidad": int(r["cantidad"] or 0), "total": float(r["total"] or 0)}
 
     # ---- Conteo de citas de convenio (solo conteo, no valor económico) ----
     cur.execute(
-        """
-        SELECT COUNT(*) AS cantidad
+        f"""
+        SELECT {clave} AS clave, COUNT(*) AS cantidad
         FROM citas
         WHERE modalidad = 'convenio_empresarial'
-          AND date(fecha_hora) BETWEEN date(?) AND date(?);
+          AND date(fecha_hora) BETWEEN date(?) AND date(?)
+        GROUP BY clave;
         """,
-        (fecha_desde, fecha_hasta),
+        rango,
     )
-    row_convenios_citas = cur.fetchone()
-    cantidad_citas_convenio = int(row_convenios_citas["cantidad"] or 0)
+    for r in cur.fetchall():
+        grupo(r["clave"])["cantidad_citas_convenio"] = int(r["cantidad"] or 0)
 
     # ---- Facturas de convenio (ingresos por convenio) ----
     # Ignoramos las facturas anuladas para el cálculo de ingresos.
     cur.execute(
-        """
+        f"""
         SELECT
+            {clave_sql.format(col="fecha")} AS clave,
             estado,
             COUNT(*) AS cantidad,
             COALESCE(SUM(total), 0) AS total
         FROM facturas_convenio
         WHERE estado != 'anulada'
           AND date(fecha) BETWEEN date(?) AND date(?)
-        GROUP BY estado;
+        GROUP BY clave, estado;
         """,
-        (fecha_desde, fecha_hasta),
+        rango,
     )
-    filas_facturas = cur.fetchall()
-
-    facturas_por_estado: Dict[str, Dict[str, Any]] = {}
-    total_facturas_emitidas = 0.0
-    total_facturas_pagadas = 0.0
-
-    for r in filas_facturas:
-        estado = (r["estado"] or "").lower()
-        cantidad = int(r["cantidad"] or 0)
-        total = float(r["total"] or 0)
-
-        facturas_por_estado[estado] = {"cantidad": cantidad, "total": total}
-        total_facturas_emitidas += total
-        if estado == "pagada":
-            total_facturas_pagadas += total
-
-    # Defaults (después del loop)
-    facturas_por_estado.setdefault("pagada", {"cantidad": 0, "total": 0.0})
-    facturas_por_estado.setdefault("pendiente", {"cantidad": 0, "total": 0.0})
-
-    cantidad_facturas_pagadas = int(facturas_por_estado["pagada"]["cantidad"] or 0)
-    cantidad_facturas_pendientes = int(facturas_por_estado["pendiente"]["cantidad"] or 0)
-    total_facturas_pendientes = float(facturas_por_estado["pendiente"]["total"] or 0)
-    cantidad_facturas_emitidas = sum(int(v.get("cantidad") or 0) for v in facturas_por_estado.values())
+    for r in cur.fetchall():
+        grupo(r["clave"])["facturas"].append((r["estado"], r["cantidad"], r["total"]))
 
     # ---- Gastos financieros ----
     cur.execute(
-        """
+        f"""
         SELECT
+            {clave_sql.format(col="fecha")} AS clave,
             tipo,
             COALESCE(SUM(monto), 0) AS total
         FROM gastos_financieros
         WHERE date(fecha) BETWEEN date(?) AND date(?)
-        GROUP BY tipo;
+        GROUP BY clave, tipo;
         """,
-        (fecha_desde, fecha_hasta),
+        rango,
     )
-    filas_gastos = cur.fetchall()
-    conn.close()
-    
-     # ---- Paquetes de consultorio comprados (se consideran GASTO) ----
-    conn = get_connection()
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
+    for r in cur.fetchall():
+        grupo(r["clave"])["gastos"].append((r["tipo"], r["total"]))
 
+    # ---- Paquetes de consultorio y de arriendo comprados (se consideran GASTO) ----
     cur.execute(
-        """
+        f"""
         SELECT
-            COUNT(*) AS cantidad,
+            {clave_sql.format(col="fecha_compra")} AS clave,
             COALESCE(SUM(precio_total), 0) AS total
         FROM paquetes_consultorio
-        WHERE date(fecha_compra) BETWEEN date(?) AND date(?);
+        WHERE date(fecha_compra) BETWEEN date(?) AND date(?)
+        GROUP BY clave;
         """,
-        (fecha_desde, fecha_hasta),
+        rango,
     )
-    row_pkg = cur.fetchone()
-    
+    for r in cur.fetchall():
+        grupo(r["clave"])["total_paquetes"] = float(r["total"] or 0)
+
     cur.execute(
-        """
-        SELECT COALESCE(SUM(costo_total), 0) AS total
+        f"""
+        SELECT
+            {clave_sql.format(col="fecha_compra")} AS clave,
+            COALESCE(SUM(costo_total), 0) AS total
         FROM paquetes_arriendo
-        WHERE date(fecha_compra) BETWEEN date(?) AND date(?);
+        WHERE date(fecha_compra) BETWEEN date(?) AND date(?)
+        GROUP BY clave;
         """,
-        (fecha_desde, fecha_hasta),
+        rango,
     )
-    row_paq = cur.fetchone()
-    total_paquetes_arriendo = float((row_paq["total"] if row_paq else 0) or 0)
-    
-    conn.close()
-    
+    for r in cur.fetchall():
+        grupo(r["clave"])["total_paquetes_arriendo"] = float(r["total"] or 0)
+
     # ---- KPI Bolsillo próximo paquete (consumo de citas de paquetes) ----
     # Se calcula como la suma del costo promedio por cita de cada consumo registrado
     # (NO afecta utilidad neta; es informativo).
-    conn = get_connection()
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-
     cur.execute(
-        """
+        f"""
         SELECT
+            {clave_sql.format(col="c.fecha_consumo")} AS clave,
             COUNT(*) AS cantidad_consumos,
             COALESCE(SUM(
                 CASE
@@ -2787,99 +5121,389 @@ def resumen_financiero_periodo(fecha_desde: str, fecha_hasta: str) -> Dict[str,
             ), 0) AS bolsillo_total
         FROM consumo_paquetes_arriendo c
         JOIN paquetes_arriendo p ON p.id = c.paquete_id
-        WHERE date(c.fecha_consumo) BETWEEN date(?) AND date(?);
+        WHERE date(c.fecha_consumo) BETWEEN date(?) AND date(?)
+        GROUP BY clave;
         """,
-        (fecha_desde, fecha_hasta),
+        rango,
     )
-    row_bolsillo = cur.fetchone()
+    for r in cur.fetchall():
+        g = grupo(r["clave"])
+        g["bolsillo"] = float(r["bolsillo_total"] or 0)
+        g["consumos"] = int(r["cantidad_consumos"] or 0)
+
+    return grupos
+
+
+def _armar_resumen_financiero(fecha_desde: str, fecha_hasta: str, acum: Dict[str, Any]) -> Dict[str, Any]:
+    """Arma el diccionario de resumen financiero a partir de los acumulados crudos."""
+    ingresos_citas = acum["citas"]
+    cantidad_citas_convenio = acum["cantidad_citas_convenio"]
+
+    facturas_por_estado: Dict[str, Dict[str, Any]] = {}
+    total_facturas_emitidas = 0.0
+    total_facturas_pagadas = 0.0
+
+    for estado, cantidad, total in acum["facturas"]:
+        estado = (estado or "").lower()
+        cantidad = int(cantidad or 0)
+        total = float(total or 0)
+
+        facturas_por_estado[estado] = {"cantidad": cantidad, "total": total}
+        total_facturas_emitidas += total
+        if estado == "pagada":
+            total_facturas_pagadas += total
+
+    # Defaults (después del loop)
+    facturas_por_estado.setdefault("pagada", {"cantidad": 0, "total": 0.0})
+    facturas_por_estado.setdefault("pendiente", {"cantidad": 0, "total": 0.0})
+
+    cantidad_facturas_pagadas = int(facturas_por_estado["pagada"]["cantidad"] or 0)
+    cantidad_facturas_pendientes = int(facturas_por_estado["pendiente"]["cantidad"] or 0)
+    total_facturas_pendientes = float(facturas_por_estado["pendiente"]["total"] or 0)
+    cantidad_facturas_emitidas = sum(int(v.get("cantidad") or 0) for v in facturas_por_estado.values())
+
+    gastos_por_tipo: Dict[str, float] = {}
+    total_gastos = 0.0
+
+    for tipo, total in acum["gastos"]:
+        total = float(total or 0)
+        gastos_por_tipo[tipo] = total
+        total_gastos += total
+
+    total_paquetes = acum["total_paquetes"]
+    total_paquetes_arriendo = acum["total_paquetes_arriendo"]
+
+    # Agregar paquetes de consultorio como gasto
+    if total_paquetes > 0:
+        gastos_por_tipo["paquetes_consultorio"] = total_paquetes
+        total_gastos += total_paquetes
+
+    if total_paquetes_arriendo > 0:
+        gastos_por_tipo["paquetes_arriendo"] = total_paquetes_arriendo
+        total_gastos += total_paquetes_arriendo
+
+    total_presencial = ingresos_citas["presencial"]["total"]
+    total_virtual = ingresos_citas["virtual"]["total"]
+    total_citas_particulares = total_presencial + total_virtual
+
+    total_ingresos_cobrados = total_citas_particulares + total_facturas_pagadas
+    total_ingresos_facturados = total_citas_particulares + total_facturas_emitidas
+
+    utilidad_neta_cobrada = total_ingresos_cobrados - total_gastos
+    utilidad_neta_facturada = total_ingresos_facturados - total_gastos
+
+    return {
+        "rango": {
+            "desde": fecha_desde,
+            "hasta": fecha_hasta,
+        },
+        "ingresos": {
+            "citas": {
+                "presencial": ingresos_citas["presencial"],
+                "virtual": ingresos_citas["virtual"],
+                "total_particulares": total_citas_particulares,
+                "cantidad_citas_pagadas": int(
+                    ingresos_citas["presencial"]["cantidad"] + ingresos_citas["virtual"]["cantidad"]
+                ),
+            },
+            "convenios": {
+                "cantidad_citas": cantidad_citas_convenio,
+                "facturas_por_estado": facturas_por_estado,
+                "total_facturas_emitidas": total_facturas_emitidas,
+                "total_facturas_pagadas": total_facturas_pagadas,
+
+                "cantidad_facturas_emitidas": cantidad_facturas_emitidas,
+                "cantidad_facturas_pagadas": cantidad_facturas_pagadas,
+                "cantidad_facturas_pendientes": cantidad_facturas_pendientes,
+                "total_facturas_pendientes": total_facturas_pendientes,
+            },
+            "total_cobrado": total_ingresos_cobrados,
+            "total_facturado": total_ingresos_facturados,
+        },
+        "gastos": {
+            "por_tipo": gastos_por_tipo,
+            "total_gastos": total_gastos,
+        },
+        "utilidad": {
+            "neta_cobrada": utilidad_neta_cobrada,
+            "neta_facturada": utilidad_neta_facturada,
+        },
+        "kpis": {
+            "bolsillo_proximo_paquete": acum["bolsillo"],
+            "citas_consumidas_de_paquete": acum["consumos"],
+        },
+    }
+
+
+def resumen_financiero_periodo(fecha_desde: str, fecha_hasta: str) -> Dict[str, Any]:
+    """
+    Calcula un resumen financiero entre fecha_desde y fecha_hasta (incluidas).
+
+    - Ingresos por citas particulares (virtual/presencial) que estén pagadas.
+    - Conteo de citas de convenio.
+    - Ingresos por facturas de convenio (por estado).
+      * Para no duplicar ingresos, solo se toma el valor económico de las
+        facturas de convenio, no el campo 'precio' de las citas de tipo
+        'convenio_empresarial'.
+    - Gastos (arriendo de consultorio y otros).
+    """
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+    grupos = _acumulados_financieros(cur, fecha_desde, fecha_hasta, "''")
     conn.close()
 
-    bolsillo_proximo_paquete = float((row_bolsillo["bolsillo_total"] if row_bolsillo else 0) or 0)
-    cantidad_consumos_paquete = int((row_bolsillo["cantidad_consumos"] if row_bolsillo else 0) or 0)
+    acum = grupos.get("") or _acumulado_financiero_vacio()
+    return _armar_resumen_financiero(fecha_desde, fecha_hasta, acum)
+
+
+# ------------ RESÚMENES FINANCIEROS MENSUALES (materializados) -------------
+#
+# resumen_financiero_mes guarda, por mes 'YYYY-MM', el resumen ya armado (JSON).
+# Solo se guardan meses cerrados (anteriores al mes actual); el mes en curso y
+# los futuros se calculan siempre. Los triggers borran el resumen del mes que
+# toque cada cambio en las tablas de origen (fecha vieja y nueva), así que la
+# siguiente lectura recalcula solo ese mes. Funciona también para escrituras
+# hechas fuera de db.py.
+
+# tabla -> (columna de fecha, columnas que afectan el resumen)
+_FUENTES_RESUMEN_FINANCIERO: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "citas": ("fecha_hora", ("fecha_hora", "pagado", "precio", "modalidad", "canal")),
+    "facturas_convenio": ("fecha", ("fecha", "estado", "total")),
+    "gastos_financieros": ("fecha", ("fecha", "tipo", "monto")),
+    "paquetes_consultorio": ("fecha_compra", ("fecha_compra", "precio_total")),
+    "paquetes_arriendo": ("fecha_compra", ("fecha_compra", "costo_total", "cantidad_citas")),
+    "consumo_paquetes_arriendo": ("fecha_consumo", ("fecha_consumo", "paquete_id")),
+}
+
+_CLAVE_MES_SQL = "strftime('%Y-%m', date({col}))"
+
+
+def asegurar_resumenes_financieros(cur: sqlite3.Cursor) -> None:
+    """
+    Crea la tabla resumen_financiero_mes y los triggers que invalidan el mes
+    afectado. Los triggers se recrean siempre (igual que los de búsqueda).
+    """
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS resumen_financiero_mes (
+            mes TEXT PRIMARY KEY,          -- 'YYYY-MM'
+            datos TEXT NOT NULL,           -- JSON con la forma de resumen_financiero_mensual
+            calculado_en TEXT DEFAULT (datetime('now','localtime'))
+        );
+        """
+    )
+
+    for tabla, (col, columnas) in _FUENTES_RESUMEN_FINANCIERO.items():
+        for sufijo in ("ins", "upd", "del"):
+            cur.execute(f"DROP TRIGGER IF EXISTS trg_resumen_fin_{tabla}_{sufijo};")
+
+        borrar_new = f"DELETE FROM resumen_financiero_mes WHERE mes = {_CLAVE_MES_SQL.format(col='NEW.' + col)};"
+        borrar_old = f"DELETE FROM resumen_financiero_mes WHERE mes = {_CLAVE_MES_SQL.format(col='OLD.' + col)};"
+        extra_old = ""
+        if tabla == "paquetes_arriendo":
+            # El costo por cita del paquete entra al KPI "bolsillo" de cada mes con consumos
+            extra_old = f"""
+                DELETE FROM resumen_financiero_mes WHERE mes IN (
+                    SELECT {_CLAVE_MES_SQL.format(col='fecha_consumo')}
+                    FROM consumo_paquetes_arriendo WHERE paquete_id = OLD.id
+                );"""
+
+        cur.execute(
+            f"""
+            CREATE TRIGGER trg_resumen_fin_{tabla}_ins AFTER INSERT ON {tabla}
+            BEGIN
+                {borrar_new}
+            END;
+            """
+        )
+        cur.execute(
+            f"""
+            CREATE TRIGGER trg_resumen_fin_{tabla}_upd AFTER UPDATE OF {', '.join(columnas)} ON {tabla}
+            BEGIN
+                {borrar_old}
+                {borrar_new}{extra_old}
+            END;
+            """
+        )
+        cur.execute(
+            f"""
+            CREATE TRIGGER trg_resumen_fin_{tabla}_del AFTER DELETE ON {tabla}
+            BEGIN
+                {borrar_old}{extra_old}
+            END;
+            """
+        )
+
+
+def _clave_mes(anio: int, mes: int) -> str:
+    return f"{int(anio):04d}-{int(mes):02d}"
+
+
+# Guardar un resumen es solo caché: si otro proceso/hilo tiene el lock de
+# escritura no se espera más que esto (ms), se omite y se devuelve lo calculado.
+RESUMEN_BUSY_TIMEOUT_MS = 50
+
+
+def _guardar_resumenes_cerrados(conn: sqlite3.Connection, filas: List[Tuple[str, str]]) -> bool:
+    """
+    Guarda (mes, json) dentro de la transacción de lectura en curso. Si desde que
+    empezó hubo otro commit (un trigger pudo invalidar el mes) SQLite no deja
+    pasar a escritura: se descarta sin guardar. Devuelve True si se guardó.
+    """
+    cur = conn.cursor()
+    cur.execute("PRAGMA busy_timeout;")
+    anterior = int(cur.fetchone()[0])
+    cur.execute(f"PRAGMA busy_timeout = {RESUMEN_BUSY_TIMEOUT_MS};")
+    try:
+        cur.executemany(
+            """
+            INSERT OR REPLACE INTO resumen_financiero_mes (mes, datos, calculado_en)
+            VALUES (?, ?, datetime('now','localtime'));
+            """,
+            filas,
+        )
+        conn.commit()
+        return True
+    except sqlite3.OperationalError:
+        # Lock ocupado o foto vieja: la próxima lectura lo vuelve a intentar
+        conn.rollback()
+        return False
+    finally:
+        cur.execute(f"PRAGMA busy_timeout = {anterior};")
+
+
+def _resumenes_mensuales(anio: int, meses: List[int]) -> Dict[int, Dict[str, Any]]:
+    """
+    Resúmenes de `meses` de `anio`: los meses cerrados salen de
+    resumen_financiero_mes y el resto se calcula en una pasada agrupada
+    (guardando, si se puede sin esperar, los cerrados que faltaban).
+    """
+    mes_actual = date.today().strftime("%Y-%m")
+    claves = {m: _clave_mes(anio, m) for m in meses}
+
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "SELECT mes, datos FROM resumen_financiero_mes WHERE mes BETWEEN ? AND ?;",
+            (min(claves.values()), max(claves.values())),
+        )
+        guardados = {r["mes"]: r["datos"] for r in cur.fetchall()}
+
+        resumenes: Dict[int, Dict[str, Any]] = {}
+        faltan: List[int] = []
+        for m in meses:
+            clave = claves[m]
+            if clave < mes_actual and clave in guardados:
+                resumenes[m] = json.loads(guardados[clave])
+            else:
+                faltan.append(m)
+
+        if faltan:
+            cerrados = [m for m in faltan if claves[m] < mes_actual]
+            if cerrados:
+                # Transacción de lectura (sin lock de escritura): el cálculo ve
+                # una foto fija y _guardar_resumenes_cerrados solo guarda si
+                # nadie escribió después de esa foto.
+                cur.execute("BEGIN;")
+
+            desde, _ = _primer_y_ultimo_dia_mes(anio, min(faltan))
+            _, hasta = _primer_y_ultimo_dia_mes(anio, max(faltan))
+            grupos = _acumulados_financieros(cur, desde, hasta, "strftime('%m', date({col}))")
+
+            for m in faltan:
+                m_desde, m_hasta = _primer_y_ultimo_dia_mes(anio, m)
+                acum = grupos.get(f"{m:02d}") or _acumulado_financiero_vacio()
+                resumenes[m] = _armar_resumen_financiero(m_desde, m_hasta, acum)
+            if cerrados:
+                _guardar_resumenes_cerrados(conn, [(claves[m], json.dumps(resumenes[m])) for m in cerrados])
+    finally:
+        conn.close()
+
+    for m in meses:
+        resumenes[m]["periodo"] = {"anio": anio, "mes": m}
+    return resumenes
 
-    total_paquetes = float((row_pkg["total"] if row_pkg else 0) or 0)
 
-    gastos_por_tipo: Dict[str, float] = {}
-    total_gastos = 0.0
+def resumen_financiero_anual(anio: int) -> Dict[int, Dict[str, Any]]:
+    """
+    Resumen financiero de los 12 meses de `anio`.
 
-    for r in filas_gastos:
-        tipo = r["tipo"]
-        total = float(r["total"] or 0)
-        gastos_por_tipo[tipo] = total
-        total_gastos += total
-        
-    # Agregar paquetes de consultorio como gasto
-    if total_paquetes > 0:
-        gastos_por_tipo["paquetes_consultorio"] = total_paquetes
-        total_gastos += total_paquetes
-        
-    if total_paquetes_arriendo > 0:
-        gastos_por_tipo["paquetes_arriendo"] = total_paquetes_arriendo
-        total_gastos += total_paquetes_arriendo
+    Los meses cerrados se leen de resumen_financiero_mes; el resto se calcula
+    con consultas agrupadas por mes (strftime('%m')) en una sola conexión.
+    Devuelve {mes: resumen} con la misma forma que
+    resumen_financiero_mensual(anio, mes), incluidos los meses sin datos.
+    """
+    return _resumenes_mensuales(anio, list(range(1, 13)))
 
-    total_presencial = ingresos_citas["presencial"]["total"]
-    total_virtual = ingresos_citas["virtual"]["total"]
-    total_citas_particulares = total_presencial + total_virtual
 
-    total_ingresos_cobrados = total_citas_particulares + total_facturas_pagadas
-    total_ingresos_facturados = total_citas_particulares + total_facturas_emitidas
+def resumen_financiero_mensual(anio: int, mes: int) -> Dict[str, Any]:
+    """
+    Atajo para obtener el resumen financiero de un mes específico.
+    """
+    return _resumenes_mensuales(anio, [mes])[mes]
 
-    utilidad_neta_cobrada = total_ingresos_cobrados - total_gastos
-    utilidad_neta_facturada = total_ingresos_facturados - total_gastos
-    
-    
 
-    return {
-        "rango": {
-            "desde": fecha_desde,
-            "hasta": fecha_hasta,
-        },
-        "ingresos": {
-            "citas": {
-                "presencial": ingresos_citas["presencial"],
-                "virtual": ingresos_citas["virtual"],
-                "total_particulares": total_citas_particulares,
-                "cantidad_citas_pagadas": int(
-                    ingresos_citas["presencial"]["cantidad"] + ingresos_citas["virtual"]["cantidad"]
-                ),
-            },
-            "convenios": {
-                "cantidad_citas": cantidad_citas_convenio,
-                "facturas_por_estado": facturas_por_estado,
-                "total_facturas_emitidas": total_facturas_emitidas,
-                "total_facturas_pagadas": total_facturas_pagadas,
-                
-                "cantidad_facturas_emitidas": cantidad_facturas_emitidas,
-                "cantidad_facturas_pagadas": cantidad_facturas_pagadas,
-                "cantidad_facturas_pendientes": cantidad_facturas_pendientes,
-                "total_facturas_pendientes": total_facturas_pendientes,
-            },
-            "total_cobrado": total_ingresos_cobrados,
-            "total_facturado": total_ingresos_facturados,
-        },
-        "gastos": {
-            "por_tipo": gastos_por_tipo,
-            "total_gastos": total_gastos,
-        },
-        "utilidad": {
-            "neta_cobrada": utilidad_neta_cobrada,
-            "neta_facturada": utilidad_neta_facturada,
-        },
-        "kpis": {
-            "bolsillo_proximo_paquete": bolsillo_proximo_paquete,
-            "citas_consumidas_de_paquete": cantidad_consumos_paquete,
-        },
-    }
+def _meses_con_movimientos(cur: sqlite3.Cursor) -> List[str]:
+    partes = [
+        f"SELECT DISTINCT {_CLAVE_MES_SQL.format(col=col)} AS mes FROM {tabla}"
+        for tabla, (col, _) in _FUENTES_RESUMEN_FINANCIERO.items()
+    ]
+    cur.execute(" UNION ".join(partes) + " ORDER BY mes;")
+    return [r[0] for r in cur.fetchall() if r[0]]
 
 
-def resumen_financiero_mensual(anio: int, mes: int) -> Dict[str, Any]:
+def reconstruir_resumenes_financieros() -> int:
     """
-    Atajo para obtener el resumen financiero de un mes específico.
+    Borra y recalcula los resúmenes de todos los meses cerrados con
+    movimientos (backfill). Devuelve cuántos meses quedaron guardados.
     """
-    desde, hasta = _primer_y_ultimo_dia_mes(anio, mes)
-    data = resumen_financiero_periodo(desde, hasta)
-    data["periodo"] = {"anio": anio, "mes": mes}
-    return data
+    mes_actual = date.today().strftime("%Y-%m")
+
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM resumen_financiero_mes;")
+    conn.commit()
+    meses = [m for m in _meses_con_movimientos(cur) if m < mes_actual]
+    conn.close()
+
+    por_anio: Dict[int, List[int]] = {}
+    for clave in meses:
+        anio, mes = clave.split("-")
+        por_anio.setdefault(int(anio), []).append(int(mes))
+    for anio, lista in por_anio.items():
+        _resumenes_mensuales(anio, lista)
+    return len(meses)
+
+
+def verificar_resumenes_financieros(reparar: bool = False) -> List[str]:
+    """
+    Compara cada resumen guardado con un cálculo desde cero y devuelve los
+    meses ('YYYY-MM') que no coinciden. Con reparar=True se descartan para
+    que la próxima lectura los recalcule.
+    """
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+    cur.execute("SELECT mes, datos FROM resumen_financiero_mes ORDER BY mes;")
+    guardados = [(r["mes"], r["datos"]) for r in cur.fetchall()]
+
+    distintos: List[str] = []
+    for clave, datos in guardados:
+        anio, mes = (int(x) for x in clave.split("-"))
+        desde, hasta = _primer_y_ultimo_dia_mes(anio, mes)
+        grupos = _acumulados_financieros(cur, desde, hasta, "''")
+        esperado = _armar_resumen_financiero(desde, hasta, grupos.get("") or _acumulado_financiero_vacio())
+        if json.loads(datos) != json.loads(json.dumps(esperado)):
+            distintos.append(clave)
+
+    if reparar and distintos:
+        cur.executemany("DELETE FROM resumen_financiero_mes WHERE mes = ?;", [(c,) for c in distintos])
+        conn.commit()
+    conn.close()
+    return distintos
 
 
 # =========================================================
@@ -3542,6 +6166,235 @@ def devolver_cita_paquete_arriendo(cita_id: int) -> bool:
     return True
 
 
+# ------------ REPORTES FINANCIEROS (streaming por cursor) -------------
+#
+# Libro de ingresos, gastos y consumos de paquetes para cualquier rango de
+# fechas. Las filas se leen del cursor por lotes (fetchmany) en vez de armar
+# listas completas, así exportar varios años cuesta lo mismo en memoria que
+# exportar un mes. La tabla en pantalla pagina por clave (fecha, orden, id),
+# que no se degrada en las páginas finales como lo haría OFFSET.
+
+REPORTE_FINANCIERO_LOTE = 500
+
+# Cada SQL devuelve las columnas del reporte y al final (orden, id): junto con
+# fecha forman una clave única aunque se mezclen filas de varias tablas.
+_REPORTES_FINANCIEROS: Dict[str, Dict[str, Any]] = {
+    "ingresos": {
+        "titulo": "Ingresos",
+        "columnas": ("fecha", "origen", "referencia", "tercero", "detalle", "valor"),
+        "sql": """
+            SELECT
+                c.fecha_hora AS fecha,
+                'Cita particular' AS origen,
+                '#' || c.id AS referencia,
+                COALESCE(p.nombre_completo, c.documento_paciente) AS tercero,
+                c.canal AS detalle,
+                COALESCE(c.precio, 0) AS valor,
+                0 AS orden,
+                c.id AS id
+            FROM citas c
+            LEFT JOIN pacientes p ON p.documento = c.documento_paciente
+            WHERE c.pagado = 1
+              AND c.modalidad = 'particular'
+              AND c.canal IN ('presencial', 'virtual')
+              AND c.inicio_min >= :inicio_min AND c.inicio_min < :fin_min
+            UNION ALL
+            SELECT
+                f.fecha,
+                'Factura convenio',
+                f.numero,
+                COALESCE(e.nombre, f.paciente_nombre, ''),
+                f.estado,
+                COALESCE(f.total, 0),
+                1,
+                f.id
+            FROM facturas_convenio f
+            LEFT JOIN empresas_convenio e ON e.id = f.empresa_id
+            WHERE f.estado != 'anulada'
+              AND f.fecha >= :desde AND f.fecha < :hasta_excl
+        """,
+    },
+    "gastos": {
+        "titulo": "Gastos",
+        "columnas": ("fecha", "tipo", "descripcion", "valor"),
+        "sql": """
+            SELECT g.fecha AS fecha, g.tipo AS tipo, COALESCE(g.descripcion, '') AS descripcion,
+                   COALESCE(g.monto, 0) AS valor, 0 AS orden, g.id AS id
+            FROM gastos_financieros g
+            WHERE g.fecha >= :desde AND g.fecha < :hasta_excl
+            UNION ALL
+            SELECT pc.fecha_compra, 'paquete_consultorio', COALESCE(pc.descripcion, ''),
+                   COALESCE(pc.precio_total, 0), 1, pc.id
+            FROM paquetes_consultorio pc
+            WHERE pc.fecha_compra >= :desde AND pc.fecha_compra < :hasta_excl
+            UNION ALL
+            SELECT pa.fecha_compra, 'paquete_arriendo',
+                   COALESCE(NULLIF(pa.notas, ''), pa.cantidad_citas || ' citas'),
+                   COALESCE(pa.costo_total, 0), 2, pa.id
+            FROM paquetes_arriendo pa
+            WHERE pa.fecha_compra >= :desde AND pa.fecha_compra < :hasta_excl
+        """,
+    },
+    "consumos": {
+        "titulo": "Consumos de paquetes",
+        "columnas": ("fecha", "tercero", "detalle", "referencia", "valor", "consumido_por"),
+        "sql": """
+            SELECT
+                cpa.fecha_consumo AS fecha,
+                COALESCE(p.nombre_completo, '') AS tercero,
+                COALESCE(ci.canal, '') AS detalle,
+                'Paquete #' || cpa.paquete_id AS referencia,
+                CASE WHEN pa.cantidad_citas > 0
+                     THEN pa.costo_total * 1.0 / pa.cantidad_citas ELSE 0 END AS valor,
+                COALESCE(NULLIF(cpa.consumido_por, ''), 'agenda') AS consumido_por,
+                0 AS orden,
+                cpa.id AS id
+            FROM consumo_paquetes_arriendo cpa
+            JOIN paquetes_arriendo pa ON pa.id = cpa.paquete_id
+            LEFT JOIN citas ci ON ci.id = cpa.cita_id
+            LEFT JOIN pacientes p ON p.documento = ci.documento_paciente
+            WHERE cpa.fecha_consumo >= :desde AND cpa.fecha_consumo < :hasta_excl
+        """,
+    },
+}
+
+TIPOS_REPORTE_FINANCIERO: Tuple[str, ...] = tuple(_REPORTES_FINANCIEROS)
+
+
+def asegurar_indices_reportes_financieros(cur: sqlite3.Cursor) -> None:
+    """Índices por fecha para que los reportes por rango no recorran tablas completas."""
+    for tabla, col in (
+        ("gastos_financieros", "fecha"),
+        ("facturas_convenio", "fecha"),
+        ("paquetes_arriendo", "fecha_compra"),
+        ("paquetes_consultorio", "fecha_compra"),
+    ):
+        cur.execute(f"CREATE INDEX IF NOT EXISTS ix_{tabla}_{col} ON {tabla} ({col});")
+
+
+def _reporte_financiero(tipo: str) -> Dict[str, Any]:
+    try:
+        return _REPORTES_FINANCIEROS[tipo]
+    except KeyError:
+        raise ValueError(f"Tipo de reporte desconocido: {tipo!r}") from None
+
+
+def titulo_reporte_financiero(tipo: str) -> str:
+    return _reporte_financiero(tipo)["titulo"]
+
+
+def columnas_reporte_financiero(tipo: str) -> Tuple[str, ...]:
+    return _reporte_financiero(tipo)["columnas"]
+
+
+def _params_reporte_financiero(fecha_desde: Any, fecha_hasta: Any) -> Dict[str, Any]:
+    """
+    Parámetros del rango [fecha_desde, fecha_hasta] (ambos incluidos).
+    Las fechas están en ISO (ver migrar_fechas_iso), así que se comparan como
+    texto contra el día siguiente a fecha_hasta y los índices sirven.
+    """
+    desde = parse_fecha(fecha_desde)
+    hasta = parse_fecha(fecha_hasta)
+    if desde is None or hasta is None:
+        raise ValueError("Rango de fechas inválido.")
+    if hasta < desde:
+        desde, hasta = hasta, desde
+    hasta_excl = hasta + timedelta(days=1)
+    return {
+        "desde": desde.isoformat(),
+        "hasta_excl": hasta_excl.isoformat(),
+        "inicio_min": _minutos_epoch(desde),
+        "fin_min": _minutos_epoch(hasta_excl),
+    }
+
+
+def iterar_reporte_financiero(
+    tipo: str,
+    fecha_desde: Any,
+    fecha_hasta: Any,
+    lote: int = REPORTE_FINANCIERO_LOTE,
+) -> Iterator[Tuple[Any, ...]]:
+    """
+    Recorre el reporte `tipo` ('ingresos', 'gastos', 'consumos') ordenado por
+    fecha, entregando tuplas en el orden de columnas_reporte_financiero(tipo).
+    La conexión queda tomada mientras se itera y se devuelve al terminar.
+    """
+    rep = _reporte_financiero(tipo)
+    params = _params_reporte_financiero(fecha_desde, fecha_hasta)
+    n = len(rep["columnas"])
+    lote = max(1, int(lote))
+
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute(f"SELECT * FROM ({rep['sql']}) ORDER BY fecha, orden, id;", params)
+        while True:
+            filas = cur.fetchmany(lote)
+            if not filas:
+                break
+            for f in filas:
+                yield tuple(f)[:n]
+    finally:
+        # Si se deja de iterar a mitad, cerrar el cursor libera la consulta
+        # antes de devolver la conexión al pool.
+        cur.close()
+        conn.close()
+
+
+def pagina_reporte_financiero(
+    tipo: str,
+    fecha_desde: Any,
+    fecha_hasta: Any,
+    despues: Optional[Tuple[Any, int, int]] = None,
+    limite: int = 50,
+) -> Tuple[List[Dict[str, Any]], Optional[Tuple[Any, int, int]]]:
+    """
+    Una página del reporte: (filas, clave_siguiente).
+    `despues` es la clave devuelta por la página anterior (None = primera);
+    clave_siguiente es None cuando no hay más filas.
+    """
+    rep = _reporte_financiero(tipo)
+    params = _params_reporte_financiero(fecha_desde, fecha_hasta)
+    limite = max(1, int(limite))
+
+    where = ""
+    if despues is not None:
+        where = "WHERE (fecha, orden, id) > (:k_fecha, :k_orden, :k_id)"
+        params.update(k_fecha=despues[0], k_orden=despues[1], k_id=despues[2])
+    params["limite"] = limite + 1
+
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        f"SELECT * FROM ({rep['sql']}) {where} ORDER BY fecha, orden, id LIMIT :limite;",
+        params,
+    )
+    filas = cur.fetchall()
+    conn.close()
+
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        ultima = filas[-1]
+        siguiente = (ultima["fecha"], int(ultima["orden"]), int(ultima["id"]))
+
+    columnas = rep["columnas"]
+    return [{c: f[c] for c in columnas} for f in filas], siguiente
+
+
+def totales_reporte_financiero(tipo: str, fecha_desde: Any, fecha_hasta: Any) -> Dict[str, Any]:
+    """{"filas": cantidad, "total": suma de la columna valor} del reporte en el rango."""
+    rep = _reporte_financiero(tipo)
+    params = _params_reporte_financiero(fecha_desde, fecha_hasta)
+
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(f"SELECT COUNT(*) AS filas, COALESCE(SUM(valor), 0) AS total FROM ({rep['sql']});", params)
+    row = cur.fetchone()
+    conn.close()
+    return {"filas": int(row["filas"] or 0), "total": float(row["total"] or 0)}
+
+
 # ------------ CONFIGURACIÓN FACTURACIÓN -------------
 
 def obtener_configuracion_facturacion() -> dict:
@@ -3891,7 +6744,7 @@ def listar_citas_por_paciente(documento_paciente: str) -> List[sqlite3.Row]:
         SELECT *
         FROM citas
         WHERE documento_paciente = ?
-        ORDER BY datetime(fecha_hora) DESC, id DESC;
+        ORDER BY inicio_min DESC, id DESC;
         """,
         (documento_paciente,),
     )
@@ -3977,40 +6830,147 @@ def _rango_periodo_home(periodo: str):
     )
 
 
-def obtener_cumpleanios_hoy_ddmmyyyy() -> List[Dict[str, Any]]:
+# ------------ CUMPLEAÑOS (fecha de nacimiento indexada) -------------
+#
+# fecha_nacimiento llega como 'DD-MM-YYYY' (Excel / Forms / UI) o 'YYYY-MM-DD'.
+# Para no parsear todos los pacientes en Python, cada fila guarda además:
+#   - fecha_nacimiento_iso: 'YYYY-MM-DD' (NULL si el texto no es una fecha válida)
+#   - cumple_mmdd: 'MM-DD', indexada, para buscar cumpleaños por día
+# Las mantienen triggers (también para escrituras hechas fuera de db.py).
+
+# Expresión SQL: texto DD-MM-YYYY / YYYY-MM-DD -> 'YYYY-MM-DD'. Se valida con la
+# ida y vuelta por julianday() (date() solo no rechaza un 31-02).
+_SQL_FECHA_ISO = (
+    "(SELECT CASE WHEN date(julianday(f)) IS f THEN f END FROM (SELECT CASE"
+    " WHEN t GLOB '[0-9][0-9]-[0-9][0-9]-[0-9][0-9][0-9][0-9]*'"
+    " THEN substr(t, 7, 4) || '-' || substr(t, 4, 2) || '-' || substr(t, 1, 2)"
+    " WHEN t GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*'"
+    " THEN substr(t, 1, 10)"
+    " END AS f FROM (SELECT trim({col}) AS t)))"
+)
+
+
+def asegurar_columnas_cumpleanios(cur: sqlite3.Cursor) -> None:
+    """
+    Migración segura para pacientes:
+      - columnas fecha_nacimiento_iso / cumple_mmdd
+      - backfill de filas existentes (normaliza los dos formatos)
+      - triggers que las mantienen al insertar/actualizar
+      - índice por cumple_mmdd
+    """
+    cur.execute("PRAGMA table_info(pacientes);")
+    cols = [row[1] for row in cur.fetchall()]
+    nuevas = False
+    if "fecha_nacimiento_iso" not in cols:
+        cur.execute("ALTER TABLE pacientes ADD COLUMN fecha_nacimiento_iso TEXT;")
+        nuevas = True
+    if "cumple_mmdd" not in cols:
+        cur.execute("ALTER TABLE pacientes ADD COLUMN cumple_mmdd TEXT;")
+        nuevas = True
+
+    def set_sql(col: str) -> str:
+        iso = _SQL_FECHA_ISO.format(col=col)
+        return f"fecha_nacimiento_iso = {iso}, cumple_mmdd = substr({iso}, 6, 5)"
+
+    cur.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_pacientes_cumple_ins
+        AFTER INSERT ON pacientes
+        BEGIN
+            UPDATE pacientes SET {set_sql('NEW.fecha_nacimiento')} WHERE rowid = NEW.rowid;
+        END;
+        """
+    )
+    cur.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_pacientes_cumple_upd
+        AFTER UPDATE OF fecha_nacimiento ON pacientes
+        BEGIN
+            UPDATE pacientes SET {set_sql('NEW.fecha_nacimiento')} WHERE rowid = NEW.rowid;
+        END;
+        """
+    )
+
+    # Backfill una sola vez, al crear las columnas; después lo mantienen los
+    # triggers. (Las fechas vacías o inválidas quedan en NULL para siempre: un
+    # "WHERE fecha_nacimiento_iso IS NULL" las reescribiría en cada init_db.)
+    if nuevas:
+        cur.execute(f"UPDATE pacientes SET {set_sql('fecha_nacimiento')};")
+
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_pacientes_cumple_mmdd ON pacientes (cumple_mmdd);")
+
+
+def _claves_cumpleanios(desde: date, dias: int) -> Dict[str, List[date]]:
+    """
+    'MM-DD' -> fechas del rango [desde, desde + dias) en que se celebra.
+    En años no bisiestos los nacidos el 29-02 se cuentan el 28-02.
     """
-    Cumpleaños para pacientes con fecha_nacimiento guardada como 'DD-MM-YYYY'.
+    claves: Dict[str, List[date]] = {}
+    for i in range(max(1, int(dias))):
+        d = desde + timedelta(days=i)
+        claves.setdefault(d.strftime("%m-%d"), []).append(d)
+        if d.month == 2 and d.day == 28:
+            try:
+                date(d.year, 2, 29)
+            except ValueError:
+                claves.setdefault("02-29", []).append(d)
+    return claves
+
+
+def listar_cumpleanios_proximos(dias: int = 7, desde: Optional[date] = None) -> List[Dict[str, Any]]:
     """
+    Pacientes que cumplen años entre `desde` (hoy por defecto) y los `dias`
+    siguientes (dias=1 -> solo hoy), usando el índice por cumple_mmdd.
+
+    Cada item: documento, nombre_completo, fecha_nacimiento, fecha_cumple
+    ('YYYY-MM-DD'), dias_faltantes y edad (años que cumple). Ordenado por fecha.
+    """
+    desde = desde or date.today()
+    claves = _claves_cumpleanios(desde, dias)
+    marcas = ", ".join("?" for _ in claves)
+
     conn = get_connection()
     conn.row_factory = sqlite3.Row
     cur = conn.cursor()
-    cur.execute("SELECT documento, nombre_completo, fecha_nacimiento FROM pacientes;")
+    cur.execute(
+        f"""
+        SELECT documento, nombre_completo, fecha_nacimiento, fecha_nacimiento_iso, cumple_mmdd
+        FROM pacientes
+        WHERE cumple_mmdd IN ({marcas});
+        """,
+        list(claves),
+    )
     rows = cur.fetchall()
     conn.close()
 
-    hoy = date.today()
     out: List[Dict[str, Any]] = []
-
     for r in rows:
-        fn = (r["fecha_nacimiento"] or "").strip()
-        try:
-            nac = datetime.strptime(fn, "%d-%m-%Y").date()
-        except Exception:
-            continue
-
-        if nac.day == hoy.day and nac.month == hoy.month:
-            edad_cumple = hoy.year - nac.year
+        anio_nac = int(r["fecha_nacimiento_iso"][:4])
+        for d in claves.get(r["cumple_mmdd"], []):
             out.append(
                 {
                     "documento": r["documento"],
                     "nombre_completo": r["nombre_completo"],
-                    "edad": edad_cumple,
+                    "fecha_nacimiento": r["fecha_nacimiento"],
+                    "fecha_cumple": d.isoformat(),
+                    "dias_faltantes": (d - desde).days,
+                    "edad": d.year - anio_nac,
                 }
             )
-
+    out.sort(key=lambda x: (x["fecha_cumple"], (x["nombre_completo"] or "").lower()))
     return out
 
 
+def obtener_cumpleanios_hoy_ddmmyyyy() -> List[Dict[str, Any]]:
+    """
+    Cumpleaños de hoy (fecha_nacimiento en 'DD-MM-YYYY' o 'YYYY-MM-DD').
+    """
+    return [
+        {"documento": c["documento"], "nombre_completo": c["nombre_completo"], "edad": c["edad"]}
+        for c in listar_cumpleanios_proximos(dias=1)
+    ]
+
+
 def contar_pacientes() -> int:
     conn = get_connection()
     cur = conn.cursor()
@@ -4028,10 +6988,10 @@ def contar_citas_periodo(periodo: str) -> int:
         """
         SELECT COUNT(*)
         FROM citas
-        WHERE datetime(fecha_hora) >= datetime(?)
-          AND datetime(fecha_hora) <= datetime(?);
+        WHERE inicio_min >= ?
+          AND inicio_min <= ?;
         """,
-        (dt_desde, dt_hasta),
+        (_minutos_epoch(dt_desde), _minutos_epoch(dt_hasta)),
     )
     total = int(cur.fetchone()[0] or 0)
     conn.close()
@@ -4050,11 +7010,12 @@ def citas_por_mes_anio(anio: int) -> List[int]:
         SELECT CAST(strftime('%m', datetime(fecha_hora)) AS INTEGER) AS mes,
                COUNT(*) AS total
         FROM citas
-        WHERE strftime('%Y', datetime(fecha_hora)) = ?
+        WHERE inicio_min >= ?
+          AND inicio_min < ?
         GROUP BY mes
         ORDER BY mes;
         """,
-        (str(anio),),
+        (_minutos_epoch(date(anio, 1, 1)), _minutos_epoch(date(anio + 1, 1, 1))),
     )
     data = [0] * 12
     for r in cur.fetchall():
@@ -4076,10 +7037,10 @@ def tasa_asistencia(periodo: str) -> Dict[str, Any]:
           SUM(CASE WHEN lower(estado)='no_asistio' THEN 1 ELSE 0 END) AS no_asistio,
           COUNT(*) AS total
         FROM citas
-        WHERE datetime(fecha_hora) >= datetime(?)
-          AND datetime(fecha_hora) <= datetime(?);
+        WHERE inicio_min >= ?
+          AND inicio_min <= ?;
         """,
-        (dt_desde, dt_hasta),
+        (_minutos_epoch(dt_desde), _minutos_epoch(dt_hasta)),
     )
     r = cur.fetchone()
     conn.close()
@@ -4112,13 +7073,13 @@ def top_5_pacientes_frecuentes(periodo: str) -> List[Dict[str, Any]]:
           COUNT(*) AS cantidad
         FROM citas c
         JOIN pacientes p ON p.documento = c.documento_paciente
-        WHERE datetime(c.fecha_hora) >= datetime(?)
-          AND datetime(c.fecha_hora) <= datetime(?)
+        WHERE c.inicio_min >= ?
+          AND c.inicio_min <= ?
         GROUP BY c.documento_paciente, p.nombre_completo
         ORDER BY cantidad DESC
         LIMIT 5;
         """,
-        (dt_desde, dt_hasta),
+        (_minutos_epoch(dt_desde), _minutos_epoch(dt_hasta)),
     )
     rows = cur.fetchall()
     conn.close()
@@ -4127,6 +7088,164 @@ def top_5_pacientes_frecuentes(periodo: str) -> List[Dict[str, Any]]:
         for r in rows
     ]
 
+
+# ------------ SNAPSHOT DEL DASHBOARD (home) -------------
+#
+# Los KPIs del home que dependen de citas (conteo, asistencia, top 5, serie
+# mensual) y los cumpleaños salen de UNA conexión, en una sola transacción de
+# lectura, con el rango del período calculado una vez. El resultado se guarda
+# unos segundos por período; cualquier escritura de citas (version_agenda) o de
+# pacientes lo invalida, así que cambiar el dropdown del home es inmediato.
+
+DASHBOARD_TTL_SEGUNDOS = 60.0
+
+_CACHE_DASHBOARD: Dict[Tuple[str, str, str], Tuple[float, int, Dict[str, Any]]] = {}
+_CACHE_DASHBOARD_LOCK = threading.Lock()
+
+
+def invalidar_cache_dashboard(_documento: Optional[str] = None) -> None:
+    with _CACHE_DASHBOARD_LOCK:
+        _CACHE_DASHBOARD.clear()
+
+
+registrar_oyente_pacientes(invalidar_cache_dashboard)
+
+
+def _calcular_snapshot_dashboard(periodo: str) -> Dict[str, Any]:
+    dt_desde, dt_hasta, _, _ = _rango_periodo_home(periodo)
+    hoy = date.today()
+    rango = (_minutos_epoch(dt_desde), _minutos_epoch(dt_hasta))
+
+    conn = get_connection()
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+    # Todas las lecturas ven el mismo estado de la BD
+    cur.execute("BEGIN;")
+
+    cur.execute(
+        """
+        WITH citas_periodo AS (
+            SELECT lower(estado) AS estado
+            FROM citas
+            WHERE inicio_min >= ? AND inicio_min <= ?
+        )
+        SELECT
+          COUNT(*) AS total,
+          COALESCE(SUM(CASE WHEN estado = 'confirmado' THEN 1 ELSE 0 END), 0) AS confirmadas,
+          COALESCE(SUM(CASE WHEN estado = 'no_asistio' THEN 1 ELSE 0 END), 0) AS no_asistio,
+          (SELECT COUNT(*) FROM pacientes) AS total_pacientes
+        FROM citas_periodo;
+        """,
+        rango,
+    )
+    r = cur.fetchone()
+    total = int(r["total"] or 0)
+    confirmadas = int(r["confirmadas"] or 0)
+    no_asistio = int(r["no_asistio"] or 0)
+    total_pacientes = int(r["total_pacientes"] or 0)
+
+    cur.execute(
+        """
+        WITH frecuentes AS (
+            SELECT documento_paciente, COUNT(*) AS cantidad
+            FROM citas
+            WHERE inicio_min >= ? AND inicio_min <= ?
+            GROUP BY documento_paciente
+        )
+        SELECT p.nombre_completo, f.documento_paciente, f.cantidad
+        FROM frecuentes f
+        JOIN pacientes p ON p.documento = f.documento_paciente
+        ORDER BY f.cantidad DESC
+        LIMIT 5;
+        """,
+        rango,
+    )
+    top5 = [
+        {"nombre_completo": t["nombre_completo"], "documento": t["documento_paciente"], "cantidad": int(t["cantidad"] or 0)}
+        for t in cur.fetchall()
+    ]
+
+    cur.execute(
+        """
+        WITH meses AS (
+            SELECT CAST(strftime('%m', datetime(fecha_hora)) AS INTEGER) AS mes
+            FROM citas
+            WHERE inicio_min >= ? AND inicio_min < ?
+        )
+        SELECT mes, COUNT(*) AS total
+        FROM meses
+        GROUP BY mes;
+        """,
+        (_minutos_epoch(date(hoy.year, 1, 1)), _minutos_epoch(date(hoy.year + 1, 1, 1))),
+    )
+    citas_mes = [0] * 12
+    for m in cur.fetchall():
+        if m["mes"]:
+            citas_mes[int(m["mes"]) - 1] = int(m["total"] or 0)
+
+    claves_cumple = list(_claves_cumpleanios(hoy, 1))
+    cur.execute(
+        f"""
+        SELECT documento, nombre_completo, fecha_nacimiento_iso
+        FROM pacientes
+        WHERE cumple_mmdd IN ({", ".join("?" for _ in claves_cumple)});
+        """,
+        claves_cumple,
+    )
+    cumpleanios: List[Dict[str, Any]] = [
+        {
+            "documento": p["documento"],
+            "nombre_completo": p["nombre_completo"],
+            "edad": hoy.year - int(p["fecha_nacimiento_iso"][:4]),
+        }
+        for p in cur.fetchall()
+    ]
+
+    conn.commit()
+    conn.close()
+
+    return {
+        "periodo": periodo,
+        "total_pacientes": total_pacientes,
+        "total_citas": total,
+        "asistencia": {
+            "confirmadas": confirmadas,
+            "no_asistio": no_asistio,
+            "tasa_pct": round((confirmadas / max(1, total)) * 100),
+            "total": total,
+        },
+        "top5": top5,
+        "citas_por_mes": citas_mes,
+        "cumpleanios": cumpleanios,
+    }
+
+
+def snapshot_dashboard(periodo: str, usar_cache: bool = True) -> Dict[str, Any]:
+    """
+    KPIs del home para `periodo` en una sola consulta consolidada:
+      total_pacientes, total_citas, asistencia (igual que tasa_asistencia),
+      top5 (igual que top_5_pacientes_frecuentes), citas_por_mes (año actual)
+      y cumpleanios de hoy.
+    """
+    # La fecha entra en la clave: a medianoche cambian rango y cumpleaños
+    clave = (str(DB_PATH), periodo, date.today().isoformat())
+    version = version_agenda()
+    ahora = time.monotonic()
+
+    if usar_cache:
+        with _CACHE_DASHBOARD_LOCK:
+            guardado = _CACHE_DASHBOARD.get(clave)
+        if guardado is not None:
+            t, v, datos = guardado
+            if v == version and ahora - t < DASHBOARD_TTL_SEGUNDOS:
+                return datos
+
+    datos = _calcular_snapshot_dashboard(periodo)
+    with _CACHE_DASHBOARD_LOCK:
+        _CACHE_DASHBOARD[clave] = (ahora, version, datos)
+    return datos
+
+
 #----------- SYNC GOOGLE CALENDAR --------------
 def existe_cita_por_id(cita_id: int) -> bool:
     conn = get_connection()
@@ -4154,3 +7273,13 @@ if __name__ == "__main__":
     print(f"Inicializando base de datos en: {DB_PATH}")
     init_db()
     print("Tablas listas.")
+
+    if "--reconstruir-resumenes" in sys.argv:
+        n = reconstruir_resumenes_financieros()
+        print(f"Resúmenes financieros recalculados: {n} meses.")
+    if "--verificar-resumenes" in sys.argv:
+        distintos = verificar_resumenes_financieros(reparar="--reparar" in sys.argv)
+        if distintos:
+            print("⚠️ Resúmenes desactualizados:", ", ".join(distintos))
+        else:
+            print("Resúmenes financieros consistentes.")
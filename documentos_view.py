@@ -8,6 +8,8 @@ import flet as ft
 
 from .db import DB_PATH, listar_pacientes, listar_citas_por_paciente
 from .paths import get_documentos_dir
+from .busqueda_pacientes import buscar_pacientes
+from .buscador_diferido import BuscadorDiferido
 
 from .documentos_pdf import (
     generar_pdf_consentimiento,
@@ -643,18 +645,14 @@ def build_documentos_view(page: ft.Page) -> ft.Control:
 
     lista_pacientes = ft.ListView(expand=True, spacing=2, padding=0)
 
-    def render_lista(q: str = ""):
+    def render_lista(q: str = "", data: Optional[List[Dict[str, Any]]] = None):
         lista_pacientes.controls.clear()
         qq = (q or "").strip().lower()
 
-        data = pacientes_cache
-        if qq and len(qq) >= 2:
-            data = [
-                p for p in pacientes_cache
-                if qq in (f"{p.get('nombre_completo','')} {p.get('documento','')}".lower())
-            ]
-
-        data = data[:80]
+        if len(qq) < 2:
+            data = pacientes_cache[:80]
+        elif data is None:
+            data = buscar_pacientes(qq, limite=80)
 
         for p in data:
             label = paciente_label(p)
@@ -675,7 +673,13 @@ def build_documentos_view(page: ft.Page) -> ft.Control:
             )
         page.update()
 
-    txt_buscar.on_change = lambda e: render_lista(txt_buscar.value)
+    buscador_pacientes = BuscadorDiferido(
+        lambda q: buscar_pacientes(q, limite=80),
+        lambda q, resultados: render_lista(q, resultados),
+        max_resultados=80,
+        min_caracteres=2,
+    )
+    txt_buscar.on_change = lambda e: buscador_pacientes.solicitar(txt_buscar.value)
 
     sidebar = ft.Container(
         width=360,
@@ -5,9 +5,10 @@ from typing import Dict, Any, Optional
 import flet as ft
 
 from .facturas_pdf import generar_pdf_factura
+from .busqueda_pacientes import buscar_pacientes
+from .buscador_diferido import BuscadorDiferido
 from .db import (
     listar_empresas_convenio,
-    listar_pacientes,
     crear_factura_convenio,
     listar_facturas_convenio,
     obtener_factura_convenio,
@@ -32,7 +33,6 @@ def build_facturas_view(page: ft.Page) -> ft.Control:
     # Datos base desde BD
     # ---------------------------------------------------------------------
     empresas_cache = listar_empresas_convenio()
-    pacientes_cache = listar_pacientes()
 
     # ---------------------------------------------------------------------
     # =============== 1. SECCIÓN: CREACIÓN DE FACTURAS ====================
@@ -100,31 +100,30 @@ def build_facturas_view(page: ft.Page) -> ft.Control:
     def _seleccionar_paciente(pac_row):
         txt_paciente_nombre.value = pac_row["nombre_completo"]
         txt_paciente_documento.value = pac_row["documento"]
+        buscador_pacientes.cancelar()
         txt_buscar_paciente.value = ""
         resultados_pacientes.controls.clear()
         page.update()
 
-    def _filtrar_pacientes(e=None):
-        query = (txt_buscar_paciente.value or "").strip().lower()
+    def _mostrar_pacientes(query, resultados):
         resultados_pacientes.controls.clear()
 
-        if not query or len(query) < 2:
-            page.update()
-            return
-
-        for p in pacientes_cache:
+        for p in resultados:
             nombre = p["nombre_completo"]
             doc = p["documento"]
-            texto_busqueda = f"{nombre} {doc}".lower()
-            if query in texto_busqueda:
-                btn = ft.TextButton(
-                    f"{nombre} ({doc})",
-                    on_click=lambda ev, pac=p: _seleccionar_paciente(pac),
-                )
-                resultados_pacientes.controls.append(btn)
+            btn = ft.TextButton(
+                f"{nombre} ({doc})",
+                on_click=lambda ev, pac=p: _seleccionar_paciente(pac),
+            )
+            resultados_pacientes.controls.append(btn)
 
         page.update()
 
+    buscador_pacientes = BuscadorDiferido(buscar_pacientes, _mostrar_pacientes, min_caracteres=2)
+
+    def _filtrar_pacientes(e=None):
+        buscador_pacientes.solicitar(txt_buscar_paciente.value)
+
     txt_buscar_paciente.on_change = _filtrar_pacientes
 
     # --- Detalle factura (MÚLTIPLES ÍTEMS) ---
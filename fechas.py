@@ -1,32 +1,63 @@
 from datetime import date, datetime
+from typing import Any, Optional
 
-def calcular_edad(fecha_nacimiento_raw) -> str:
+# Formatos de fecha aceptados además de ISO ('YYYY-MM-DD', lo que guarda la BD)
+FORMATOS_FECHA_ALTERNOS = ("%d-%m-%Y", "%d/%m/%Y", "%Y/%m/%d")
+
+# Formato con el que se muestran las fechas en la UI / PDFs / Excel
+FORMATO_FECHA_DISPLAY = "%d-%m-%Y"
+
+
+def parse_fecha(valor: Any) -> Optional[date]:
     """
-    Devuelve edad en años como string, o '-' si no se puede calcular.
+    Convierte a date un valor de fecha, o None si no se puede interpretar.
     Soporta:
-      - 'DD-MM-YYYY' (como tu Excel)
-      - 'YYYY-MM-DD' (si llega así desde UI/DB)
+      - 'YYYY-MM-DD' (formato de la BD; camino rápido sin strptime)
+      - 'DD-MM-YYYY' / 'DD/MM/YYYY' (Excel / Forms / UI) y 'YYYY/MM/DD'
       - date/datetime
+    Si el texto trae hora ('YYYY-MM-DD HH:MM') se toma solo la fecha.
     """
-    if not fecha_nacimiento_raw:
-        return "-"
+    if valor is None:
+        return None
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+
+    s = str(valor).strip()[:10]
+    if not s:
+        return None
+    try:
+        return date.fromisoformat(s)
+    except ValueError:
+        pass
+    for fmt in FORMATOS_FECHA_ALTERNOS:
+        try:
+            return datetime.strptime(s, fmt).date()
+        except ValueError:
+            pass
+    return None
 
-    # Normalizar a date
-    if isinstance(fecha_nacimiento_raw, datetime):
-        fn = fecha_nacimiento_raw.date()
-    elif isinstance(fecha_nacimiento_raw, date):
-        fn = fecha_nacimiento_raw
-    else:
-        s = str(fecha_nacimiento_raw).strip()
-        fn = None
-        for fmt in ("%d-%m-%Y", "%Y-%m-%d"):
-            try:
-                fn = datetime.strptime(s[:10], fmt).date()
-                break
-            except Exception:
-                pass
-        if fn is None:
-            return "-"
+
+def formatear_fecha(valor: Any, formato: str = FORMATO_FECHA_DISPLAY) -> str:
+    """
+    Fecha lista para mostrar ('DD-MM-YYYY' por defecto). Si el valor no es una
+    fecha válida se devuelve el texto tal cual (o "" si viene vacío).
+    """
+    d = parse_fecha(valor)
+    if d is None:
+        return "" if valor is None else str(valor).strip()
+    return d.strftime(formato)
+
+
+def calcular_edad(fecha_nacimiento_raw) -> str:
+    """
+    Devuelve edad en años como string, o '-' si no se puede calcular.
+    Acepta los mismos formatos que parse_fecha().
+    """
+    fn = parse_fecha(fecha_nacimiento_raw)
+    if fn is None:
+        return "-"
 
     hoy = date.today()
     edad = hoy.year - fn.year - ((hoy.month, hoy.day) < (fn.month, fn.day))
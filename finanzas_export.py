@@ -0,0 +1,191 @@
+# finanzas_export.py
+"""
+Exportación de los reportes financieros (ingresos, gastos y consumos de
+paquetes) para un rango de fechas arbitrario.
+
+Las filas salen del cursor por lotes (db.iterar_reporte_financiero) y se
+escriben directo al archivo: CSV con csv.writer y XLSX con el modo
+write_only de openpyxl, que va volcando las filas a disco. La memoria usada no
+depende del tamaño del rango, así que un libro de varios años no congela la app.
+"""
+from __future__ import annotations
+
+import csv
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+from .db import (
+    REPORTE_FINANCIERO_LOTE,
+    TIPOS_REPORTE_FINANCIERO,
+    columnas_reporte_financiero,
+    iterar_reporte_financiero,
+    titulo_reporte_financiero,
+)
+
+
+# Encabezados visibles de cada columna de los reportes
+ENCABEZADOS = {
+    "fecha": "Fecha",
+    "origen": "Origen",
+    "referencia": "Referencia",
+    "tercero": "Paciente / Empresa",
+    "detalle": "Detalle",
+    "tipo": "Tipo",
+    "descripcion": "Descripción",
+    "valor": "Valor",
+    "consumido_por": "Consumido por",
+}
+
+ANCHOS_XLSX = {
+    "fecha": 18,
+    "origen": 18,
+    "referencia": 14,
+    "tercero": 34,
+    "detalle": 14,
+    "tipo": 22,
+    "descripcion": 40,
+    "valor": 16,
+    "consumido_por": 16,
+}
+
+# Excel en español (es-CO) abre directo los CSV separados por ';'
+CSV_DELIMITADOR = ";"
+
+# progreso(tipo, filas_escritas): se llama cada REPORTE_FINANCIERO_LOTE filas y al terminar
+Progreso = Callable[[str, int], None]
+
+
+def encabezado(columna: str) -> str:
+    return ENCABEZADOS.get(columna, columna)
+
+
+def _valor_csv(v: Any) -> Any:
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    return "" if v is None else v
+
+
+def _fecha_excel(v: Any) -> Any:
+    """'YYYY-MM-DD[ HH:MM]' -> datetime para que Excel la trate como fecha."""
+    s = "" if v is None else str(v).strip()
+    try:
+        return datetime.fromisoformat(s)
+    except ValueError:
+        return s
+
+
+def _con_progreso(tipo: str, filas: Iterable[tuple], progreso: Optional[Progreso]) -> Iterable[tuple]:
+    n = 0
+    for fila in filas:
+        yield fila
+        n += 1
+        if progreso is not None and n % REPORTE_FINANCIERO_LOTE == 0:
+            progreso(tipo, n)
+    if progreso is not None:
+        progreso(tipo, n)
+
+
+def exportar_reporte_csv(
+    path: str | Path,
+    tipo: str,
+    fecha_desde: Any,
+    fecha_hasta: Any,
+    progreso: Optional[Progreso] = None,
+) -> int:
+    """
+    Escribe el reporte `tipo` en un CSV (UTF-8 con BOM para Excel).
+    Devuelve la cantidad de filas escritas (sin contar el encabezado).
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    columnas = columnas_reporte_financiero(tipo)
+
+    n = 0
+    with path.open("w", newline="", encoding="utf-8-sig") as fh:
+        w = csv.writer(fh, delimiter=CSV_DELIMITADOR)
+        w.writerow([encabezado(c) for c in columnas])
+        filas = iterar_reporte_financiero(tipo, fecha_desde, fecha_hasta)
+        for fila in _con_progreso(tipo, filas, progreso):
+            w.writerow([_valor_csv(v) for v in fila])
+            n += 1
+    return n
+
+
+def exportar_reportes_xlsx(
+    path: str | Path,
+    fecha_desde: Any,
+    fecha_hasta: Any,
+    tipos: Optional[Iterable[str]] = None,
+    progreso: Optional[Progreso] = None,
+) -> Dict[str, int]:
+    """
+    Escribe un Excel con una hoja por reporte (por defecto los tres), con
+    fechas y valores como celdas tipadas y una fila de total al final.
+    Devuelve {tipo: filas escritas}.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tipos = list(tipos or TIPOS_REPORTE_FINANCIERO)
+
+    wb = Workbook(write_only=True)
+    negrita = Font(bold=True)
+    escritas: Dict[str, int] = {}
+
+    for tipo in tipos:
+        columnas = columnas_reporte_financiero(tipo)
+        i_fecha = columnas.index("fecha")
+        i_valor = columnas.index("valor")
+
+        ws = wb.create_sheet(title=titulo_reporte_financiero(tipo)[:31])
+        # En write_only los anchos y el freeze se fijan antes de la primera fila
+        for i, col in enumerate(columnas):
+            ws.column_dimensions[chr(ord("A") + i)].width = ANCHOS_XLSX.get(col, 14)
+        ws.freeze_panes = "A2"
+
+        cabecera = []
+        for col in columnas:
+            c = WriteOnlyCell(ws, value=encabezado(col))
+            c.font = negrita
+            cabecera.append(c)
+        ws.append(cabecera)
+
+        n = 0
+        total = 0.0
+        filas = iterar_reporte_financiero(tipo, fecha_desde, fecha_hasta)
+        for fila in _con_progreso(tipo, filas, progreso):
+            valores = list(fila)
+
+            fecha = _fecha_excel(valores[i_fecha])
+            if isinstance(fecha, datetime):
+                c = WriteOnlyCell(ws, value=fecha)
+                c.number_format = "DD-MM-YYYY HH:MM" if (fecha.hour or fecha.minute) else "DD-MM-YYYY"
+                valores[i_fecha] = c
+
+            monto = float(valores[i_valor] or 0)
+            total += monto
+            c = WriteOnlyCell(ws, value=monto)
+            c.number_format = "#,##0"
+            valores[i_valor] = c
+
+            ws.append(valores)
+            n += 1
+
+        fila_total: list = [None] * len(columnas)
+        etiqueta = WriteOnlyCell(ws, value=f"Total ({n} filas)")
+        etiqueta.font = negrita
+        fila_total[0] = etiqueta
+        c = WriteOnlyCell(ws, value=total)
+        c.font = negrita
+        c.number_format = "#,##0"
+        fila_total[i_valor] = c
+        ws.append(fila_total)
+
+        escritas[tipo] = n
+
+    wb.save(path)
+    return escritas
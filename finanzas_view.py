@@ -1,7 +1,13 @@
 import flet as ft
+import threading
 from datetime import date, datetime
 
 from .db import (
+    TIPOS_REPORTE_FINANCIERO,
+    columnas_reporte_financiero,
+    pagina_reporte_financiero,
+    titulo_reporte_financiero,
+    totales_reporte_financiero,
     resumen_financiero_mensual,
     registrar_gasto_financiero,
     listar_gastos_financieros,
@@ -14,6 +20,8 @@ from .db import (
     actualizar_paquete_arriendo,
     eliminar_paquete_arriendo,
 )
+from .fechas import parse_fecha
+from .finanzas_export import encabezado, exportar_reporte_csv, exportar_reportes_xlsx
 
 MESES_NOMBRE = [
     "Enero",
@@ -1055,10 +1063,261 @@ def build_finanzas_view(page: ft.Page) -> ft.Control:
     )
     
 
+    # ----------------- REPORTES POR RANGO (paginado + exportación) -----------------
+    # La tabla trae una página a la vez (paginación por clave en la BD) y la
+    # exportación lee del cursor por lotes en un hilo aparte, así un rango de
+    # varios años no se arma completo en memoria ni congela la UI.
+
+    FILAS_POR_PAGINA = 50
+
+    dd_reporte = ft.Dropdown(
+        label="Reporte",
+        value="ingresos",
+        width=220,
+        options=[ft.dropdown.Option(t, titulo_reporte_financiero(t)) for t in TIPOS_REPORTE_FINANCIERO],
+    )
+    txt_rep_desde = ft.TextField(
+        label="Desde",
+        value=date(anio_actual, 1, 1).isoformat(),
+        hint_text="YYYY-MM-DD",
+        width=150,
+    )
+    txt_rep_hasta = ft.TextField(
+        label="Hasta",
+        value=hoy.isoformat(),
+        hint_text="YYYY-MM-DD",
+        width=150,
+    )
+
+    tabla_reporte = ft.DataTable(columns=[ft.DataColumn(ft.Text(""))], rows=[], column_spacing=16)
+    lbl_reporte_info = ft.Text("", size=12, color=ft.Colors.GREY_700)
+    lbl_reporte_pagina = ft.Text("", size=12, color=ft.Colors.GREY_700)
+    lbl_reporte_export = ft.Text("", size=12, color=ft.Colors.GREY_700)
+    progreso_export = ft.ProgressRing(width=16, height=16, stroke_width=2, visible=False)
+
+    # claves[i] = clave con la que empieza la página i (None = primera)
+    estado_reporte = {
+        "tipo": "ingresos",
+        "desde": None,
+        "hasta": None,
+        "claves": [None],
+        "pagina": 0,
+        "siguiente": None,
+        "exportando": False,
+    }
+
+    def _rango_reporte():
+        d1 = parse_fecha(txt_rep_desde.value)
+        d2 = parse_fecha(txt_rep_hasta.value)
+        txt_rep_desde.error_text = None if d1 else "Fecha inválida"
+        txt_rep_hasta.error_text = None if d2 else "Fecha inválida"
+        if not d1 or not d2:
+            return None
+        return (min(d1, d2), max(d1, d2))
+
+    def _celda_reporte(columna, valor):
+        if columna == "valor":
+            return ft.DataCell(ft.Text(_fmt(float(valor or 0))))
+        if columna == "fecha":
+            return ft.DataCell(ft.Text(str(valor or "")))
+        texto = str(valor or "")
+        return ft.DataCell(ft.Text(texto[:40], tooltip=texto if len(texto) > 40 else None))
+
+    def _cargar_pagina_reporte():
+        tipo = estado_reporte["tipo"]
+        columnas = columnas_reporte_financiero(tipo)
+        despues = estado_reporte["claves"][estado_reporte["pagina"]]
+        try:
+            filas, siguiente = pagina_reporte_financiero(
+                tipo,
+                estado_reporte["desde"],
+                estado_reporte["hasta"],
+                despues=despues,
+                limite=FILAS_POR_PAGINA,
+            )
+        except Exception as ex:
+            print("⚠️ Error cargando reporte:", ex)
+            filas, siguiente = [], None
+            lbl_reporte_info.value = f"Error al cargar reporte: {ex}"
+
+        estado_reporte["siguiente"] = siguiente
+        tabla_reporte.columns = [ft.DataColumn(ft.Text(encabezado(c))) for c in columnas]
+        tabla_reporte.rows = [
+            ft.DataRow(cells=[_celda_reporte(c, f.get(c)) for c in columnas]) for f in filas
+        ]
+
+        pagina = estado_reporte["pagina"]
+        lbl_reporte_pagina.value = f"Página {pagina + 1}" if filas else ""
+        btn_rep_anterior.disabled = pagina == 0
+        btn_rep_siguiente.disabled = siguiente is None
+        page.update()
+
+    def _consultar_reporte(_=None):
+        rango = _rango_reporte()
+        if rango is None:
+            page.update()
+            return
+        estado_reporte.update(
+            tipo=dd_reporte.value or "ingresos",
+            desde=rango[0].isoformat(),
+            hasta=rango[1].isoformat(),
+            claves=[None],
+            pagina=0,
+            siguiente=None,
+        )
+        try:
+            tot = totales_reporte_financiero(estado_reporte["tipo"], rango[0], rango[1])
+            lbl_reporte_info.value = (
+                f"{tot['filas']} movimientos · Total {_fmt(tot['total'])}"
+                if tot["filas"]
+                else "No hay movimientos en este rango."
+            )
+        except Exception as ex:
+            lbl_reporte_info.value = f"Error al calcular totales: {ex}"
+        _cargar_pagina_reporte()
+
+    def _pagina_siguiente(_):
+        if estado_reporte["siguiente"] is None:
+            return
+        claves = estado_reporte["claves"]
+        estado_reporte["pagina"] += 1
+        del claves[estado_reporte["pagina"]:]
+        claves.append(estado_reporte["siguiente"])
+        _cargar_pagina_reporte()
+
+    def _pagina_anterior(_):
+        if estado_reporte["pagina"] == 0:
+            return
+        estado_reporte["pagina"] -= 1
+        _cargar_pagina_reporte()
+
+    btn_rep_anterior = ft.IconButton(
+        icon=ft.Icons.CHEVRON_LEFT, tooltip="Página anterior", on_click=_pagina_anterior, disabled=True
+    )
+    btn_rep_siguiente = ft.IconButton(
+        icon=ft.Icons.CHEVRON_RIGHT, tooltip="Página siguiente", on_click=_pagina_siguiente, disabled=True
+    )
+
+    dd_reporte.on_change = _consultar_reporte
+    txt_rep_desde.on_submit = _consultar_reporte
+    txt_rep_hasta.on_submit = _consultar_reporte
+
+    def _fin_exportacion(mensaje: str, ok: bool):
+        estado_reporte["exportando"] = False
+        progreso_export.visible = False
+        btn_export_csv.disabled = False
+        btn_export_xlsx.disabled = False
+        lbl_reporte_export.value = ""
+        page.snack_bar = ft.SnackBar(
+            content=ft.Text(mensaje),
+            bgcolor=ft.Colors.GREEN_300 if ok else ft.Colors.RED_200,
+        )
+        page.snack_bar.open = True
+        page.update()
+
+    def _exportar_en_hilo(ruta: str, formato: str):
+        rango = _rango_reporte()
+        if rango is None or estado_reporte["exportando"]:
+            page.update()
+            return
+        tipo = dd_reporte.value or "ingresos"
+        estado_reporte["exportando"] = True
+        progreso_export.visible = True
+        btn_export_csv.disabled = True
+        btn_export_xlsx.disabled = True
+        lbl_reporte_export.value = "Exportando…"
+        page.update()
+
+        def _progreso(t: str, filas: int):
+            lbl_reporte_export.value = f"Exportando {titulo_reporte_financiero(t).lower()}: {filas} filas…"
+            page.update()
+
+        def tarea():
+            try:
+                if formato == "csv":
+                    n = exportar_reporte_csv(ruta, tipo, rango[0], rango[1], progreso=_progreso)
+                else:
+                    n = sum(exportar_reportes_xlsx(ruta, rango[0], rango[1], progreso=_progreso).values())
+            except Exception as ex:
+                print("⚠️ Error exportando reporte financiero:", ex)
+                _fin_exportacion(f"Error al exportar: {ex}", ok=False)
+                return
+            _fin_exportacion(f"Exportación OK: {n} filas.", ok=True)
+
+        threading.Thread(target=tarea, daemon=True).start()
+
+    def _on_pick_export_csv(e: ft.FilePickerResultEvent):
+        if e.path:
+            _exportar_en_hilo(e.path, "csv")
+
+    def _on_pick_export_xlsx(e: ft.FilePickerResultEvent):
+        if e.path:
+            _exportar_en_hilo(e.path, "xlsx")
+
+    picker_export_csv = ft.FilePicker(on_result=_on_pick_export_csv)
+    picker_export_xlsx = ft.FilePicker(on_result=_on_pick_export_xlsx)
+    page.overlay.extend([picker_export_csv, picker_export_xlsx])
+
+    def _nombre_archivo(ext: str) -> str:
+        rango = _rango_reporte() or (hoy, hoy)
+        base = "finanzas" if ext == "xlsx" else (dd_reporte.value or "reporte")
+        return f"{base}_{rango[0].isoformat()}_{rango[1].isoformat()}.{ext}"
+
+    btn_export_csv = ft.OutlinedButton(
+        "CSV",
+        icon=ft.Icons.FILE_DOWNLOAD,
+        tooltip="Exportar el reporte seleccionado a CSV",
+        on_click=lambda ev: picker_export_csv.save_file(
+            file_name=_nombre_archivo("csv"),
+            allowed_extensions=["csv"],
+        ),
+    )
+    btn_export_xlsx = ft.OutlinedButton(
+        "Excel",
+        icon=ft.Icons.FILE_DOWNLOAD,
+        tooltip="Exportar ingresos, gastos y consumos a Excel (una hoja por reporte)",
+        on_click=lambda ev: picker_export_xlsx.save_file(
+            file_name=_nombre_archivo("xlsx"),
+            allowed_extensions=["xlsx"],
+        ),
+    )
+
+    seccion_reportes = ft.Column(
+        [
+            ft.Row(
+                [
+                    dd_reporte,
+                    txt_rep_desde,
+                    txt_rep_hasta,
+                    ft.FilledButton("Consultar", icon=ft.Icons.SEARCH, on_click=_consultar_reporte),
+                    btn_export_csv,
+                    btn_export_xlsx,
+                    progreso_export,
+                    lbl_reporte_export,
+                ],
+                spacing=10,
+                wrap=True,
+                vertical_alignment=ft.CrossAxisAlignment.CENTER,
+            ),
+            lbl_reporte_info,
+            ft.Container(
+                content=ft.Column([tabla_reporte], scroll=ft.ScrollMode.AUTO, expand=True),
+                height=320,
+            ),
+            ft.Row(
+                [btn_rep_anterior, lbl_reporte_pagina, btn_rep_siguiente],
+                spacing=4,
+                vertical_alignment=ft.CrossAxisAlignment.CENTER,
+            ),
+        ],
+        spacing=8,
+    )
+
     # Cargar datos iniciales
     _cargar_resumen()
     _cargar_resumen_paquetes()
     _cargar_tabla_paquetes()
+    _consultar_reporte()
 
     # ----------------- LAYOUT GENERAL -----------------
 
@@ -1171,6 +1430,10 @@ def build_finanzas_view(page: ft.Page) -> ft.Control:
                     spacing=10,
                 ),
             ),
+            ft.Container(height=12),
+
+            # ✅ REPORTES POR RANGO (card)
+            seccion_card("Reportes por rango de fechas", seccion_reportes),
         ],
         spacing=10,
         scroll=ft.ScrollMode.ALWAYS,
@@ -21,7 +21,7 @@ from reportlab.platypus import (
 from reportlab.lib.enums import TA_LEFT, TA_CENTER
 from reportlab.lib import colors
 
-from .fechas import calcular_edad
+from .fechas import calcular_edad, formatear_fecha
 from .paths import get_historias_dir
 from .db import (
     DB_PATH,
@@ -411,6 +411,8 @@ def generar_pdf_historia(
             return v if v not in (None, "", "None") else "-"
         if campo == "edad":
             return calcular_edad(pac.get("fecha_nacimiento"))
+        if campo == "fecha_nacimiento":
+            return formatear_fecha(pac.get("fecha_nacimiento")) or "-"
         v = pac.get(campo)
         return v if v not in (None, "", "None") else "-"
 
@@ -11,20 +11,25 @@ import asyncio
 import time
 import re
 import sqlite3
-from html import unescape
 import threading
 
 from .historia_pdf import generar_pdf_historia
 from .markdown_editor import MarkdownEditor
 from .cie11_api import CIE11Client
 from .rich_editor_server import RichEditorServer
+from .busqueda_pacientes import buscar_pacientes
+from .buscador_diferido import BuscadorDiferido
+from .utils import html_to_plain_text
 
 from .db import (
-    listar_pacientes,
     obtener_paciente,
+    buscar_notas_clinicas,
     obtener_historia_clinica,
     guardar_historia_clinica,
-    listar_sesiones_clinicas,
+    listar_sesiones_clinicas_resumen,
+    obtener_sesion_clinica,
+    obtener_html_sesion,
+    tamano_html_sesion,
     guardar_sesion_clinica,
     eliminar_sesion_clinica,
     listar_antecedentes_medicos,
@@ -35,7 +40,6 @@ from .db import (
     agregar_diagnostico_historia,
     eliminar_diagnostico_historia,
     get_connection,
-    DB_PATH,
     DATA_DIR,
 )
 
@@ -55,62 +59,6 @@ def _get_rich_srv() -> RichEditorServer:
         _RICH_SRV.start()
     return _RICH_SRV
 
-def _db_get_sesion_html_len(sesion_id: int) -> int:
-    """Devuelve len(contenido_html) o 0 si no existe / vacío."""
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        cur = conn.cursor()
-        cur.execute("SELECT length(contenido_html) FROM sesiones_clinicas WHERE id = ? LIMIT 1;", (int(sesion_id),))
-        row = cur.fetchone()
-        conn.close()
-        if not row or row[0] is None:
-            return 0
-        return int(row[0])
-    except Exception:
-        return 0
-    
-def _db_get_sesion_html(sesion_id: int) -> str:
-    import sqlite3
-    from .db import DB_PATH
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT contenido_html FROM sesiones_clinicas WHERE id = ? LIMIT 1;", (int(sesion_id),))
-    row = cur.fetchone()
-    conn.close()
-    return (row[0] if row and row[0] else "") or ""
-    
-    
-def html_to_plain_text(s: str) -> str:
-    s = s or ""
-
-    # saltos típicos de Quill
-    s = s.replace("<br>", "\n").replace("<br/>", "\n").replace("<br />", "\n")
-
-    # párrafos
-    s = re.sub(r"</p\s*>", "\n\n", s, flags=re.I)
-    s = re.sub(r"<p[^>]*>", "", s, flags=re.I)
-
-    # listas
-    s = re.sub(r"<li[^>]*>", "• ", s, flags=re.I)
-    s = re.sub(r"</li\s*>", "\n", s, flags=re.I)
-    s = re.sub(r"</?(ul|ol)[^>]*>", "", s, flags=re.I)
-
-    # headings
-    s = re.sub(r"</h[1-6]\s*>", "\n\n", s, flags=re.I)
-    s = re.sub(r"<h[1-6][^>]*>", "", s, flags=re.I)
-
-    # quita el resto de tags
-    s = re.sub(r"<[^>]+>", "", s)
-
-    # entidades HTML
-    s = unescape(s)
-
-    # normaliza espacios/saltos
-    s = s.replace("\r\n", "\n").replace("\r", "\n")
-    s = re.sub(r"\n{3,}", "\n\n", s).strip()
-
-    return s
-    
 # FIN CONEXIÓN SERVER RICH EDITOR
 
 def build_historia_view(page: ft.Page) -> ft.Control:
@@ -121,8 +69,6 @@ def build_historia_view(page: ft.Page) -> ft.Control:
     - Pestaña 3: Generar histórico (PDF por rango / completo)
     """
 
-    pacientes_cache: List[Dict[str, Any]] = [dict(p) for p in listar_pacientes()]
-
     paciente_actual: Dict[str, Any] = {"value": None}
     historia_actual: Dict[str, Any] = {"id": None}
     sesion_editando: Dict[str, Any] = {"id": None}
@@ -191,6 +137,7 @@ def build_historia_view(page: ft.Page) -> ft.Control:
         if lbl_paciente_seleccionado.page is not None:
             lbl_paciente_seleccionado.update()
 
+        buscador_pacientes.cancelar()
         resultados_pacientes.controls.clear()
         txt_buscar_paciente.value = ""
         if resultados_pacientes.page is not None:
@@ -201,27 +148,24 @@ def build_historia_view(page: ft.Page) -> ft.Control:
         cargar_historia_desde_bd()
         page.update()
 
-    def _filtrar_pacientes(e=None):
-        query = (txt_buscar_paciente.value or "").strip().lower()
+    def _mostrar_pacientes(query: str, resultados: List[Dict[str, Any]]):
         resultados_pacientes.controls.clear()
 
-        if not query or len(query) < 2:
-            if resultados_pacientes.page is not None:
-                resultados_pacientes.update()
-            return
-
-        for p in pacientes_cache:
-            texto_busqueda = f"{p['nombre_completo']} {p['documento']}".lower()
-            if query in texto_busqueda:
-                btn = ft.TextButton(
-                    _render_nombre_y_doc(p),
-                    on_click=lambda ev, pac=p: _seleccionar_paciente(pac),
-                )
-                resultados_pacientes.controls.append(btn)
+        for p in resultados:
+            btn = ft.TextButton(
+                _render_nombre_y_doc(p),
+                on_click=lambda ev, pac=p: _seleccionar_paciente(pac),
+            )
+            resultados_pacientes.controls.append(btn)
 
         if resultados_pacientes.page is not None:
             resultados_pacientes.update()
 
+    buscador_pacientes = BuscadorDiferido(buscar_pacientes, _mostrar_pacientes, min_caracteres=2)
+
+    def _filtrar_pacientes(e=None):
+        buscador_pacientes.solicitar(txt_buscar_paciente.value)
+
     txt_buscar_paciente.on_change = _filtrar_pacientes
 
     # -------------------- Controles de historia clínica --------------------
@@ -1019,7 +963,7 @@ def build_historia_view(page: ft.Page) -> ft.Control:
             lbl_rich_estado.update()
             return
 
-        html = _db_get_sesion_html(int(sid))
+        html = obtener_html_sesion(int(sid))
         has_html = (len((html or "").strip()) > 0)
 
         if has_html:
@@ -1198,7 +1142,8 @@ def build_historia_view(page: ft.Page) -> ft.Control:
                 tabla_sesiones.update()
             return
 
-        sesiones = listar_sesiones_clinicas(historia_actual["id"])
+        # Sin contenido/contenido_html y con la hora de la cita ya unida (una sola consulta)
+        sesiones = listar_sesiones_clinicas_resumen(historia_actual["id"])
 
         for idx, s in enumerate(sesiones or [], start=1):
             s_dict = dict(s)  # sqlite3.Row -> dict
@@ -1207,7 +1152,7 @@ def build_historia_view(page: ft.Page) -> ft.Control:
 
             btn_editar = ft.TextButton(
                 "Editar",
-                on_click=lambda e, ses=s: cargar_sesion_en_form(ses),
+                on_click=lambda e, sid=sesion_id: editar_sesion_click(sid),
             )
             btn_eliminar = ft.TextButton(
                 "Eliminar",
@@ -1216,35 +1161,17 @@ def build_historia_view(page: ft.Page) -> ft.Control:
 
             # ---------------------------------------------
             # Fecha a mostrar:
-            # - Si hay cita_id => usar citas.fecha_hora (con hora real)
-            # - Si NO hay cita_id => usar sesiones_clinicas.fecha (solo fecha)
+            # - Si hay cita vinculada => usar citas.fecha_hora (con hora real)
+            # - Si NO hay cita (o ya no existe) => usar sesiones_clinicas.fecha (solo fecha)
             # ---------------------------------------------
             fecha_txt = s_dict.get("fecha") or ""
-            cita_id = s_dict.get("cita_id")
+            cita_fecha_hora = s_dict.get("cita_fecha_hora")
 
-            if cita_id:
+            if s_dict.get("cita_id") and cita_fecha_hora:
                 try:
-                    conn = get_connection()
-                    conn.row_factory = sqlite3.Row
-                    cur = conn.cursor()
-                    cur.execute("SELECT fecha_hora FROM citas WHERE id = ? LIMIT 1;", (cita_id,))
-                    row_cita = cur.fetchone()
-                    conn.close()
-
-                    if row_cita and row_cita["fecha_hora"]:
-                        try:
-                            fecha_txt = datetime.fromisoformat(str(row_cita["fecha_hora"])).strftime("%Y-%m-%d %H:%M")
-                        except Exception:
-                            fecha_txt = str(row_cita["fecha_hora"])
-                    else:
-                        # Si no encontramos la cita, al menos mostramos la fecha de la sesión
-                        fecha_txt = s_dict.get("fecha") or ""
+                    fecha_txt = datetime.fromisoformat(str(cita_fecha_hora)).strftime("%Y-%m-%d %H:%M")
                 except Exception:
-                    # fallback silencioso
-                    fecha_txt = s_dict.get("fecha") or ""
-            else:
-                # Sesión manual: NO inventar 00:00
-                fecha_txt = s_dict.get("fecha") or ""
+                    fecha_txt = str(cita_fecha_hora)
 
             tabla_sesiones.rows.append(
                 ft.DataRow(
@@ -1360,6 +1287,14 @@ def build_historia_view(page: ft.Page) -> ft.Control:
         if dd_citas.page:
             dd_citas.update()
 
+    def editar_sesion_click(sesion_id: int):
+        # El listado no trae el contenido: se lee la sesión completa al editar
+        s = obtener_sesion_clinica(sesion_id)
+        if s is None:
+            cargar_sesiones()
+            return
+        cargar_sesion_en_form(s)
+
     def cargar_sesion_en_form(s):
         # ✅ s puede ser sqlite3.Row o dict
         s = dict(s) if not isinstance(s, dict) else s
@@ -1458,7 +1393,7 @@ def build_historia_view(page: ft.Page) -> ft.Control:
         # ✅ Permitir guardar si hay HTML en editor enriquecido aunque el texto plano esté vacío
         if not contenido_texto:
             sid = sesion_editando.get("id")
-            if sid and _db_get_sesion_html_len(int(sid)) > 0:
+            if sid and tamano_html_sesion(int(sid)) > 0:
                 # OK: hay HTML guardado en el editor enriquecido
                 pass
             else:
@@ -1855,6 +1790,71 @@ def build_historia_view(page: ft.Page) -> ft.Control:
             tile_sesiones.update()
             tile_historico.update()
 
+    # -------------------- Búsqueda en notas clínicas (FTS) --------------------
+
+    txt_buscar_notas = ft.TextField(
+        label="Buscar en notas clínicas",
+        hint_text="Ej: ideación (Enter)",
+        dense=True,
+    )
+    resultados_notas = ft.Column(spacing=0, tight=True)
+
+    def _abrir_sesion_por_id(sesion_id: int):
+        try:
+            row_s = obtener_sesion_clinica(sesion_id)
+            if row_s:
+                cargar_sesion_en_form(row_s)
+        except Exception:
+            pass
+
+    def _abrir_resultado_nota(r: Dict[str, Any]):
+        fila = obtener_paciente(r.get("documento_paciente") or "")
+        if fila:
+            _seleccionar_paciente(dict(fila))
+
+        if r.get("origen") == "sesion":
+            cambiar_seccion("sesiones")
+            _abrir_sesion_por_id(r["ref_id"])
+        else:
+            cambiar_seccion("historia")
+        page.update()
+
+    def _buscar_notas(e=None):
+        query = (txt_buscar_notas.value or "").strip()
+        resultados_notas.controls.clear()
+
+        if len(query) >= 3:
+            try:
+                resultados = buscar_notas_clinicas(query, limite=30)
+            except Exception as ex:
+                print("⚠️ Error buscando en notas clínicas:", ex)
+                resultados = []
+
+            if not resultados:
+                resultados_notas.controls.append(
+                    ft.Text("Sin resultados.", size=12, italic=True)
+                )
+            for r in resultados:
+                nombre = r.get("nombre_completo") or r.get("documento_paciente") or ""
+                resultados_notas.controls.append(
+                    ft.ListTile(
+                        dense=True,
+                        title=ft.Text(f"{nombre} · {r.get('titulo') or ''}", size=12, weight="bold"),
+                        subtitle=ft.Text(
+                            f"{r.get('fecha') or ''}\n{(r.get('fragmento') or '').strip()}",
+                            size=11,
+                            max_lines=4,
+                            overflow=ft.TextOverflow.ELLIPSIS,
+                        ),
+                        on_click=lambda ev, rr=r: _abrir_resultado_nota(rr),
+                    )
+                )
+
+        if resultados_notas.page is not None:
+            resultados_notas.update()
+
+    txt_buscar_notas.on_submit = _buscar_notas
+
     menu_izq = ft.Container(
         width=230,
         bgcolor=ft.Colors.WHITE,
@@ -1877,6 +1877,10 @@ def build_historia_view(page: ft.Page) -> ft.Control:
                 ft.Text("Paciente", size=14, weight="bold"),
                 txt_buscar_paciente,
                 resultados_pacientes,
+                ft.Divider(),
+                ft.Text("Notas clínicas", size=14, weight="bold"),
+                txt_buscar_notas,
+                resultados_notas,
             ],
             spacing=8,
         ),
@@ -1944,19 +1948,7 @@ def build_historia_view(page: ft.Page) -> ft.Control:
 
     if open_sesion_id:
         cambiar_seccion("sesiones")
-
-        try:
-            conn = get_connection()
-            conn.row_factory = sqlite3.Row
-            cur = conn.cursor()
-            cur.execute("SELECT * FROM sesiones_clinicas WHERE id = ? LIMIT 1;", (int(open_sesion_id),))
-            row_s = cur.fetchone()
-            conn.close()
-
-            if row_s:
-                cargar_sesion_en_form(row_s)
-        except Exception:
-            pass
+        _abrir_sesion_por_id(open_sesion_id)
 
         # limpiar
         try:
@@ -1,22 +1,21 @@
 import os
+import time
 import flet as ft
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime, timedelta
 
 from .ui_config import BRAND_PRIMARY, TEXT_MAIN
 from .db import (
     DB_PATH,
-    contar_pacientes,
-    citas_por_mes_anio,
-    contar_citas_periodo,
-    tasa_asistencia,
-    top_5_pacientes_frecuentes,
+    snapshot_dashboard,
     listar_citas_con_paciente_rango,
-    listar_pacientes,
-    resumen_financiero_mensual,
+    resumen_financiero_anual,
     listar_paquetes_arriendo,
     resumen_paquetes_arriendo,
 )
-from .fechas import calcular_edad
+
+# Hilos para las consultas del dashboard (cada widget se pinta al terminar la suya)
+_POOL_HOME = ThreadPoolExecutor(max_workers=4, thread_name_prefix="home")
 
 MESES = ["Ene","Feb","Mar","Abr","May","Jun","Jul","Ago","Sep","Oct","Nov","Dic"]
 PERIODOS = ["Año actual", "Último mes", "Última semana"]
@@ -213,6 +212,18 @@ def _bar_chart_meses(valores, titulo: str):
     )
 
 
+def _card_cargando(titulo: str, altura: int):
+    """Tarjeta esqueleto mientras llega la consulta del widget."""
+    return _card_lista(
+        titulo,
+        ft.Container(
+            height=altura,
+            alignment=ft.alignment.center,
+            content=ft.ProgressRing(width=22, height=22, stroke_width=2),
+        ),
+    )
+
+
 def _card_lista(titulo: str, content: ft.Control):
     return ft.Container(
         bgcolor="#ffffff",
@@ -237,67 +248,42 @@ def _card_lista(titulo: str, content: ft.Control):
 # -----------------------------
 # Data builders for widgets
 # -----------------------------
-def _cumpleanios_hoy():
-    hoy = date.today()
-    pacientes = listar_pacientes()  # List[sqlite3.Row] o dicts
-    out = []
-
-    for p in pacientes:
-        fn = str(_row(p, "fecha_nacimiento", "")).strip()
-        if not fn:
-            continue
-
-        try:
-            nac = datetime.strptime(fn, "%d-%m-%Y").date()
-        except Exception:
-            continue
-
-        if nac.day == hoy.day and nac.month == hoy.month:
-            nombre = str(_row(p, "nombre_completo", "")).strip()
-            edad = calcular_edad(fn)
-            out.append({"nombre": nombre, "edad": edad})
-
-    return out
-
-
-def _utilidad_por_mes_anio(anio: int):
+def _utilidad_por_mes_anio(anio: int, resumenes=None):
+    try:
+        if resumenes is None:
+            resumenes = resumen_financiero_anual(anio)
+    except Exception:
+        return [0.0] * 12
     vals = []
     for mes in range(1, 13):
-        try:
-            data = resumen_financiero_mensual(anio, mes)
-            utilidad = (data.get("utilidad", {}) or {})
-            vals.append(float(utilidad.get("neta_cobrada", 0) or 0))
-        except Exception:
-            vals.append(0.0)
+        utilidad = ((resumenes.get(mes) or {}).get("utilidad", {}) or {})
+        vals.append(float(utilidad.get("neta_cobrada", 0) or 0))
     return vals
 
 
-def _utilidad_periodo(periodo: str):
+def _utilidad_periodo(periodo: str, resumenes=None):
     hoy = date.today()
     anio = hoy.year
     mes_actual = hoy.month
 
+    if resumenes is None:
+        resumenes = resumen_financiero_anual(anio)
+    por_mes = _utilidad_por_mes_anio(anio, resumenes)
+
     if periodo == "Última semana":
-        data = resumen_financiero_mensual(anio, mes_actual)
-        utilidad = (data.get("utilidad", {}) or {})
-        return float(utilidad.get("neta_cobrada", 0) or 0), "Mensual (mes actual)"
+        return por_mes[mes_actual - 1], "Mensual (mes actual)"
 
     if periodo == "Último mes":
-        data = resumen_financiero_mensual(anio, mes_actual)
-        utilidad = (data.get("utilidad", {}) or {})
-        return float(utilidad.get("neta_cobrada", 0) or 0), "Mes actual"
+        return por_mes[mes_actual - 1], "Mes actual"
 
-    total = 0.0
-    for m in range(1, mes_actual + 1):
-        data = resumen_financiero_mensual(anio, m)
-        utilidad = (data.get("utilidad", {}) or {})
-        total += float(utilidad.get("neta_cobrada", 0) or 0)
+    total = sum(por_mes[:mes_actual])
 
     return total, f"Ene–{MESES[mes_actual-1]} {anio}"
 
 
-def _widget_paquetes():
-    info = resumen_paquetes_arriendo(solo_activos=True) or {}
+def _widget_paquetes(info=None):
+    if info is None:
+        info = resumen_paquetes_arriendo(solo_activos=True) or {}
 
     total = int(info.get("total_citas", 0) or 0)
     usadas = int(info.get("citas_usadas", 0) or 0)
@@ -511,75 +497,91 @@ def build_home_view(page: ft.Page):
         #   RENDER FUNCTION
         #######################################################
 
-    def _render():
-        periodo = dd_periodo.value or "Año actual"
-        subt_periodo = _periodo_subtitulo(periodo)
-
-        hoy = date.today()
-        anio = hoy.year
+    def _kpi_texto():
+        return ft.Text("…", size=22, weight=ft.FontWeight.BOLD, color=TEXT_MAIN)
 
-        # ---------------- KPIs ----------------
-        total_pacientes = contar_pacientes()
-        total_citas = contar_citas_periodo(periodo)
-        utilidad_val, utilidad_sub = _utilidad_periodo(periodo)
+    # El esqueleto se pinta de una vez; cada valor/tarjeta se llena cuando su
+    # consulta termina en el pool de hilos del home.
+    kpi_pacientes = _kpi_texto()
+    kpi_citas = _kpi_texto()
+    kpi_utilidad = _kpi_texto()
+    kpi_asistencia = _kpi_texto()
 
-        ta = tasa_asistencia(periodo)
-        tasa_pct = int(ta.get("tasa_pct", 0) or 0)
+    chart_citas_holder = ft.Container(col={"sm": 12, "lg": 6}, content=_card_cargando("Citas por mes", 240))
+    chart_utilidad_holder = ft.Container(col={"sm": 12, "lg": 6}, content=_card_cargando("Utilidad neta por mes", 240))
 
-        kpi_pacientes = ft.Text(_fmt_int(total_pacientes), size=22, weight=ft.FontWeight.BOLD, color=TEXT_MAIN)
-        kpi_citas = ft.Text(_fmt_int(total_citas), size=22, weight=ft.FontWeight.BOLD, color=TEXT_MAIN)
-        kpi_utilidad = ft.Text(_fmt_money(utilidad_val), size=22, weight=ft.FontWeight.BOLD, color=TEXT_MAIN)
-        kpi_asistencia = ft.Text(f"{tasa_pct}%", size=22, weight=ft.FontWeight.BOLD, color=TEXT_MAIN)
+    prox_holder = ft.Container(col={"sm": 12, "lg": 6}, content=_card_cargando("Próximas citas (7 días)", ALTURA_PROX))
+    top_holder = ft.Container(col={"sm": 12, "md": 6}, content=_card_cargando("Top 5 pacientes frecuentes", ALTURA_WIDGET))
+    cumple_holder = ft.Container(col={"sm": 12, "md": 6}, content=_card_cargando("Cumpleaños de hoy", ALTURA_WIDGET))
+    paquetes_holder = ft.Container(content=_card_cargando("Paquetes de consultorio", 85))
 
-        kpis_row.controls = [
-            ft.Container(
-                col={"sm": 12, "md": 6, "lg": 3},
-                content=_kpi_finanzas_style("Pacientes registrados", kpi_pacientes, icono=ft.Icons.PEOPLE),
-            ),
-            ft.Container(
-                col={"sm": 12, "md": 6, "lg": 3},
-                content=_kpi_finanzas_style("Citas en el período", kpi_citas, icono=ft.Icons.EVENT_AVAILABLE),
+    kpis_row.controls = [
+        ft.Container(
+            col={"sm": 12, "md": 6, "lg": 3},
+            content=_kpi_finanzas_style("Pacientes registrados", kpi_pacientes, icono=ft.Icons.PEOPLE),
+        ),
+        ft.Container(
+            col={"sm": 12, "md": 6, "lg": 3},
+            content=_kpi_finanzas_style("Citas en el período", kpi_citas, icono=ft.Icons.EVENT_AVAILABLE),
+        ),
+        ft.Container(
+            col={"sm": 12, "md": 6, "lg": 3},
+            content=_kpi_finanzas_style(
+                "Utilidad neta",
+                kpi_utilidad,
+                icono=ft.Icons.SAVINGS,
+                icon_color=ft.Colors.GREEN_700,
+                icon_bg=ft.Colors.GREEN_50,
             ),
-            ft.Container(
-                col={"sm": 12, "md": 6, "lg": 3},
-                content=_kpi_finanzas_style(
-                    "Utilidad neta",
-                    kpi_utilidad,
-                    icono=ft.Icons.SAVINGS,
-                    icon_color=ft.Colors.GREEN_700,
-                    icon_bg=ft.Colors.GREEN_50,
-                ),
+        ),
+        ft.Container(
+            col={"sm": 12, "md": 6, "lg": 3},
+            content=_kpi_finanzas_style(
+                "Tasa de asistencia",
+                kpi_asistencia,
+                icono=ft.Icons.INSIGHTS,
+                icon_color=ft.Colors.BLUE_700,
+                icon_bg=ft.Colors.BLUE_50,
             ),
+        ),
+    ]
+
+    charts_row.controls = [chart_citas_holder, chart_utilidad_holder]
+
+    # --- LAYOUT alineado con los charts (2 columnas lg=6) ---
+    widgets_section_holder.content = ft.ResponsiveRow(
+        spacing=12,
+        run_spacing=12,
+        controls=[
+            # Columna izquierda (igual ancho que chart "Citas por mes")
+            prox_holder,
+
+            # Columna derecha (igual ancho que chart "Utilidad neta por mes")
             ft.Container(
-                col={"sm": 12, "md": 6, "lg": 3},
-                content=_kpi_finanzas_style(
-                    "Tasa de asistencia",
-                    kpi_asistencia,
-                    icono=ft.Icons.INSIGHTS,
-                    icon_color=ft.Colors.BLUE_700,
-                    icon_bg=ft.Colors.BLUE_50,
+                col={"sm": 12, "lg": 6},
+                content=ft.Column(
+                    spacing=12,
+                    controls=[
+                        # Top5 y Cumpleños en la misma fila cuando hay ancho,
+                        # y se apilan cuando la pantalla es pequeña.
+                        ft.ResponsiveRow(
+                            spacing=12,
+                            run_spacing=12,
+                            controls=[top_holder, cumple_holder],
+                        ),
+                        # Paquetes abajo ocupando todo el ancho de la columna derecha
+                        paquetes_holder,
+                    ],
                 ),
             ),
-        ]
-
-        # ---------------- Charts ----------------
-        citas_mes = citas_por_mes_anio(anio)
-        utilidad_mes = _utilidad_por_mes_anio(anio)
-
-        charts_row.controls = [
-            ft.Container(col={"sm": 12, "lg": 6}, content=_bar_chart_meses(citas_mes, "Citas por mes")),
-            ft.Container(col={"sm": 12, "lg": 6}, content=_bar_chart_meses([int(x) for x in utilidad_mes], "Utilidad neta por mes")),
-        ]
+        ],
+    )
 
-        # ---------------- Widgets ----------------
-        # Próximas citas (7 días): fijo + scroll + máximo 7
-        fi = hoy.strftime("%Y-%m-%d 00:00")
-        ff = (hoy + timedelta(days=7)).strftime("%Y-%m-%d 23:59")
-        try:
-            prox = listar_citas_con_paciente_rango(fi, ff) or []
-        except Exception:
-            prox = []
+    # -------------------------
+    # Pintado de cada widget
+    # -------------------------
 
+    def _pintar_proximas(prox):
         prox_list = ft.ListView(
             spacing=10,
             height=ALTURA_PROX,
@@ -642,9 +644,11 @@ def build_home_view(page: ft.Page):
                     )
                 )
 
-        # Top 5 frecuentes (fijo + scroll)
-        top5 = top_5_pacientes_frecuentes(periodo) or []
-        top_list = ft.ListView(spacing=8, height=140, auto_scroll=False)
+        prox_holder.content = _card_lista("Próximas citas (7 días)", prox_list)
+        return [prox_holder]
+
+    def _pintar_top5(top5):
+        top_list = ft.ListView(spacing=8, height=ALTURA_WIDGET, auto_scroll=False)
         if not top5:
             top_list.controls.append(ft.Text("Aún no hay datos suficientes en este período.", color="#666"))
         else:
@@ -664,10 +668,11 @@ def build_home_view(page: ft.Page):
                         alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
                     )
                 )
+        top_holder.content = _card_lista("Top 5 pacientes frecuentes", top_list)
+        return [top_holder]
 
-        # Cumpleaños (fijo + scroll)
-        cumple = _cumpleanios_hoy()
-        cumple_list = ft.ListView(spacing=8, height=140, auto_scroll=False)
+    def _pintar_cumpleanios(cumple):
+        cumple_list = ft.ListView(spacing=8, height=ALTURA_WIDGET, auto_scroll=False)
         if not cumple:
             cumple_list.controls.append(
                 ft.Container(
@@ -687,7 +692,7 @@ def build_home_view(page: ft.Page):
                         [
                             ft.Icon(ft.Icons.CAKE, color=ft.Colors.PINK_400),
                             ft.Text(
-                                c["nombre"],
+                                str(c.get("nombre_completo") or "").strip(),
                                 expand=True,
                                 no_wrap=True,
                                 overflow=ft.TextOverflow.ELLIPSIS,
@@ -697,54 +702,163 @@ def build_home_view(page: ft.Page):
                         alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
                     )
                 )
+        cumple_holder.content = _card_lista("Cumpleaños de hoy", cumple_list)
+        return [cumple_holder]
+
+    def _pintar_utilidad(datos):
+        periodo, resumenes = datos
+        utilidad_val, _ = _utilidad_periodo(periodo, resumenes)
+        kpi_utilidad.value = _fmt_money(utilidad_val)
+        utilidad_mes = _utilidad_por_mes_anio(date.today().year, resumenes)
+        chart_utilidad_holder.content = _bar_chart_meses([int(x) for x in utilidad_mes], "Utilidad neta por mes")
+        return [kpi_utilidad, chart_utilidad_holder]
+
+    titulos_tarjetas = {
+        id(chart_citas_holder): "Citas por mes",
+        id(chart_utilidad_holder): "Utilidad neta por mes",
+        id(prox_holder): "Próximas citas (7 días)",
+        id(top_holder): "Top 5 pacientes frecuentes",
+        id(cumple_holder): "Cumpleaños de hoy",
+        id(paquetes_holder): "Paquetes de consultorio",
+    }
+
+    def _pintar_error(controles):
+        """Deja el widget con un aviso en vez del indicador de carga."""
+        for c in controles:
+            if isinstance(c, ft.Text):
+                c.value = "—"
+            else:
+                c.content = _card_lista(
+                    titulos_tarjetas.get(id(c), ""),
+                    ft.Text("No se pudo cargar la información.", size=12, color=ft.Colors.GREY_700),
+                )
+        return controles
 
-        # --- LAYOUT "BIEN": izquierda grande + derecha (Top5 y Cumple en fila) + Paquetes abajo ---
-        # --- LAYOUT alineado con los charts (2 columnas lg=6) ---
-        widgets_section = ft.ResponsiveRow(
-            spacing=12,
-            run_spacing=12,
-            controls=[
-                # Columna izquierda (igual ancho que chart "Citas por mes")
-                ft.Container(
-                    col={"sm": 12, "lg": 6},
-                    content=_card_lista("Próximas citas (7 días)", prox_list),
-                ),
+    # -------------------------
+    # Carga asíncrona por widget
+    # -------------------------
 
-                # Columna derecha (igual ancho que chart "Utilidad neta por mes")
-                ft.Container(
-                    col={"sm": 12, "lg": 6},
-                    content=ft.Column(
-                        spacing=12,
-                        controls=[
-                            # Top5 y Cumpleños en la misma fila cuando hay ancho,
-                            # y se apilan cuando la pantalla es pequeña.
-                            ft.ResponsiveRow(
-                                spacing=12,
-                                run_spacing=12,
-                                controls=[
-                                    ft.Container(
-                                        col={"sm": 12, "md": 6},
-                                        content=_card_lista("Top 5 pacientes frecuentes", top_list),
-                                    ),
-                                    ft.Container(
-                                        col={"sm": 12, "md": 6},
-                                        content=_card_lista("Cumpleaños de hoy", cumple_list),
-                                    ),
-                                ],
-                            ),
-                            # Paquetes abajo ocupando todo el ancho de la columna derecha
-                            _widget_paquetes(),
-                        ],
-                    ),
-                ),
-            ],
+    # Una generación por grupo de widgets: cambiar el período solo descarta
+    # resultados del grupo "periodo"; los "fijos" de la carga inicial siguen sirviendo.
+    carga = {"periodo": 0, "fijos": 0}
+
+    def _actualizar_controles(controles):
+        montados = [c for c in controles if c.page is not None]
+        if montados:
+            page.update(*montados)
+
+    def _cargar_widget(nombre, consultar, partes):
+        """
+        Corre `consultar` en el pool y pinta cada parte (grupo, generacion,
+        pintar, controles) cuyo grupo no se haya recargado mientras tanto.
+        """
+        def tarea():
+            t0 = time.perf_counter()
+            try:
+                datos = consultar()
+                error = None
+            except Exception as ex:
+                datos = None
+                error = ex
+            ms = (time.perf_counter() - t0) * 1000.0
+
+            if error is not None:
+                print(f"⚠️ Home: error cargando '{nombre}' ({ms:.0f} ms):", error)
+            else:
+                print(f"[home] {nombre}: {ms:.0f} ms")
+
+            cambiados = []
+            for grupo, generacion, pintar, controles in partes:
+                # Si el usuario cambió el período mientras tanto, esa parte ya no sirve
+                if generacion != carga[grupo]:
+                    continue
+                try:
+                    if error is None:
+                        cambiados += pintar(datos)
+                    else:
+                        cambiados += _pintar_error(controles)
+                except Exception as ex:
+                    print(f"⚠️ Home: error pintando '{nombre}' ({grupo}):", ex)
+            try:
+                _actualizar_controles(cambiados)
+            except Exception as ex:
+                print(f"⚠️ Home: error pintando '{nombre}':", ex)
+
+        _POOL_HOME.submit(tarea)
+
+    def _render(solo_periodo: bool = False):
+        """
+        Lanza las consultas del home. Con solo_periodo=True (cambio del
+        dropdown) solo se recargan los widgets que dependen del período.
+        """
+        carga["periodo"] += 1
+        gen_periodo = carga["periodo"]
+        if not solo_periodo:
+            carga["fijos"] += 1
+        gen_fijos = carga["fijos"]
+
+        periodo = dd_periodo.value or "Año actual"
+        hoy = date.today()
+        anio = hoy.year
+
+        # Los widgets del período vuelven a "cargando" para no mostrar datos mezclados
+        for t in (kpi_citas, kpi_utilidad, kpi_asistencia):
+            t.value = "…"
+        top_holder.content = _card_cargando("Top 5 pacientes frecuentes", ALTURA_WIDGET)
+        if solo_periodo:
+            _actualizar_controles([kpi_citas, kpi_utilidad, kpi_asistencia, top_holder])
+
+        # Conteo, asistencia, top 5, serie mensual y cumpleaños: una sola consulta
+        # consolidada (con caché corto por período en db.snapshot_dashboard)
+        def _pintar_snapshot_periodo(snap):
+            kpi_citas.value = _fmt_int(snap.get("total_citas", 0))
+            ta = snap.get("asistencia", {}) or {}
+            kpi_asistencia.value = f"{int(ta.get('tasa_pct', 0) or 0)}%"
+            return [kpi_citas, kpi_asistencia] + _pintar_top5(snap.get("top5") or [])
+
+        def _pintar_snapshot_fijos(snap):
+            kpi_pacientes.value = _fmt_int(snap.get("total_pacientes", 0))
+            chart_citas_holder.content = _bar_chart_meses(snap.get("citas_por_mes") or [0] * 12, "Citas por mes")
+            return [kpi_pacientes, chart_citas_holder] + _pintar_cumpleanios(snap.get("cumpleanios") or [])
+
+        partes_snapshot = [("periodo", gen_periodo, _pintar_snapshot_periodo, [kpi_citas, kpi_asistencia, top_holder])]
+        if not solo_periodo:
+            partes_snapshot.append(
+                ("fijos", gen_fijos, _pintar_snapshot_fijos, [kpi_pacientes, chart_citas_holder, cumple_holder])
+            )
+        _cargar_widget("snapshot", lambda: snapshot_dashboard(periodo), partes_snapshot)
+        # Un solo resumen anual alimenta el KPI de utilidad y el gráfico por mes
+        _cargar_widget(
+            "utilidad",
+            lambda: (periodo, resumen_financiero_anual(anio)),
+            [("periodo", gen_periodo, _pintar_utilidad, [kpi_utilidad, chart_utilidad_holder])],
+        )
+
+        if solo_periodo:
+            return
+
+        # ---------------- Independientes del período ----------------
+        # Próximas citas (7 días): fijo + scroll + máximo 7
+        fi = hoy.strftime("%Y-%m-%d 00:00")
+        ff = (hoy + timedelta(days=7)).strftime("%Y-%m-%d 23:59")
+        _cargar_widget(
+            "proximas_citas",
+            lambda: listar_citas_con_paciente_rango(fi, ff) or [],
+            [("fijos", gen_fijos, _pintar_proximas, [prox_holder])],
         )
 
-        widgets_section_holder.content = widgets_section
-        page.update()
+        def _pintar_paquetes(info):
+            paquetes_holder.content = _widget_paquetes(info)
+            return [paquetes_holder]
+
+        _cargar_widget(
+            "paquetes",
+            lambda: resumen_paquetes_arriendo(solo_activos=True) or {},
+            [("fijos", gen_fijos, _pintar_paquetes, [paquetes_holder])],
+        )
 
     def _on_periodo_change(e):
-        _render()
+        _render(solo_periodo=True)
 
     dd_periodo.on_change = _on_periodo_change
 
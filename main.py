@@ -1,8 +1,8 @@
 # app/main.py
 import flet as ft
 from pathlib import Path
-from .db import init_db
-from .admin_view import build_admin_view
+from .db import init_db, iniciar_mantenimiento_periodico
+from .admin_view import aplicar_preferencias_diagnostico, build_admin_view
 from .agenda_view import build_agenda_view
 from .pacientes_view import build_pacientes_view
 from .facturas_view import build_facturas_view
@@ -52,6 +52,9 @@ def main(page: ft.Page):
 
     # Inicializar base de datos
     init_db()
+    aplicar_preferencias_diagnostico(page)
+    # PRAGMA optimize / vacuum incremental / checkpoint del WAL en segundo plano
+    iniciar_mantenimiento_periodico()
 
     # Contenedor donde iremos cargando la vista actual (pacientes / agenda)
     body = ft.Container(expand=True)
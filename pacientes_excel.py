@@ -12,6 +12,7 @@ from openpyxl.worksheet.worksheet import Worksheet
 from openpyxl.styles import Font, PatternFill
 from openpyxl.worksheet.datavalidation import DataValidation
 
+from .fechas import parse_fecha
 from .db import (
     crear_paciente, 
     actualizar_paciente, 
@@ -299,15 +300,13 @@ def exportar_pacientes_a_excel(path: str | Path) -> Path:
             if campo in ("telefono", "contacto_emergencia_telefono", "indicativo_pais"):
                 val = _solo_digitos(str(val))
 
-            # fecha como datetime real (si viene como DD-MM-YYYY)
+            # fecha como datetime real (en la BD es ISO; datos viejos pueden ser DD-MM-YYYY)
             if campo == "fecha_nacimiento":
-                s = ("" if val is None else str(val).strip()).replace("/", "-")
+                s = "" if val is None else str(val).strip()
                 if s:
-                    try:
-                        val = datetime.strptime(s, "%d-%m-%Y")
-                    except Exception:
-                        # si por alguna razón viene mal, lo dejamos como texto para que el import lo reporte
-                        val = s
+                    d = parse_fecha(s)
+                    # si por alguna razón viene mal, lo dejamos como texto para que el import lo reporte
+                    val = datetime(d.year, d.month, d.day) if d else s
 
             ws.cell(row=row, column=col_idx, value=val if val is not None else "")
 
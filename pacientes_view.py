@@ -22,9 +22,12 @@ from .utils import (
     map_tipo_documento,
     normalize_phone_for_db_colombia,
 )
+from .fechas import formatear_fecha, parse_fecha
 from .db import (
     crear_paciente,
-    listar_pacientes,
+    listar_pacientes_pagina,
+    contar_pacientes,
+    listar_eps_registradas,
     obtener_paciente,
     actualizar_paciente,
     eliminar_paciente,
@@ -38,6 +41,7 @@ from .db import (
     eliminar_antecedente_psicologico,
     obtener_configuracion_gmail
 )
+from .busqueda_pacientes import buscar_pacientes
 
 def get_google_forms_id() -> str:
     """
@@ -98,6 +102,10 @@ def hay_cambios(paciente_db, paciente_nuevo) -> bool:
     for campo in campos:
         valor_db = (paciente_db[campo] or "").strip() if campo in paciente_db.keys() else ""
         valor_nuevo = (paciente_nuevo.get(campo) or "").strip()
+        if campo == "fecha_nacimiento":
+            # En la BD es ISO y el formulario llega como DD-MM-YYYY
+            valor_db = formatear_fecha(valor_db)
+            valor_nuevo = formatear_fecha(valor_nuevo)
 
         if valor_db != valor_nuevo:
             return True  # hubo cambio real
@@ -119,8 +127,8 @@ def build_pacientes_view(page: ft.Page) -> ft.Control:
     # ESTADO GENERAL
     # ------------------------------------------------------------------
 
-    # Cache en memoria para filtrar sin ir siempre a la BD
-    pacientes_cache = []
+    # EPS ya registradas (autocompletar); se refresca en cargar_pacientes()
+    eps_cache: list[str] = []
 
     # Estado de edición de paciente
     modo_edicion = False
@@ -776,6 +784,8 @@ def build_pacientes_view(page: ft.Page) -> ft.Control:
             ft.DataColumn(ft.Text("Acciones")),
         ],
         rows=[],
+        sort_column_index=2,
+        sort_ascending=True,
     )
 
     buscador = ft.TextField(
@@ -783,6 +793,30 @@ def build_pacientes_view(page: ft.Page) -> ft.Control:
         width=400,
     )
 
+    # Paginación: por llave (keyset) en la BD; si hay búsqueda, sobre los resultados en memoria
+    COLUMNAS_ORDENABLES = {0: "documento", 1: "tipo_documento", 2: "nombre_completo"}
+    paginacion = {
+        "tam": 50,
+        "orden": "nombre_completo",
+        "desc": False,
+        "cursores": [None],  # cursor de inicio de cada página visitada (modo BD)
+        "pagina": 0,  # modo búsqueda
+        "filtrados": None,  # resultados de la búsqueda o None
+        "ultima": None,  # última fila mostrada (para el cursor siguiente)
+        "total": 0,
+    }
+
+    dd_tam_pagina = ft.Dropdown(
+        label="Por página",
+        width=110,
+        dense=True,
+        value="50",
+        options=[ft.dropdown.Option(str(n)) for n in (25, 50, 100)],
+    )
+    btn_pagina_anterior = ft.IconButton(icon=ft.Icons.CHEVRON_LEFT, tooltip="Página anterior")
+    btn_pagina_siguiente = ft.IconButton(icon=ft.Icons.CHEVRON_RIGHT, tooltip="Página siguiente")
+    lbl_paginacion = ft.Text("", size=12, color=ft.Colors.GREY_700)
+
     # ------------------------------------------------------------------
     # FUNCIONES AUXILIARES GENERALES
     # ------------------------------------------------------------------
@@ -1086,7 +1120,7 @@ def build_pacientes_view(page: ft.Page) -> ft.Control:
     def actualizar_sugerencias_eps(e=None):
         """
         Autocompletado básico de EPS:
-        - Usa los valores existentes en pacientes_cache
+        - Usa los valores existentes en la BD (eps_cache)
         - Sugiere coincidencias que empiezan igual al texto digitado
         """
         texto = (eps.value or "").strip().lower()
@@ -1098,13 +1132,7 @@ def build_pacientes_view(page: ft.Page) -> ft.Control:
             return
 
         # Conjunto de EPS existentes no vacías
-        eps_existentes = sorted(
-            {
-                (p.get("eps") or "").strip()
-                for p in pacientes_cache
-                if (p.get("eps") or "").strip()
-            }
-        )
+        eps_existentes = eps_cache
 
         coincidencias = [
             val
@@ -1132,78 +1160,162 @@ def build_pacientes_view(page: ft.Page) -> ft.Control:
     # ------------------------------------------------------------------
 
     def cargar_pacientes():
-        """Carga todos los pacientes desde la BD y refresca la tabla."""
-        nonlocal pacientes_cache
-        pacientes = listar_pacientes()
-        pacientes_cache = [dict(p) for p in pacientes]
+        """Vuelve a la primera página de la tabla y refresca total y EPS."""
+        eps_cache[:] = listar_eps_registradas()
         aplicar_filtro_tabla()
         # Actualizar posibles sugerencias para EPS
         actualizar_sugerencias_eps()
 
     def aplicar_filtro_tabla(e=None):
-        """Aplica filtro de búsqueda sobre el cache y rellena la tabla."""
+        """Aplica el filtro de búsqueda y muestra la primera página."""
         texto = buscador.value.lower().strip() if buscador.value else ""
-        tabla_pacientes.rows.clear()
 
-        for p in pacientes_cache:
-            if texto:
-                if texto not in p["documento"].lower() and texto not in p[
-                    "nombre_completo"
-                ].lower():
-                    continue
-
-            # Documento como "link" para editar (con protección de cambios)
-            doc_cell = ft.DataCell(
-                ft.TextButton(
-                    text=p["documento"],
-                    on_click=lambda ev, doc=p["documento"]: intentar_cargar_paciente(
-                        doc
-                    ),
-                )
+        if texto:
+            orden = paginacion["orden"]
+            filtrados = buscar_pacientes(texto, limite=None)
+            filtrados.sort(
+                key=lambda p: (str(p.get(orden) or "").lower(), str(p.get("documento") or "")),
+                reverse=paginacion["desc"],
             )
+            paginacion["filtrados"] = filtrados
+        else:
+            paginacion["filtrados"] = None
+            paginacion["total"] = contar_pacientes()
+
+        paginacion["pagina"] = 0
+        paginacion["cursores"] = [None]
+        mostrar_pagina_pacientes()
+
+    def mostrar_pagina_pacientes():
+        """Crea controles solo para las filas de la página visible."""
+        tam = paginacion["tam"]
+        filtrados = paginacion["filtrados"]
+
+        if filtrados is not None:
+            inicio = paginacion["pagina"] * tam
+            filas = filtrados[inicio:inicio + tam]
+            total = len(filtrados)
+            hay_siguiente = inicio + tam < total
+        else:
+            inicio = (len(paginacion["cursores"]) - 1) * tam
+            # Se pide una fila extra para saber si hay página siguiente
+            filas = [
+                dict(r)
+                for r in listar_pacientes_pagina(
+                    tam + 1,
+                    orden=paginacion["orden"],
+                    descendente=paginacion["desc"],
+                    despues_de=paginacion["cursores"][-1],
+                )
+            ]
+            hay_siguiente = len(filas) > tam
+            filas = filas[:tam]
+            total = paginacion["total"]
 
-            acciones = ft.Row(
-                [
-                    ft.IconButton(
-                        icon=ft.Icons.EDIT,
-                        tooltip="Editar paciente",
-                        on_click=lambda ev, doc=p["documento"]: intentar_cargar_paciente(
-                            doc
-                        ),  
-                    ),
-                    ft.IconButton(
-                        icon=ft.Icons.DELETE,
-                        tooltip="Eliminar",
-                        on_click=lambda ev, doc=p["documento"]: confirmar_eliminar_paciente(
-                            doc
-                        ),
-                    ),
-                    ft.FilledButton(
-                        text="Historia clínica",
-                        icon=ft.Icons.DESCRIPTION,  # icono de documento / historia
-                        on_click=lambda ev, doc=p["documento"]: abrir_historia(doc),
-                    ),
-                ],
-                spacing=8,
-            )
+        paginacion["ultima"] = filas[-1] if filas else None
 
-            tabla_pacientes.rows.append(
-                ft.DataRow(
-                    cells=[
-                        doc_cell,
-                        ft.DataCell(ft.Text(p["tipo_documento"])),
-                        ft.DataCell(ft.Text(p["nombre_completo"])),
-                        ft.DataCell(ft.Text(p["fecha_nacimiento"])),
-                        ft.DataCell(ft.Text(calcular_edad_desde_fecha(p["fecha_nacimiento"]))),
-                        ft.DataCell(ft.Text(p["sexo"])),
-                        ft.DataCell(ft.Text((f"+{(p.get('indicativo_pais') or '57')} {(p.get('telefono') or '')}".strip() if (p.get('telefono') or '').strip() else ""))),
-                        ft.DataCell(acciones),
-                    ]
-                )
-            )
+        tabla_pacientes.rows.clear()
+        for p in filas:
+            tabla_pacientes.rows.append(construir_fila_paciente(p))
+
+        if filas:
+            lbl_paginacion.value = f"{inicio + 1}–{inicio + len(filas)} de {total}"
+        else:
+            lbl_paginacion.value = f"0 de {total}"
+        btn_pagina_anterior.disabled = inicio == 0
+        btn_pagina_siguiente.disabled = not hay_siguiente
 
         page.update()
 
+    def pagina_siguiente(e=None):
+        if btn_pagina_siguiente.disabled or paginacion["ultima"] is None:
+            return
+        if paginacion["filtrados"] is not None:
+            paginacion["pagina"] += 1
+        else:
+            ultima = paginacion["ultima"]
+            paginacion["cursores"].append((ultima[paginacion["orden"]], ultima["documento"]))
+        mostrar_pagina_pacientes()
+
+    def pagina_anterior(e=None):
+        if paginacion["filtrados"] is not None:
+            paginacion["pagina"] = max(0, paginacion["pagina"] - 1)
+        elif len(paginacion["cursores"]) > 1:
+            paginacion["cursores"].pop()
+        mostrar_pagina_pacientes()
+
+    def cambiar_tam_pagina(e=None):
+        try:
+            paginacion["tam"] = int(dd_tam_pagina.value or 50)
+        except ValueError:
+            paginacion["tam"] = 50
+        aplicar_filtro_tabla()
+
+    def ordenar_tabla(e: ft.DataColumnSortEvent):
+        orden = COLUMNAS_ORDENABLES.get(e.column_index)
+        if not orden:
+            return
+        paginacion["orden"] = orden
+        paginacion["desc"] = not e.ascending
+        tabla_pacientes.sort_column_index = e.column_index
+        tabla_pacientes.sort_ascending = e.ascending
+        aplicar_filtro_tabla()
+
+    for idx in COLUMNAS_ORDENABLES:
+        tabla_pacientes.columns[idx].on_sort = ordenar_tabla
+    dd_tam_pagina.on_change = cambiar_tam_pagina
+    btn_pagina_anterior.on_click = pagina_anterior
+    btn_pagina_siguiente.on_click = pagina_siguiente
+
+    def construir_fila_paciente(p: dict) -> ft.DataRow:
+        # Documento como "link" para editar (con protección de cambios)
+        doc_cell = ft.DataCell(
+            ft.TextButton(
+                text=p["documento"],
+                on_click=lambda ev, doc=p["documento"]: intentar_cargar_paciente(
+                    doc
+                ),
+            )
+        )
+
+        acciones = ft.Row(
+            [
+                ft.IconButton(
+                    icon=ft.Icons.EDIT,
+                    tooltip="Editar paciente",
+                    on_click=lambda ev, doc=p["documento"]: intentar_cargar_paciente(
+                        doc
+                    ),  
+                ),
+                ft.IconButton(
+                    icon=ft.Icons.DELETE,
+                    tooltip="Eliminar",
+                    on_click=lambda ev, doc=p["documento"]: confirmar_eliminar_paciente(
+                        doc
+                    ),
+                ),
+                ft.FilledButton(
+                    text="Historia clínica",
+                    icon=ft.Icons.DESCRIPTION,  # icono de documento / historia
+                    on_click=lambda ev, doc=p["documento"]: abrir_historia(doc),
+                ),
+            ],
+            spacing=8,
+        )
+
+        return ft.DataRow(
+            cells=[
+                doc_cell,
+                ft.DataCell(ft.Text(p["tipo_documento"])),
+                ft.DataCell(ft.Text(p["nombre_completo"])),
+                ft.DataCell(ft.Text(formatear_fecha(p["fecha_nacimiento"]))),
+                ft.DataCell(ft.Text(calcular_edad_desde_fecha(p["fecha_nacimiento"]))),
+                ft.DataCell(ft.Text(p["sexo"])),
+                ft.DataCell(ft.Text((f"+{(p.get('indicativo_pais') or '57')} {(p.get('telefono') or '')}".strip() if (p.get('telefono') or '').strip() else ""))),
+                ft.DataCell(acciones),
+            ]
+        )
+
     # ------------------------------------------------------------------
     # FUNCIONES: CARGAR PACIENTE Y GUARDAR / ELIMINAR
     # ------------------------------------------------------------------
@@ -1228,7 +1340,7 @@ def build_pacientes_view(page: ft.Page) -> ft.Control:
         documento.value = p["documento"]
         tipo_documento.value = p["tipo_documento"]
         nombre_completo.value = p["nombre_completo"]
-        fecha_nacimiento.value = p["fecha_nacimiento"]
+        fecha_nacimiento.value = formatear_fecha(p["fecha_nacimiento"])
         edad.value = calcular_edad_desde_fecha(p["fecha_nacimiento"])
         sexo.value = p.get("sexo") or "sexo_default"
         estado_civil.value = p.get("estado_civil") or "estado_default"
@@ -1634,15 +1746,11 @@ def build_pacientes_view(page: ft.Page) -> ft.Control:
 
     def calcular_edad_desde_fecha(fecha_str: str) -> str:
         """
-        Recibe fecha en formato DD-MM-YYYY y devuelve edad (años) como string.
-        Si la fecha es inválida, devuelve "".
+        Recibe fecha (DD-MM-YYYY del formulario o ISO de la BD) y devuelve
+        edad (años) como string. Si la fecha es inválida, devuelve "".
         """
-        if not fecha_str:
-            return ""
-
-        try:
-            fecha = datetime.strptime(fecha_str, "%d-%m-%Y").date()
-        except ValueError:
+        fecha = parse_fecha(fecha_str)
+        if fecha is None:
             return ""
 
         hoy = datetime.today().date()
@@ -1913,6 +2021,16 @@ def build_pacientes_view(page: ft.Page) -> ft.Control:
                             scroll=ft.ScrollMode.AUTO,
                         ),
                     ),
+                    ft.Row(
+                        [
+                            lbl_paginacion,
+                            btn_pagina_anterior,
+                            btn_pagina_siguiente,
+                            dd_tam_pagina,
+                        ],
+                        alignment=ft.MainAxisAlignment.END,
+                        vertical_alignment=ft.CrossAxisAlignment.CENTER,
+                    ),
                 ],
                 spacing=10,
             ),
@@ -63,7 +63,7 @@ if __name__ == "__main__":
 #DEBUG EXIT
 
 # OJO: importa desde tu db.py real
-from .db import get_connection, init_db, DATA_DIR, DB_PATH
+from .db import get_connection, init_db, guardar_html_sesion, obtener_cuerpo_sesion, DATA_DIR, DB_PATH
 
 
 def _db_conn():
@@ -216,24 +216,18 @@ class RichEditorServer:
                     if not sesion_id:
                         return self._send_json(400, {"ok": False, "error": "missing sesion_id"})
 
-                    conn = get_connection()
                     try:
-                        cur = conn.cursor()
-                        cur.execute(
-                            "SELECT contenido_html, contenido FROM sesiones_clinicas WHERE id = ? LIMIT 1;",
-                            (sesion_id,),
-                        )
-                        row = cur.fetchone()
-                    finally:
-                        conn.close()
+                        cuerpo = obtener_cuerpo_sesion(int(sesion_id))
+                    except ValueError:
+                        return self._send_json(400, {"ok": False, "error": "invalid sesion_id"})
 
-                    if not row:
+                    if cuerpo is None:
                         return self._send_json(404, {"ok": False, "error": "not found"})
 
-                    # sqlite3.Row soporta index y keys
-                    html = row[0] or ""
-                    md = row[1] or ""
-                    return self._send_json(200, {"ok": True, "html": html, "markdown": md})
+                    return self._send_json(
+                        200,
+                        {"ok": True, "html": cuerpo["contenido_html"], "markdown": cuerpo["contenido"]},
+                    )
                 
                 # chequeo estado corrector ortográfico
                 if path == "/api/spellcheck/status":
@@ -281,19 +275,12 @@ class RichEditorServer:
 
                     html = (data.get("html") or "").strip()
 
-                    conn = get_connection()
                     try:
-                        cur = conn.cursor()
-                        cur.execute(
-                            "UPDATE sesiones_clinicas SET contenido_html = ? WHERE id = ?;",
-                            (html, sesion_id),
-                        )
-                        conn.commit()
-                        updated = cur.rowcount
-                    finally:
-                        conn.close()
+                        updated = guardar_html_sesion(int(sesion_id), html)
+                    except ValueError:
+                        return self._send_json(400, {"ok": False, "error": "invalid sesion_id"})
 
-                    if updated <= 0:
+                    if not updated:
                         return self._send_json(404, {"ok": False, "error": "not found"})
 
                     return self._send_json(200, {"ok": True})
@@ -1,4 +1,5 @@
 from datetime import datetime
+from html import unescape
 import re
 
 def form_date_to_ddmmyyyy(s: str) -> str:
@@ -81,3 +82,34 @@ def consent_ok(ans: dict) -> bool:
     # acepta "sí", "si" al inicio
     return val.startswith("sí") or val.startswith("si")
 
+
+def html_to_plain_text(s: str) -> str:
+    s = s or ""
+
+    # saltos típicos de Quill
+    s = s.replace("<br>", "\n").replace("<br/>", "\n").replace("<br />", "\n")
+
+    # párrafos
+    s = re.sub(r"</p\s*>", "\n\n", s, flags=re.I)
+    s = re.sub(r"<p[^>]*>", "", s, flags=re.I)
+
+    # listas
+    s = re.sub(r"<li[^>]*>", "• ", s, flags=re.I)
+    s = re.sub(r"</li\s*>", "\n", s, flags=re.I)
+    s = re.sub(r"</?(ul|ol)[^>]*>", "", s, flags=re.I)
+
+    # headings
+    s = re.sub(r"</h[1-6]\s*>", "\n\n", s, flags=re.I)
+    s = re.sub(r"<h[1-6][^>]*>", "", s, flags=re.I)
+
+    # quita el resto de tags
+    s = re.sub(r"<[^>]+>", "", s)
+
+    # entidades HTML
+    s = unescape(s)
+
+    # normaliza espacios/saltos
+    s = s.replace("\r\n", "\n").replace("\r", "\n")
+    s = re.sub(r"\n{3,}", "\n\n", s).strip()
+
+    return s